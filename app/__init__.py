@@ -1,15 +1,16 @@
-
 import logging
 import os
-from datetime import datetime
 
 from dotenv import load_dotenv
 from flask import Flask
 from flask_cors import CORS
 from flask_executor import Executor
-from flask_sqlalchemy import SQLAlchemy
 
-db = SQLAlchemy()
+from app.logging_setup import configure_logging
+from model_base import add_missing_columns, db
+
+logger = logging.getLogger(__name__)
+
 executor = Executor()
 
 
@@ -20,81 +21,92 @@ def create_app():
         static_url_path='/',
     )
 
-    # Setup logging
-    log_dir = os.path.join(
-        os.getcwd(),
-        'logs',
-    )
-    os.makedirs(log_dir, exist_ok=True)
-    log_filename = os.path.join(
-        log_dir,
-        f'face_engine_{datetime.now().strftime("%Y%m%d")}.log',
-    )
-    logging.basicConfig(
-        filename=log_filename,
-        level=logging.DEBUG,
-        format='%(asctime)s %(levelname)s: %(message)s',
-    )
-
-    logging.debug("Starting the create_app function")
-
     exe_dir = os.path.dirname(os.path.abspath(__file__))
     env_path = os.path.join(exe_dir, '.env')
-    if os.path.exists(env_path):
-        logging.info(f"Loading .env file from: {env_path}")
+    env_found = os.path.exists(env_path)
+    if env_found:
         load_dotenv(env_path)
-    else:
-        logging.error(f".env file not found at: {env_path}")
-
-    for key, value in os.environ.items():
-        logging.debug(f'{key}: {value}')
 
+    settings = os.getenv('APP_SETTINGS', 'config.DevelopmentConfig')
+    settings_error = None
     try:
-        app.config.from_object(os.getenv('APP_SETTINGS', 'config.DevelopmentConfig'))
-        logging.debug(f"App settings loaded: {os.getenv('APP_SETTINGS', 'config.DevelopmentConfig')}")
+        app.config.from_object(settings)
     except Exception as e:
-        logging.error(f"Error loading app settings: {e}")
+        settings_error = e
+
+    # Logging is configured from the settings, so it starts after them.
+    configure_logging(app.config)
+    logger.debug("Starting the create_app function")
+    if env_found:
+        logger.info("Loaded .env file from: %s", env_path)
+    else:
+        logger.error(".env file not found at: %s", env_path)
+    if settings_error is None:
+        logger.debug("App settings loaded: %s", settings)
+    else:
+        logger.error("Error loading app settings: %s", settings_error)
 
     try:
         if not app.config['SQLALCHEMY_DATABASE_URI']:
-            logging.error("SQLALCHEMY_DATABASE_URI is not set.")
+            logger.error("SQLALCHEMY_DATABASE_URI is not set.")
             raise RuntimeError("Either 'SQLALCHEMY_DATABASE_URI' or 'SQLALCHEMY_BINDS' must be set.")
         db.init_app(app)
-        logging.debug("Database initialized successfully")
+        logger.debug("Database initialized successfully")
     except Exception as e:
-        logging.error(f"Error initializing database: {e}")
+        logger.error(f"Error initializing database: {e}")
 
     try:
         executor.init_app(app)
-        logging.debug("Executor initialized successfully")
+        logger.debug("Executor initialized successfully")
     except Exception as e:
-        logging.error(f"Error initializing executor: {e}")
+        logger.error(f"Error initializing executor: {e}")
 
     try:
         CORS(app)
-        logging.debug("CORS initialized successfully")
+        logger.debug("CORS initialized successfully")
     except Exception as e:
-        logging.error(f"Error initializing CORS: {e}")
+        logger.error(f"Error initializing CORS: {e}")
 
     # Create directories if they don't exist
     try:
         os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
         os.makedirs(app.config['CAPTURED_FACES_PATH'], exist_ok=True)
-        logging.debug("Upload directories created successfully")
+        logger.debug("Upload directories created successfully")
     except Exception as e:
-        logging.error(f"Error creating upload directories: {e}")
+        logger.error(f"Error creating upload directories: {e}")
     try:
         with app.app_context():
             from app.camera.routes import camera_bp
+            from app.camera.models import Camera
+            from app.face_recognition.commands import encodings_cli
+            from app.face_recognition.models import FaceEncoding, RecognitionLog
             from app.face_recognition.routes import face_recognition_bp
+            from app.metrics import init_metrics
+            from app.user.commands import users_cli
             from app.user.routes import user_bp
             app.register_blueprint(user_bp)
             app.register_blueprint(camera_bp)
             app.register_blueprint(face_recognition_bp)
+            init_metrics(app)
+            app.cli.add_command(encodings_cli)
+            app.cli.add_command(users_cli)
             db.create_all()
-            logging.debug("Blueprints registered and database tables created successfully")
+            add_missing_columns(Camera, FaceEncoding, RecognitionLog)
+            if app.config.get('USE_NX_WITNESS', False):
+                # Drain bookmarks left in the outbox by a previous run.
+                from app.face_recognition.bookmarks import get_bookmark_dispatcher
+                get_bookmark_dispatcher(app)
+            if app.config.get('INGEST_AUTOSTART', False):
+                from app.camera.ingestion import acquire_autostart_lock, get_ingestion_manager
+                if acquire_autostart_lock(app.config['INGEST_LOCK_FILE']):
+                    manager = get_ingestion_manager(app)
+                    for camera in Camera.get_streaming_cameras():
+                        manager.start(camera)
+                else:
+                    logger.info("Camera streams are autostarted by another process")
+            logger.debug("Blueprints registered and database tables created successfully")
     except Exception as e:
-        logging.error(f"Error during app context: {e}")
+        logger.error(f"Error during app context: {e}")
 
-    logging.info("App created successfully")
+    logger.info("App created successfully")
     return app
@@ -0,0 +1,355 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import cv2
+
+from app.camera.models import Camera
+from app.camera.motion import MotionGate, MotionSettings
+from app.camera.tracking import FaceTracker
+from app.face_recognition.detection import DetectionSettings
+from app.face_recognition.services import FaceRecognitionHandler
+from app.instrumentation import camera_scope
+from model_base import db
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Schemes a camera stream URL may have. OpenCV opens whatever it is given,
+# local files and capture devices included.
+STREAM_URL_SCHEMES = ('rtsp', 'rtsps', 'http', 'https')
+
+STARTING = 'starting'
+RUNNING = 'running'
+RECONNECTING = 'reconnecting'
+FINISHED = 'finished'
+STOPPED = 'stopped'
+
+
+def validate_stream_url(url: str, allow_files: bool = False) -> Optional[str]:
+    """
+    Return why a stream URL is refused, or None if it may be opened. Only
+    rtsp and http(s) URLs are accepted, and, with `allow_files`, paths of
+    local video files, for testing.
+    """
+    if urlsplit(url).scheme.lower() in STREAM_URL_SCHEMES:
+        return None
+    if allow_files and os.path.isfile(url):
+        return None
+    return "Stream URL must be an rtsp, http or https URL"
+
+
+class _RateMeter:
+    """
+    Events per second over a sliding window of `window` seconds.
+    """
+
+    def __init__(self, window: float = 5.0):
+        self.window = window
+        self._times = deque()
+
+    def tick(self, now: float):
+        self._times.append(now)
+        cutoff = now - self.window
+        while self._times and self._times[0] < cutoff:
+            self._times.popleft()
+
+    def rate(self, now: float) -> float:
+        cutoff = now - self.window
+        return sum(1 for t in list(self._times) if t >= cutoff) / self.window
+
+
+class CameraStream:
+    """
+    Continuous recognition on one camera stream.
+
+    A reader thread decodes frames as fast as the source delivers them and
+    keeps only the latest one; a frame that is replaced before the
+    recognizer took it counts as dropped. The recognizer thread samples the
+    latest frame at most `fps` times a second and recognizes it in the app
+    context, through the recognition engine, without an HTTP hop. With a
+    tracker, only new faces and faces due for re-verification are encoded,
+    and with motion gating frames that did not change are not detected.
+
+    Network streams are reopened after `reconnect_delay` seconds when they
+    fail. A local video file is read at its own frame rate, as a live
+    camera would deliver it, and the stream finishes at its end.
+    """
+
+    def __init__(self, app, camera_id: int, url: str, fps: float, reconnect_delay: float = 5.0,
+                 tracker: FaceTracker = None, motion: MotionSettings = None):
+        self.app = app
+        self.camera_id = camera_id
+        self.url = url
+        self.fps = fps
+        self.reconnect_delay = reconnect_delay
+        self.is_file = os.path.isfile(url)
+        self.state = STARTING
+        self.last_error = None
+        self.frames_read = 0
+        self.frames_processed = 0
+        self.frames_dropped = 0
+        self.faces_seen = 0
+        self.tracker = tracker
+        self.motion_gate = MotionGate(motion) if motion is not None and motion.enabled else None
+        self.started_at = time.time()
+        self._read_rate = _RateMeter()
+        self._process_rate = _RateMeter()
+        self._frame = None
+        self._frame_is_new = False
+        self._frame_ready = threading.Condition()
+        self._stopping = threading.Event()
+        self._reader = threading.Thread(target=self._read_loop, name=f'camera-{camera_id}-reader', daemon=True)
+        self._recognizer = threading.Thread(
+            target=self._recognize_loop, name=f'camera-{camera_id}-recognizer', daemon=True,
+        )
+
+    def start(self):
+        self._reader.start()
+        self._recognizer.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stopping.set()
+        with self._frame_ready:
+            self._frame_ready.notify_all()
+        self._reader.join(timeout)
+        self._recognizer.join(timeout)
+        if self.state != FINISHED:
+            self.state = STOPPED
+
+    @property
+    def alive(self) -> bool:
+        return self._reader.is_alive() or self._recognizer.is_alive()
+
+    def _open(self) -> Optional[cv2.VideoCapture]:
+        capture = cv2.VideoCapture(self.url)
+        if not capture.isOpened():
+            capture.release()
+            return None
+        # Ask the backend not to queue frames; only the latest one matters.
+        capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return capture
+
+    def _read_loop(self):
+        while not self._stopping.is_set():
+            capture = self._open()
+            if capture is None:
+                self.last_error = f"Cannot open stream {self.url}"
+                if self.is_file:
+                    break
+                self.state = RECONNECTING
+                self._stopping.wait(self.reconnect_delay)
+                continue
+
+            self.state = RUNNING
+            # Pace files at their native rate; network streams pace themselves.
+            frame_interval = 1 / (capture.get(cv2.CAP_PROP_FPS) or 25) if self.is_file else 0
+            next_frame_at = time.monotonic()
+            try:
+                while not self._stopping.is_set():
+                    ok, frame = capture.read()
+                    if not ok:
+                        break
+                    now = time.time()
+                    self.frames_read += 1
+                    self._read_rate.tick(now)
+                    with self._frame_ready:
+                        if self._frame_is_new:
+                            self.frames_dropped += 1
+                        self._frame = frame
+                        self._frame_is_new = True
+                        self._frame_ready.notify()
+                    if frame_interval:
+                        next_frame_at += frame_interval
+                        self._stopping.wait(max(0.0, next_frame_at - time.monotonic()))
+            finally:
+                capture.release()
+
+            if self.is_file:
+                break
+            self.last_error = f"Stream {self.url} ended"
+            self.state = RECONNECTING
+            self._stopping.wait(self.reconnect_delay)
+
+        if self.is_file and not self._stopping.is_set():
+            self.state = FINISHED
+        with self._frame_ready:
+            self._frame_ready.notify_all()
+
+    def _next_frame(self):
+        with self._frame_ready:
+            while not self._frame_is_new:
+                if self._stopping.is_set() or not self._reader.is_alive():
+                    return None
+                self._frame_ready.wait(0.5)
+            self._frame_is_new = False
+            return self._frame
+
+    def _recognize_loop(self):
+        interval = 1 / self.fps if self.fps > 0 else 0
+        with self.app.app_context():
+            handler = FaceRecognitionHandler(self.camera_id)
+            camera = Camera.get_camera_by_id(self.camera_id)
+            detection_settings = DetectionSettings.from_config(self.app.config, camera)
+            db.session.remove()
+            while not self._stopping.is_set():
+                started = time.monotonic()
+                frame = self._next_frame()
+                if frame is None:
+                    if not self._reader.is_alive():
+                        return
+                    continue
+                try:
+                    with camera_scope(self.camera_id):
+                        response, status_code = handler.handle_frame_recognition(
+                            frame, detection_settings, self.tracker, self.motion_gate,
+                        )
+                    if status_code == 200:
+                        self.faces_seen += len(response['faces'])
+                    elif status_code >= 500:
+                        self.last_error = response.get('error')
+                except Exception as e:
+                    self.last_error = str(e)
+                    logger.error("Error recognizing frame from camera %s: %s", self.camera_id, e)
+                finally:
+                    db.session.remove()
+                self.frames_processed += 1
+                self._process_rate.tick(time.time())
+                # Sample at most `fps` frames a second.
+                self._stopping.wait(max(0.0, interval - (time.monotonic() - started)))
+
+    def status(self) -> dict:
+        now = time.time()
+        return {
+            'camera_id': self.camera_id,
+            'url': self.url,
+            'state': self.state if self.alive or self.state in (FINISHED, STOPPED) else STOPPED,
+            'target_fps': self.fps,
+            'read_fps': round(self._read_rate.rate(now), 2),
+            'process_fps': round(self._process_rate.rate(now), 2),
+            'frames_read': self.frames_read,
+            'frames_processed': self.frames_processed,
+            'frames_dropped': self.frames_dropped,
+            'faces_seen': self.faces_seen,
+            'uptime_seconds': round(now - self.started_at, 1),
+            'last_error': self.last_error,
+            'tracking': {
+                'active_tracks': len(self.tracker.tracks),
+                'tracks_started': self.tracker.tracks_started,
+                'encodings': self.tracker.verifications,
+            } if self.tracker is not None else None,
+            'motion': self.motion_gate.stats() if self.motion_gate is not None else None,
+        }
+
+
+class IngestionManager:
+    """
+    Starts, stops and reports on one CameraStream per camera.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._streams: Dict[int, CameraStream] = {}
+        self._lock = threading.Lock()
+
+    def start(self, camera: Camera, url: str = None, fps: float = None) -> CameraStream:
+        """
+        Start ingesting `camera`, restarting it if it is already running.
+        `url` overrides the camera's stream_url; either must pass
+        `validate_stream_url`.
+        """
+        url = url or camera.stream_url
+        if not url:
+            raise ValueError(f"Camera {camera.id} has no stream_url")
+        error = validate_stream_url(url, allow_files=self.app.config.get('INGEST_ALLOW_FILES', False))
+        if error:
+            raise ValueError(error)
+        fps = fps or camera.ingest_fps or self.app.config.get('INGEST_FPS', 2.0)
+        self.stop(camera.id)
+        stream = CameraStream(
+            self.app,
+            camera.id,
+            url,
+            fps,
+            reconnect_delay=self.app.config.get('INGEST_RECONNECT_DELAY', 5.0),
+            tracker=FaceTracker(
+                iou_threshold=self.app.config.get('TRACK_IOU_THRESHOLD', 0.3),
+                max_age=self.app.config.get('TRACK_MAX_AGE', 1.0),
+                reverify_interval=self.app.config.get('TRACK_REVERIFY_INTERVAL', 5.0),
+            ) if self.app.config.get('TRACKING_ENABLED', True) else None,
+            motion=MotionSettings.from_config(self.app.config, camera),
+        )
+        with self._lock:
+            self._streams[camera.id] = stream
+        stream.start()
+        logger.info("Started ingestion for camera %s from %s at %s fps", camera.id, url, fps)
+        return stream
+
+    def stop(self, camera_id: int) -> bool:
+        with self._lock:
+            stream = self._streams.pop(camera_id, None)
+        if stream is None:
+            return False
+        stream.stop()
+        logger.info("Stopped ingestion for camera %s", camera_id)
+        return True
+
+    def stop_all(self):
+        for camera_id in list(self._streams):
+            self.stop(camera_id)
+
+    def status(self, camera_id: int = None):
+        with self._lock:
+            streams = dict(self._streams)
+        if camera_id is not None:
+            stream = streams.get(camera_id)
+            return stream.status() if stream else None
+        return [stream.status() for stream in streams.values()]
+
+
+ingestion_manager = None
+_ingestion_manager_lock = threading.Lock()
+_autostart_lock_file = None
+
+
+def acquire_autostart_lock(path: str) -> bool:
+    """
+    Take the lock that lets a single process of a multi-worker server
+    autostart the camera streams, which every worker would otherwise open
+    again. It is held until the process exits. Always taken where file
+    locks are not available.
+    """
+    global _autostart_lock_file
+    if fcntl is None:
+        return True
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    lock_file = open(path, 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    _autostart_lock_file = lock_file
+    return True
+
+
+def get_ingestion_manager(app) -> IngestionManager:
+    """
+    Return the process-wide ingestion manager, creating it on first use.
+    """
+    global ingestion_manager
+    if ingestion_manager is None:
+        with _ingestion_manager_lock:
+            if ingestion_manager is None:
+                ingestion_manager = IngestionManager(app)
+                atexit.register(ingestion_manager.stop_all)
+    return ingestion_manager
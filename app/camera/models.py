@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String
+from sqlalchemy import Boolean, Column, Float, Integer, String
 from model_base import BareBaseModel
 
 
@@ -6,6 +6,18 @@ class Camera(BareBaseModel):
     name = Column(String(50), nullable=False)
     ip_address = Column(String(50), nullable=False)
     location = Column(String(100))
+    # Per-camera detection overrides; NULL falls back to the app config.
+    detection_max_dimension = Column(Integer, nullable=True)
+    detection_upsample = Column(Integer, nullable=True)
+    detection_coarse_to_fine = Column(Boolean, nullable=True)
+    # RTSP/MJPEG/HTTP URL or local video file read by the ingestion workers.
+    stream_url = Column(String(512), nullable=True)
+    # Frames per second sampled from the stream; NULL falls back to INGEST_FPS.
+    ingest_fps = Column(Float, nullable=True)
+    # Motion gating before detection; NULL falls back to the MOTION_* config.
+    motion_gating = Column(Boolean, nullable=True)
+    motion_threshold = Column(Integer, nullable=True)
+    motion_min_area = Column(Float, nullable=True)
 
     def __repr__(self) -> str:
         return f'<Camera {self.id}>'
@@ -16,11 +28,13 @@ class Camera(BareBaseModel):
             name: str,
             ip_address: str,
             location: str,
+            **settings,
     ) -> 'Camera':
         camera = cls(
             name=name,
             ip_address=ip_address,
             location=location,
+            **settings,
         )
         camera.save()
         return camera
@@ -29,6 +43,10 @@ class Camera(BareBaseModel):
     def get_all_cameras(cls):
         return cls.query.all()
 
+    @classmethod
+    def get_streaming_cameras(cls):
+        return cls.query.filter(cls.stream_url.isnot(None)).all()
+
     @classmethod
     def get_camera_by_id(cls, camera_id):
         return cls.query.get(camera_id)
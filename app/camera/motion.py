@@ -0,0 +1,179 @@
+import threading
+from typing import List, NamedTuple, Optional
+
+import cv2
+import numpy as np
+
+from app.face_recognition.detection import Box
+
+
+class MotionSettings(NamedTuple):
+    """
+    How a camera's frames are gated before face detection.
+
+    enabled: Gate the camera's frames at all.
+    threshold: Grey-level difference from the background (0-255) at which
+        a pixel counts as changed.
+    min_area: Fraction of the frame that must change for detection to run.
+    width: Width of the grey frame the comparison runs on.
+    background_alpha: Weight of each new frame in the running background.
+    region_padding: Padding around each changed region, as a fraction of
+        its size, so that a face that only partly moved is still found.
+    full_frame_area: Changed fraction above which the whole frame is
+        searched instead of the separate regions.
+    """
+    enabled: bool = False
+    threshold: int = 25
+    min_area: float = 0.002
+    width: int = 320
+    background_alpha: float = 0.05
+    region_padding: float = 0.5
+    full_frame_area: float = 0.5
+
+    @classmethod
+    def from_config(cls, config, camera=None) -> 'MotionSettings':
+        """
+        App-wide settings from config, overridden by any set on the camera.
+        """
+        settings = cls(
+            enabled=config.get('MOTION_GATING', False),
+            threshold=config.get('MOTION_THRESHOLD', 25),
+            min_area=config.get('MOTION_MIN_AREA', 0.002),
+            width=config.get('MOTION_WIDTH', 320),
+        )
+        if camera is not None:
+            overrides = {
+                'enabled': camera.motion_gating,
+                'threshold': camera.motion_threshold,
+                'min_area': camera.motion_min_area,
+            }
+            settings = settings._replace(**{key: value for key, value in overrides.items() if value is not None})
+        return settings
+
+
+class MotionGate:
+    """
+    Decide, per frame of one camera, whether face detection has to run and where.
+
+    Each frame is downscaled to `settings.width`, converted to grey and
+    blurred, then compared with a running-average background. If less than
+    `min_area` of it changed, detection is skipped. Otherwise the bounding
+    boxes of the changed blobs, padded and scaled to the full frame, are
+    returned as the regions to search. None is returned when most of the
+    frame changed, or for the first frame, and the whole frame is searched.
+
+    `last_response` holds the recognition response of the last frame that
+    was searched, for callers without a tracker to answer skipped frames.
+    """
+
+    SKIP = 'skip'
+
+    def __init__(self, settings: MotionSettings):
+        self.settings = settings
+        self._background = None
+        self._lock = threading.Lock()
+        self.last_response: Optional[dict] = None
+        self.frames_seen = 0
+        self.frames_skipped = 0
+        self.frames_partial = 0
+        self.frames_full = 0
+
+    def _prepare(self, frame: np.ndarray) -> np.ndarray:
+        height, width = frame.shape[:2]
+        small_width = min(self.settings.width, width)
+        small = cv2.resize(
+            frame,
+            (small_width, max(1, round(height * small_width / width))),
+            interpolation=cv2.INTER_AREA,
+        )
+        grey = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+        return cv2.GaussianBlur(grey, (5, 5), 0).astype(np.float32)
+
+    def _regions(self, mask: np.ndarray, frame_shape) -> List[Box]:
+        height, width = frame_shape[:2]
+        scale = width / mask.shape[1]
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        rects = []
+        for contour in contours:
+            x, y, w, h = cv2.boundingRect(contour)
+            pad_x, pad_y = w * self.settings.region_padding, h * self.settings.region_padding
+            rects.append([
+                max(0, int((y - pad_y) * scale)),
+                min(width, int((x + w + pad_x) * scale)),
+                min(height, int((y + h + pad_y) * scale)),
+                max(0, int((x - pad_x) * scale)),
+            ])
+        # Merge overlapping regions so no face is searched for twice.
+        merged = True
+        while merged:
+            merged = False
+            for i in range(len(rects)):
+                for j in range(i + 1, len(rects)):
+                    a, b = rects[i], rects[j]
+                    if a[0] < b[2] and b[0] < a[2] and a[3] < b[1] and b[3] < a[1]:
+                        rects[i] = [min(a[0], b[0]), max(a[1], b[1]), max(a[2], b[2]), min(a[3], b[3])]
+                        del rects[j]
+                        merged = True
+                        break
+                if merged:
+                    break
+        return [tuple(rect) for rect in rects]
+
+    def check(self, frame: np.ndarray):
+        """
+        Return SKIP, a list of regions (top, right, bottom, left) to search,
+        or None to search the whole frame.
+        """
+        grey = self._prepare(frame)
+        with self._lock:
+            self.frames_seen += 1
+            if self._background is None or self._background.shape != grey.shape:
+                self._background = grey
+                self.frames_full += 1
+                return None
+            difference = cv2.absdiff(grey, self._background)
+            cv2.accumulateWeighted(grey, self._background, self.settings.background_alpha)
+
+            mask = (difference >= self.settings.threshold).astype(np.uint8)
+            changed = float(mask.mean())
+            if changed < self.settings.min_area:
+                self.frames_skipped += 1
+                return self.SKIP
+            if changed >= self.settings.full_frame_area:
+                self.frames_full += 1
+                return None
+            mask = cv2.dilate(mask, np.ones((5, 5), np.uint8), iterations=2)
+            self.frames_partial += 1
+            return self._regions(mask, frame.shape)
+
+    def stats(self) -> dict:
+        return {
+            'enabled': self.settings.enabled,
+            'frames_seen': self.frames_seen,
+            'frames_skipped': self.frames_skipped,
+            'frames_partial': self.frames_partial,
+            'frames_full': self.frames_full,
+        }
+
+
+_gates = {}
+_gates_lock = threading.Lock()
+
+
+def get_motion_gate(camera_id: int, settings: MotionSettings) -> Optional[MotionGate]:
+    """
+    Return the camera's gate, or None if gating is off for it. The gate is
+    replaced, with fresh counters, when the camera's settings change.
+    """
+    if not settings.enabled:
+        return None
+    with _gates_lock:
+        gate = _gates.get(camera_id)
+        if gate is None or gate.settings != settings:
+            gate = _gates[camera_id] = MotionGate(settings)
+        return gate
+
+
+def get_motion_stats(camera_id: int) -> Optional[dict]:
+    gate = _gates.get(camera_id)
+    return gate.stats() if gate is not None else None
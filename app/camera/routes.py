@@ -96,3 +96,94 @@ def get_all_cameras():
             status_code=500,
         )
 
+
+@camera_bp.route('/cameras/<int:camera_id>/stream/start', methods=['POST'])
+def start_camera_stream(camera_id):
+    try:
+        options = request.get_json(silent=True) or {}
+        status = CameraService.start_stream(
+            camera_id,
+            url=options.get('url'),
+            fps=float(options['fps']) if options.get('fps') else None,
+        )
+        if status is None:
+            return format_response(
+                data={},
+                message="Camera not found",
+                status_code=404,
+            )
+        return format_response(
+            data=status,
+            message="Camera stream started",
+            status_code=200,
+        )
+    except ValueError as e:
+        return format_response(
+            data={},
+            message=str(e),
+            status_code=400,
+        )
+    except Exception as e:
+        return format_response(
+            data={},
+            message=str(e),
+            status_code=500,
+        )
+
+
+@camera_bp.route('/cameras/<int:camera_id>/stream/stop', methods=['POST'])
+def stop_camera_stream(camera_id):
+    try:
+        stopped = CameraService.stop_stream(camera_id)
+        return format_response(
+            data={'stopped': stopped},
+            message="Camera stream stopped" if stopped else "Camera stream not running",
+            status_code=200,
+        )
+    except Exception as e:
+        return format_response(
+            data={},
+            message=str(e),
+            status_code=500,
+        )
+
+
+@camera_bp.route('/cameras/<int:camera_id>/stream', methods=['GET'])
+def get_camera_stream_status(camera_id):
+    status = CameraService.get_stream_status(camera_id)
+    if status is None:
+        return format_response(
+            data={},
+            message="Camera stream not running",
+            status_code=404,
+        )
+    return format_response(
+        data=status,
+        message="Camera stream status retrieved successfully",
+        status_code=200,
+    )
+
+
+@camera_bp.route('/cameras/<int:camera_id>/motion', methods=['GET'])
+def get_camera_motion_stats(camera_id):
+    stats = CameraService.get_motion_stats(camera_id)
+    if stats is None:
+        return format_response(
+            data={},
+            message="Motion gating not active for this camera",
+            status_code=404,
+        )
+    return format_response(
+        data=stats,
+        message="Motion gating statistics retrieved successfully",
+        status_code=200,
+    )
+
+
+@camera_bp.route('/cameras/streams', methods=['GET'])
+def get_camera_streams_status():
+    return format_response(
+        data=CameraService.get_stream_status(),
+        message="Camera streams retrieved successfully",
+        status_code=200,
+    )
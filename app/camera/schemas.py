@@ -1,5 +1,17 @@
 from typing import Optional
-from pydantic import BaseModel
+from flask import current_app, has_app_context
+from pydantic import BaseModel, validator
+
+from app.camera.ingestion import validate_stream_url
+
+
+def _check_stream_url(cls, stream_url: Optional[str]) -> Optional[str]:
+    if stream_url is not None:
+        allow_files = has_app_context() and current_app.config.get('INGEST_ALLOW_FILES', False)
+        error = validate_stream_url(stream_url, allow_files=allow_files)
+        if error:
+            raise ValueError(error)
+    return stream_url
 
 
 class CameraSchema(BaseModel):
@@ -7,9 +19,29 @@ class CameraSchema(BaseModel):
     name: str
     ip_address: str
     location: Optional[str]
+    detection_max_dimension: Optional[int] = None
+    detection_upsample: Optional[int] = None
+    detection_coarse_to_fine: Optional[bool] = None
+    stream_url: Optional[str] = None
+    ingest_fps: Optional[float] = None
+    motion_gating: Optional[bool] = None
+    motion_threshold: Optional[int] = None
+    motion_min_area: Optional[float] = None
+
+    _stream_url = validator('stream_url', allow_reuse=True)(_check_stream_url)
 
 
 class CameraUpdateSchema(BaseModel):
     name:  Optional[str]
     ip_address:  Optional[str]
     location: Optional[str]
+    detection_max_dimension: Optional[int]
+    detection_upsample: Optional[int]
+    detection_coarse_to_fine: Optional[bool]
+    stream_url: Optional[str]
+    ingest_fps: Optional[float]
+    motion_gating: Optional[bool]
+    motion_threshold: Optional[int]
+    motion_min_area: Optional[float]
+
+    _stream_url = validator('stream_url', allow_reuse=True)(_check_stream_url)
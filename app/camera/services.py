@@ -1,13 +1,15 @@
 from .models import Camera
 from .schemas import CameraSchema, CameraUpdateSchema
-from concurrent.futures import ThreadPoolExecutor
 from flask import current_app
-import face_recognition as face_rec
-from app.face_recognition.models import FaceEncoding, RecognitionLog
-from app.user.models import User
-from app.face_recognition.schemas import FaceRecognitionResponse
+
+from app.camera.ingestion import get_ingestion_manager
+from app.camera.motion import get_motion_stats
+from app.face_recognition.engine import get_engine
+from app.face_recognition.services import FaceRecognitionHandler
+from app.instrumentation import camera_scope
 import logging
-executor = ThreadPoolExecutor(max_workers=current_app.config.get('MAX_WORKERS', 5))
+
+logger = logging.getLogger(__name__)
 
 
 class CameraService:
@@ -17,7 +19,15 @@ class CameraService:
         return Camera.create_camera(
             name=camera_schema.name,
             ip_address=camera_schema.ip_address,
-            location=camera_schema.location
+            location=camera_schema.location,
+            detection_max_dimension=camera_schema.detection_max_dimension,
+            detection_upsample=camera_schema.detection_upsample,
+            detection_coarse_to_fine=camera_schema.detection_coarse_to_fine,
+            stream_url=camera_schema.stream_url,
+            ingest_fps=camera_schema.ingest_fps,
+            motion_gating=camera_schema.motion_gating,
+            motion_threshold=camera_schema.motion_threshold,
+            motion_min_area=camera_schema.motion_min_area,
         )
 
     @staticmethod
@@ -35,43 +45,49 @@ class CameraService:
 
     @staticmethod
     def delete_camera(camera_id):
+        get_ingestion_manager(current_app._get_current_object()).stop(camera_id)
         return Camera.delete_camera(camera_id)
 
+    @staticmethod
+    def start_stream(camera_id: int, url: str = None, fps: float = None):
+        """
+        Start continuous recognition on the camera's stream; returns its
+        status, or None if the camera does not exist.
+        """
+        camera = Camera.get_camera_by_id(camera_id)
+        if camera is None:
+            return None
+        manager = get_ingestion_manager(current_app._get_current_object())
+        return manager.start(camera, url=url, fps=fps).status()
+
+    @staticmethod
+    def stop_stream(camera_id: int) -> bool:
+        return get_ingestion_manager(current_app._get_current_object()).stop(camera_id)
+
+    @staticmethod
+    def get_stream_status(camera_id: int = None):
+        return get_ingestion_manager(current_app._get_current_object()).status(camera_id)
+
+    @staticmethod
+    def get_motion_stats(camera_id: int):
+        return get_motion_stats(camera_id)
+
 
 def process_camera_feed(camera_id, image_bytes):
     """
     Process image from a camera feed.
     """
     try:
-        face_recognition_handler = FaceRecognitionHandler(camera_id)
-        file = FileStorage(stream=io.BytesIO(image_bytes), filename='image.jpg')
-        encoding, filename = face_recognition_handler._process_face_image(file)
-
-        if encoding is None:
-            return {"error": "No face found in the image"}, 400
-
-        user = face_recognition_handler._recognize_face(encoding)
-        face_recognition_handler._create_recognition_log(user, filename)
-
-        if current_app.config.get('USE_NX_WITNESS', False):
-            face_recognition_handler._create_nx_bookmark(user, filename)
-
-        if user:
-            return FaceRecognitionResponse(
-                message="Face recognized",
-                user=f"{user.first_name} {user.last_name}"
-            ).dict(), 200
-        else:
-            return {'message': 'Face not recognized'}, 200
-
+        with camera_scope(camera_id):
+            return FaceRecognitionHandler(camera_id).handle_camera_image(image_bytes)
     except Exception as e:
-        logging.error(f"Error processing camera feed: {e}")
+        logger.error(f"Error processing camera feed: {e}")
         return {'error': str(e)}, 500
 
 
 def handle_camera_feed(camera_id, image_bytes):
     """
-    Submit image processing to the executor.
+    Submit image processing to the recognition engine.
     """
-    future = executor.submit(process_camera_feed, camera_id, image_bytes)
+    future = get_engine().submit(process_camera_feed, camera_id, image_bytes)
     return future
@@ -0,0 +1,165 @@
+import itertools
+from typing import List, NamedTuple, Optional
+
+from app.face_recognition.detection import Box
+
+
+class Identity(NamedTuple):
+    """
+    The user a track was matched to, detached from the database session.
+    """
+    id: int
+    first_name: str
+    last_name: str
+
+    @classmethod
+    def from_user(cls, user) -> Optional['Identity']:
+        return cls(user.id, user.first_name, user.last_name) if user is not None else None
+
+
+def iou(a: Box, b: Box) -> float:
+    top, right = max(a[0], b[0]), min(a[1], b[1])
+    bottom, left = min(a[2], b[2]), max(a[3], b[3])
+    inter = max(0, bottom - top) * max(0, right - left)
+    union = (a[2] - a[0]) * (a[1] - a[3]) + (b[2] - b[0]) * (b[1] - b[3]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def _centre_distance(a: Box, b: Box) -> float:
+    """
+    Distance between box centres, relative to the size of box `a`.
+    """
+    dy = (a[0] + a[2]) / 2 - (b[0] + b[2]) / 2
+    dx = (a[1] + a[3]) / 2 - (b[1] + b[3]) / 2
+    size = max(a[2] - a[0], a[1] - a[3], 1)
+    return (dx * dx + dy * dy) ** 0.5 / size
+
+
+def _overlaps(a: Box, b: Box) -> bool:
+    return a[0] < b[2] and b[0] < a[2] and a[3] < b[1] and b[3] < a[1]
+
+
+class Track:
+    """
+    One face followed across frames, with its cached identity.
+    """
+    _ids = itertools.count(1)
+
+    def __init__(self, box: Box, now: float):
+        self.id = next(self._ids)
+        self.box = box
+        self.first_seen = now
+        self.last_seen = now
+        self.identity: Optional[Identity] = None
+        self.verified_at: Optional[float] = None
+        self.hits = 1
+
+    @property
+    def is_new(self) -> bool:
+        return self.verified_at is None
+
+
+class FaceTracker:
+    """
+    Associate face boxes across the frames of one camera.
+
+    Each detected box continues the unmatched track it overlaps most (IoU
+    of at least `iou_threshold`); failing that, the nearest track whose
+    centre moved less than `max_centre_shift` box sizes, which catches fast
+    motion at low sampling rates. Unmatched boxes start new tracks, and
+    tracks not seen for `max_age` seconds end.
+
+    A track is encoded and matched when it starts and again every
+    `reverify_interval` seconds, so encoding cost follows new people rather
+    than frames. In between it reuses the cached identity.
+    """
+
+    def __init__(
+            self,
+            iou_threshold: float = 0.3,
+            max_centre_shift: float = 0.5,
+            max_age: float = 1.0,
+            reverify_interval: float = 5.0,
+    ):
+        self.iou_threshold = iou_threshold
+        self.max_centre_shift = max_centre_shift
+        self.max_age = max_age
+        self.reverify_interval = reverify_interval
+        self.tracks: List[Track] = []
+        self.tracks_started = 0
+        self.verifications = 0
+
+    def hold(self, now: float, regions: List[Box] = None):
+        """
+        Keep tracks alive where the frame did not change: all of them, or
+        those outside every changed region. Detection did not look there,
+        so not finding their faces does not mean they left.
+        """
+        for track in self.tracks:
+            if regions is None or not any(_overlaps(track.box, region) for region in regions):
+                track.last_seen = now
+
+    def update(self, boxes: List[Box], now: float, regions: List[Box] = None) -> List[Track]:
+        """
+        Assign this frame's boxes to tracks; returns one track per box, in
+        order. `regions` are the parts of the frame detection searched.
+        """
+        if regions is not None:
+            self.hold(now, regions)
+        self.tracks = [track for track in self.tracks if now - track.last_seen <= self.max_age]
+        pairs = sorted(
+            (
+                (iou(track.box, box), box_index, track_index)
+                for track_index, track in enumerate(self.tracks)
+                for box_index, box in enumerate(boxes)
+            ),
+            reverse=True,
+        )
+        assigned = [None] * len(boxes)
+        used = set()
+        for overlap, box_index, track_index in pairs:
+            if overlap < self.iou_threshold:
+                break
+            if assigned[box_index] is None and track_index not in used:
+                assigned[box_index] = self.tracks[track_index]
+                used.add(track_index)
+
+        for box_index, box in enumerate(boxes):
+            if assigned[box_index] is not None:
+                continue
+            candidates = [
+                (_centre_distance(track.box, box), track_index)
+                for track_index, track in enumerate(self.tracks)
+                if track_index not in used
+            ]
+            distance, track_index = min(candidates, default=(None, None))
+            if distance is not None and distance <= self.max_centre_shift:
+                assigned[box_index] = self.tracks[track_index]
+                used.add(track_index)
+
+        for box_index, box in enumerate(boxes):
+            track = assigned[box_index]
+            if track is None:
+                track = Track(box, now)
+                self.tracks.append(track)
+                self.tracks_started += 1
+                assigned[box_index] = track
+            else:
+                track.box = box
+                track.last_seen = now
+                track.hits += 1
+        return assigned
+
+    def needs_verification(self, track: Track, now: float) -> bool:
+        return track.verified_at is None or now - track.verified_at >= self.reverify_interval
+
+    def verify(self, track: Track, identity: Optional[Identity], now: float) -> bool:
+        """
+        Record a fresh match for the track; returns True if it is new or
+        its identity changed, i.e. when the sighting should be logged.
+        """
+        self.verifications += 1
+        changed = track.is_new or track.identity != identity
+        track.identity = identity
+        track.verified_at = now
+        return changed
@@ -0,0 +1,223 @@
+import logging
+import time
+from typing import NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from app.face_recognition.encoding_format import quantize_int8
+
+logger = logging.getLogger(__name__)
+
+# Rows are assigned to centroids in chunks to bound the temporary
+# (chunk x nlist) distance matrix.
+_ASSIGN_CHUNK = 8192
+
+
+class IVFList(NamedTuple):
+    """
+    The rows assigned to one cell: their gallery positions and their
+    encodings quantized to int8 with a scale per row.
+    """
+    positions: np.ndarray
+    codes: np.ndarray
+    scales: np.ndarray
+    code_sq_norms: np.ndarray
+
+
+class IVFState(NamedTuple):
+    centroids: np.ndarray
+    centroid_sq_norms: np.ndarray
+    lists: Tuple[IVFList, ...]
+    trained_size: int
+
+
+_EMPTY_LIST = IVFList(
+    positions=np.empty(0, dtype=np.int64),
+    codes=np.empty((0, 0), dtype=np.int8),
+    scales=np.empty(0, dtype=np.float32),
+    code_sq_norms=np.empty(0, dtype=np.float32),
+)
+
+
+class IVFIndex:
+    """
+    Inverted-file approximate nearest-neighbour index in pure NumPy.
+
+    A k-means coarse quantizer splits the gallery into `nlist` cells. A query
+    only scans the `nprobe` cells closest to it, scoring candidates against
+    int8 codes of their encodings (a quarter of the float32 gallery), and the
+    best `rerank` candidates are then re-ranked with exact distances against
+    the gallery. Raising `nprobe` (and `rerank`) trades latency for recall.
+
+    Each cell keeps its own arrays, so indexing new rows only copies the
+    cells they fall in. The index never owns the gallery matrix: every
+    method takes the current encodings and returns a new immutable IVFState,
+    sharing the unchanged cells, so the gallery can publish it together with
+    the view it describes.
+    """
+
+    def __init__(
+            self,
+            nlist: int = 0,
+            nprobe: int = 16,
+            rerank: int = 32,
+            iterations: int = 10,
+            min_train_size: int = 10000,
+            seed: int = 0,
+    ):
+        if nprobe < 1:
+            raise ValueError(f"IVF nprobe must be at least 1, got {nprobe}")
+        if rerank < 1:
+            raise ValueError(f"IVF rerank must be at least 1, got {rerank}")
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.rerank = rerank
+        self.iterations = iterations
+        self.min_train_size = min_train_size
+        self.seed = seed
+
+    def _list_count(self, size: int) -> int:
+        if self.nlist:
+            return min(self.nlist, size)
+        return max(1, int(4 * np.sqrt(size)))
+
+    @staticmethod
+    def _assign(encodings: np.ndarray, centroids: np.ndarray, centroid_sq_norms: np.ndarray) -> np.ndarray:
+        assignments = np.empty(len(encodings), dtype=np.int32)
+        for start in range(0, len(encodings), _ASSIGN_CHUNK):
+            chunk = encodings[start:start + _ASSIGN_CHUNK]
+            scores = centroid_sq_norms - 2.0 * (chunk @ centroids.T)
+            assignments[start:start + _ASSIGN_CHUNK] = np.argmin(scores, axis=1)
+        return assignments
+
+    def _train(self, encodings: np.ndarray) -> np.ndarray:
+        rng = np.random.default_rng(self.seed)
+        nlist = self._list_count(len(encodings))
+        sample_size = min(len(encodings), 256 * nlist)
+        sample = encodings[rng.choice(len(encodings), size=sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, size=nlist, replace=False)].copy()
+        for _ in range(self.iterations):
+            assignments = self._assign(sample, centroids, np.einsum('ij,ij->i', centroids, centroids))
+            counts = np.bincount(assignments, minlength=nlist)
+            sums = np.stack(
+                [np.bincount(assignments, weights=sample[:, dim], minlength=nlist) for dim in range(sample.shape[1])],
+                axis=1,
+            )
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+            # Reseed empty cells on random points so no list stays unused.
+            empty = np.flatnonzero(~filled)
+            if len(empty):
+                centroids[empty] = sample[rng.choice(sample_size, size=len(empty), replace=False)]
+        return centroids
+
+    @staticmethod
+    def _make_list(positions: np.ndarray, encodings: np.ndarray) -> IVFList:
+        codes, scales = quantize_int8(encodings.astype(np.float32))
+        dequantized_sq_norms = np.einsum('ij,ij->i', codes, codes, dtype=np.float32) * scales * scales
+        return IVFList(positions.astype(np.int64), codes, scales, dequantized_sq_norms)
+
+    def _add_to_lists(self, lists: list, assignments: np.ndarray, encodings: np.ndarray, start: int):
+        """
+        Append `encodings`, the gallery rows from position `start` on, to the
+        cells they are assigned to, replacing only those cells in `lists`.
+        """
+        order = np.argsort(assignments, kind='stable')
+        cells, first = np.unique(assignments[order], return_index=True)
+        for cell, rows in zip(cells, np.split(order, first[1:])):
+            added = self._make_list(start + rows, encodings[rows])
+            old = lists[cell]
+            if len(old.positions):
+                added = IVFList(*(np.concatenate([old_part, new_part]) for old_part, new_part in zip(old, added)))
+            lists[cell] = added
+
+    def build(self, encodings: np.ndarray) -> Optional[IVFState]:
+        """
+        Train the coarse quantizer and build the inverted lists.
+
+        Returns None while the gallery is too small for the index to beat an
+        exact scan.
+        """
+        if not len(encodings) or len(encodings) < self.min_train_size:
+            return None
+        train_start = time.time()
+        centroids = self._train(encodings)
+        centroid_sq_norms = np.einsum('ij,ij->i', centroids, centroids)
+        lists = [_EMPTY_LIST] * len(centroids)
+        self._add_to_lists(lists, self._assign(encodings, centroids, centroid_sq_norms), encodings, 0)
+        state = IVFState(centroids, centroid_sq_norms, tuple(lists), trained_size=len(encodings))
+        logger.info(
+            "IVF index trained with %d lists over %d encodings in %f seconds",
+            len(centroids),
+            len(encodings),
+            time.time() - train_start,
+        )
+        return state
+
+    def extend(self, state: Optional[IVFState], encodings: np.ndarray, start: int) -> Optional[IVFState]:
+        """
+        Index rows appended to the gallery at positions `start` and later.
+
+        Only the cells the new rows fall in are copied. The quantizer is
+        retrained once the gallery has doubled since the last training, so
+        cells stay balanced as enrollment grows.
+        """
+        if state is None or len(encodings) >= 2 * state.trained_size:
+            return self.build(encodings)
+        added = encodings[start:]
+        lists = list(state.lists)
+        self._add_to_lists(lists, self._assign(added, state.centroids, state.centroid_sq_norms), added, start)
+        return state._replace(lists=tuple(lists))
+
+    def keep(self, state: Optional[IVFState], mask: np.ndarray, encodings: np.ndarray) -> Optional[IVFState]:
+        """
+        Drop the rows removed from the gallery; `encodings` is the compacted matrix.
+        """
+        if state is None:
+            return None
+        if len(encodings) < self.min_train_size:
+            return None
+        new_positions = np.cumsum(mask) - 1
+        lists = []
+        for cell in state.lists:
+            kept = mask[cell.positions]
+            lists.append(IVFList(
+                new_positions[cell.positions[kept]], cell.codes[kept], cell.scales[kept], cell.code_sq_norms[kept],
+            ))
+        return state._replace(lists=tuple(lists))
+
+    def search(
+            self,
+            state: IVFState,
+            probe: np.ndarray,
+            encodings: np.ndarray,
+            sq_norms: np.ndarray,
+    ) -> Tuple[int, float]:
+        """
+        Return (gallery position, squared distance) of the approximate nearest neighbour.
+        """
+        nlist = len(state.centroids)
+        centroid_scores = state.centroid_sq_norms - 2.0 * (state.centroids @ probe)
+        if self.nprobe < nlist:
+            probed = np.argpartition(centroid_scores, self.nprobe - 1)[:self.nprobe]
+        else:
+            probed = np.arange(nlist)
+
+        cells = [state.lists[cell] for cell in probed]
+        candidates = np.concatenate([cell.positions for cell in cells])
+        if not len(candidates):
+            return -1, np.inf
+        codes = np.concatenate([cell.codes for cell in cells if len(cell.positions)])
+        scales = np.concatenate([cell.scales for cell in cells])
+        code_sq_norms = np.concatenate([cell.code_sq_norms for cell in cells])
+
+        # Coarse scores from the int8 codes; the probe norm is constant and skipped.
+        coarse = code_sq_norms - 2.0 * scales * (codes @ probe.astype(np.float32))
+        if len(candidates) > self.rerank:
+            shortlist = candidates[np.argpartition(coarse, self.rerank - 1)[:self.rerank]]
+        else:
+            shortlist = candidates
+
+        exact = sq_norms[shortlist] - 2.0 * (encodings[shortlist] @ probe) + probe @ probe
+        best = int(np.argmin(exact))
+        return int(shortlist[best]), float(exact[best])
@@ -0,0 +1,251 @@
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+import requests
+from flask import current_app
+
+from app.face_recognition.models import BookmarkOutbox
+from app.instrumentation import NX_SEND, stage
+from model_base import db
+
+logger = logging.getLogger(__name__)
+
+
+def build_bookmark_payload(user, server_id: str, now_ms: Optional[int] = None) -> dict:
+    """
+    NX Witness bookmark for one recognized (or unknown) face.
+
+    Keys starting with an underscore are for the dispatcher only and are
+    stripped before sending: `_personId` is the recognized user's id.
+    """
+    now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+    return {
+        "serverId": server_id,
+        "name": "Face Recognized",
+        "description": f"{user.first_name} {user.last_name}" if user else "Unknown",
+        "startTimeMs": now_ms,
+        "durationMs": 1000,
+        "tags": ["Face Recognition"],
+        "creationTimeMs": now_ms,
+        "_personId": user.id if user else None,
+    }
+
+
+def _person_key(payload: dict):
+    """
+    What identifies the person of a bookmark, or None if its bookmarks
+    must never be merged (unknown faces, or rows queued without an id).
+    """
+    if payload.get('_personId') is None:
+        return None
+    return payload['serverId'], payload['_personId'], payload['description']
+
+
+def coalesce_bookmarks(rows, window_ms: int):
+    """
+    Merge the bookmarks of the same recognized person starting within
+    `window_ms` of the first one of their group into one bookmark spanning
+    the group. Bookmarks of different people are never merged, since NX
+    Witness keeps one bookmark per person that way.
+
+    :param rows: (id, payload, attempts) tuples as claimed from the outbox.
+    :return: List of (ids, payload, attempts), attempts being the highest
+        in the group.
+    """
+    groups = []
+    # Person key -> index in `groups` of that person's latest group.
+    latest = {}
+    for row_id, payload, attempts in sorted(rows, key=lambda row: row[1]['startTimeMs']):
+        key = _person_key(payload) if window_ms > 0 else None
+        index = latest.get(key) if key is not None else None
+        if index is not None and payload['startTimeMs'] - groups[index][1]['startTimeMs'] <= window_ms:
+            ids, merged, group_attempts = groups[index]
+            ids.append(row_id)
+            end = max(
+                merged['startTimeMs'] + merged['durationMs'],
+                payload['startTimeMs'] + payload['durationMs'],
+            )
+            merged['durationMs'] = end - merged['startTimeMs']
+            merged['creationTimeMs'] = max(merged['creationTimeMs'], payload['creationTimeMs'])
+            groups[index] = (ids, merged, max(group_attempts, attempts))
+        else:
+            groups.append(([row_id], dict(payload), attempts))
+            if key is not None:
+                latest[key] = len(groups) - 1
+    return groups
+
+
+class BookmarkDispatcher:
+    """
+    Drain the bookmark outbox from a background thread.
+
+    Bookmarks are posted over one keep-alive `requests.Session`. The target
+    the NX server redirects to is cached and reused until it fails. Failed
+    sends are retried with exponential backoff up to NX_MAX_ATTEMPTS. With
+    NX_BOOKMARK_COALESCE_MS set, the dispatcher waits that long after being
+    woken, so a burst of recognitions of the same person is sent as one
+    bookmark.
+    """
+
+    def __init__(self, app):
+        config = app.config
+        self.app = app
+        self.url = config['NX_WITNESS_URL'].format(deviceId=config['NX_DEVICE_ID'])
+        self.auth = config['NX_WITNESS_AUTH']
+        self.timeout = config.get('NX_REQUEST_TIMEOUT', 10)
+        self.poll_interval = config.get('NX_OUTBOX_POLL_INTERVAL', 1.0)
+        self.batch_size = config.get('NX_OUTBOX_BATCH_SIZE', 100)
+        self.coalesce_ms = config.get('NX_BOOKMARK_COALESCE_MS', 0)
+        self.max_attempts = config.get('NX_MAX_ATTEMPTS', 8)
+        self.retry_base = config.get('NX_RETRY_BASE', 1.0)
+        self.retry_max = config.get('NX_RETRY_MAX', 300.0)
+        self.lease = config.get('NX_OUTBOX_LEASE', 60.0)
+        self.retention = config.get('NX_OUTBOX_RETENTION', 86400.0)
+        self.session = requests.Session()
+        self.session.headers['Content-Type'] = 'application/json'
+        self._redirect_target = None
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+        self.sent = 0
+        self.failed = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='bookmark-dispatcher', daemon=True)
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def notify(self):
+        """
+        Wake the dispatcher after new bookmarks have been committed.
+        """
+        self._wakeup.set()
+
+    def stop(self, timeout: float = 5.0):
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        with self.app.app_context():
+            while not self._stopping.is_set():
+                if self._wakeup.wait(self.poll_interval) and self.coalesce_ms:
+                    self._stopping.wait(self.coalesce_ms / 1000)
+                self._wakeup.clear()
+                try:
+                    while self.dispatch() and not self._stopping.is_set():
+                        pass
+                    self._prune()
+                except Exception as e:
+                    logger.error("Error dispatching NX Witness bookmarks: %s", e)
+                finally:
+                    db.session.remove()
+
+    def _post(self, url: str, payload: dict) -> requests.Response:
+        return self.session.post(
+            url=url,
+            json=payload,
+            auth=self.auth,
+            timeout=self.timeout,
+            verify=False,
+            allow_redirects=False,
+        )
+
+    def send(self, payload: dict):
+        """
+        Post one bookmark, following and caching a redirect; raises on failure.
+        """
+        url = self._redirect_target or self.url
+        payload = {key: value for key, value in payload.items() if not key.startswith('_')}
+        try:
+            with stage(NX_SEND):
+                response = self._post(url, payload)
+                if response.status_code in (307, 308):
+                    self._redirect_target = response.headers['Location']
+                    response = self._post(self._redirect_target, payload)
+        except requests.RequestException:
+            self._redirect_target = None
+            raise
+        if response.status_code != 200:
+            if response.status_code < 500:
+                # The target may have moved; ask the server again next time.
+                self._redirect_target = None
+            raise RuntimeError(f"NX Witness answered {response.status_code}: {response.text[:200]}")
+
+    def stats(self) -> dict:
+        return {
+            'sent': self.sent,
+            'failed': self.failed,
+        }
+
+    def _backoff(self, attempts: int) -> float:
+        return min(self.retry_base * 2 ** (attempts - 1), self.retry_max)
+
+    def dispatch(self) -> int:
+        """
+        Send one batch of due bookmarks; returns the number of rows claimed.
+        """
+        rows = BookmarkOutbox.claim_due(self.batch_size, self.lease)
+        for ids, payload, attempts in coalesce_bookmarks(rows, self.coalesce_ms):
+            try:
+                self.send(payload)
+            except Exception as e:
+                attempts += 1
+                give_up = attempts >= self.max_attempts
+                BookmarkOutbox.mark_retry(ids, attempts, self._backoff(attempts), str(e), give_up)
+                self.failed += len(ids)
+                logger.error(
+                    "Failed to send %d bookmarks (attempt %d%s): %s",
+                    len(ids), attempts, ", giving up" if give_up else "", e,
+                )
+                continue
+            BookmarkOutbox.mark_sent(ids)
+            self.sent += len(ids)
+            logger.info("Bookmark created for %d recognitions", len(ids))
+        return len(rows)
+
+    def _prune(self):
+        if time.time() - self._last_prune < 60:
+            return
+        self._last_prune = time.time()
+        BookmarkOutbox.prune_sent(datetime.utcnow() - timedelta(seconds=self.retention))
+
+
+bookmark_dispatcher = None
+_bookmark_dispatcher_lock = threading.Lock()
+
+
+def get_bookmark_dispatcher(app=None) -> BookmarkDispatcher:
+    """
+    Return the process-wide dispatcher, creating and starting it on first use.
+    """
+    global bookmark_dispatcher
+    if bookmark_dispatcher is None:
+        with _bookmark_dispatcher_lock:
+            if bookmark_dispatcher is None:
+                bookmark_dispatcher = BookmarkDispatcher(app if app is not None else current_app._get_current_object())
+                bookmark_dispatcher.start()
+    return bookmark_dispatcher
+
+
+def enqueue_bookmarks(users: List) -> int:
+    """
+    Queue one bookmark per recognized face (None for unknown faces) and wake
+    the dispatcher.
+    """
+    now_ms = int(time.time() * 1000)
+    count = BookmarkOutbox.enqueue(
+        build_bookmark_payload(user, current_app.config['NX_SERVER_ID'], now_ms) for user in users
+    )
+    if count:
+        get_bookmark_dispatcher().notify()
+    return count
@@ -0,0 +1,123 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+
+class CaptureWriter:
+    """
+    Persist captured face images off the request path.
+
+    Requests hand over the raw image bytes and return immediately; a single
+    daemon thread writes them to disk. The queue is bounded so a slow disk
+    cannot grow memory without limit: when it is full the capture is dropped
+    and counted rather than blocking recognition.
+    """
+
+    def __init__(self, max_queue_size: int = 256):
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='capture-writer', daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def submit(self, file_path: str, data: bytes) -> bool:
+        """
+        Queue `data` to be written to `file_path`; returns False if dropped.
+        """
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((file_path, data))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            logger.warning("Capture queue full, dropping snapshot %s", file_path)
+            return False
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                file_path, data = item
+                tmp_path = f"{file_path}.tmp"
+                with open(tmp_path, 'wb') as capture:
+                    capture.write(data)
+                # Readers of the snapshot folder never see a half-written image.
+                os.replace(tmp_path, file_path)
+                self.written += 1
+            except Exception as e:
+                logger.error(f"Error writing captured face image: {e}")
+            finally:
+                self._queue.task_done()
+
+    def stats(self) -> dict:
+        return {
+            'queued': self._queue.qsize(),
+            'written': self.written,
+            'dropped': self.dropped,
+        }
+
+    def close(self, timeout: float = 5.0):
+        """
+        Write out what is still queued, waiting at most `timeout` seconds.
+        """
+        if self._thread is None:
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+
+capture_writer = None
+_capture_writer_lock = threading.Lock()
+
+
+def get_capture_writer(max_queue_size: int = 256) -> CaptureWriter:
+    """
+    Return the process-wide capture writer, creating it on first use.
+    """
+    global capture_writer
+    if capture_writer is None:
+        with _capture_writer_lock:
+            if capture_writer is None:
+                capture_writer = CaptureWriter(max_queue_size=max_queue_size)
+    return capture_writer
+
+
+def save_capture(image_bytes: bytes) -> str:
+    """
+    Hand an encoded snapshot to the capture writer, which saves it in
+    CAPTURED_FACES_PATH off the request path, and return its filename.
+    """
+    timestamp = time.strftime('%Y%m%d_%H%M%S')
+    # Several captures can land in the same second, especially in a batch.
+    filename = f"{timestamp}_{uuid.uuid4().hex[:8]}.jpg"
+    file_path = os.path.join(current_app.config['CAPTURED_FACES_PATH'], filename)
+    get_capture_writer(current_app.config.get('CAPTURE_QUEUE_SIZE', 256)).submit(file_path, image_bytes)
+    logger.debug(
+        "Image queued at %s for %s",
+        datetime.now(timezone.utc),
+        file_path,
+    )
+    return filename
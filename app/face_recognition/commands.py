@@ -0,0 +1,109 @@
+import logging
+import time
+
+import click
+import numpy as np
+from flask import current_app
+from flask.cli import AppGroup
+
+from app.face_recognition.encoding_format import ENCODING_FORMATS
+from app.face_recognition.gallery import FaceGallery
+from app.face_recognition.models import FaceEncoding
+from app.face_recognition.snapshot import export_snapshot
+from app.face_recognition.templates import compact_user
+from model_base import add_missing_columns, db
+
+logger = logging.getLogger(__name__)
+
+encodings_cli = AppGroup('encodings', help='Face encoding maintenance commands.')
+
+
+@encodings_cli.command('migrate')
+@click.option('--format', 'encoding_format', type=click.Choice(ENCODING_FORMATS), default='float32',
+              show_default=True, help='Target storage format.')
+@click.option('--batch-size', default=500, show_default=True, help='Rows rewritten per transaction.')
+@click.option('--pause', default=0.0, show_default=True, help='Seconds to sleep between batches.')
+def migrate_encodings(encoding_format, batch_size, pause):
+    """
+    Rewrite stored face encodings into another storage format.
+
+    Runs in small transactions so it can be left running next to the live
+    service; rows already in the target format are skipped, so an interrupted
+    run simply resumes.
+    """
+    add_missing_columns(FaceEncoding)
+    migrated = 0
+    last_id = 0
+    migrate_start = time.time()
+    while True:
+        batch = FaceEncoding.get_encodings_to_migrate(encoding_format, after_id=last_id, limit=batch_size)
+        if not batch:
+            break
+        for face_encoding in batch:
+            face_encoding.set_face_encoding(face_encoding.get_face_encoding(dtype=np.float64), encoding_format)
+        db.session.commit()
+        last_id = batch[-1].id
+        migrated += len(batch)
+        logger.info("Migrated %d face encodings to %s (last id %d)", migrated, encoding_format, last_id)
+        if pause:
+            time.sleep(pause)
+
+    click.echo(f"Migrated {migrated} face encodings to {encoding_format} in {time.time() - migrate_start:.1f}s")
+
+
+@encodings_cli.command('export-snapshot')
+@click.option('--dir', 'directory', default=None, help='Snapshot directory (defaults to GALLERY_SNAPSHOT_DIR).')
+@click.option('--keep', default=2, show_default=True, help='Number of snapshots to keep on disk.')
+def export_gallery_snapshot(directory, keep):
+    """
+    Publish the current gallery as a memory-mappable snapshot.
+
+    Workers running with GALLERY_SOURCE=snapshot pick it up on their next
+    sync; run this periodically (e.g. from cron) to bring workers that have
+    applied local changes back onto shared pages.
+    """
+    directory = directory or current_app.config['GALLERY_SNAPSHOT_DIR']
+    snapshot_gallery = FaceGallery()
+    snapshot_gallery.load()
+    name = export_snapshot(
+        directory,
+        snapshot_gallery.view,
+        generation=snapshot_gallery.generation,
+        watermark=snapshot_gallery.watermark,
+        keep=keep,
+    )
+    click.echo(f"Published gallery snapshot {name} with {len(snapshot_gallery)} encodings")
+
+
+@encodings_cli.command('compact')
+@click.option('--max-templates', type=int, default=None,
+              help='Templates kept per user (defaults to ENCODING_MAX_TEMPLATES).')
+@click.option('--outlier-distance', type=float, default=None,
+              help='Distance from the centroid at which a sample is kept (defaults to ENCODING_OUTLIER_DISTANCE).')
+@click.option('--user-id', type=int, default=None, help='Compact only this user.')
+def compact_encodings(max_templates, outlier_distance, user_id):
+    """
+    Reduce users with many encodings to a centroid template plus outliers.
+
+    Samples are deactivated, not deleted, so compaction can be rerun with
+    other settings; each user is compacted in its own transaction.
+    """
+    add_missing_columns(FaceEncoding)
+    max_templates = max_templates or current_app.config.get('ENCODING_MAX_TEMPLATES', 3)
+    outlier_distance = outlier_distance or current_app.config.get('ENCODING_OUTLIER_DISTANCE', 0.35)
+    if user_id is not None:
+        user_ids = [user_id]
+    else:
+        user_ids = [row[0] for row in FaceEncoding.count_active_by_user(min_count=max_templates + 1)]
+    compact_start = time.time()
+    before = after = 0
+    for compact_user_id in user_ids:
+        before += sum(row.is_active for row in FaceEncoding.get_user_encodings(compact_user_id))
+        after += compact_user(
+            compact_user_id,
+            max_templates=max_templates,
+            outlier_distance=outlier_distance,
+            encoding_format=current_app.config.get('FACE_ENCODING_FORMAT', 'float32'),
+        )
+    click.echo(f"Compacted {len(user_ids)} users from {before} to {after} active encodings "
+               f"in {time.time() - compact_start:.1f}s")
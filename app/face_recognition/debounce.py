@@ -0,0 +1,247 @@
+import atexit
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, Optional
+
+import numpy as np
+from flask import current_app
+
+from app.face_recognition.capture_writer import get_capture_writer, save_capture
+from app.face_recognition.log_writer import BUFFERED, get_log_writer
+
+logger = logging.getLogger(__name__)
+
+
+class SightingWindow:
+    """
+    The merged recognitions of one person (or one unknown face) on one camera.
+    """
+    __slots__ = ('key', 'camera_id', 'user_id', 'encoding', 'first_seen', 'last_seen', 'hits', 'quality', 'snapshot')
+
+    def __init__(self, key, camera_id: Optional[int], user_id: Optional[int], encoding, now: float):
+        self.key = key
+        self.camera_id = camera_id
+        self.user_id = user_id
+        self.encoding = encoding
+        self.first_seen = now
+        self.last_seen = now
+        self.hits = 0
+        self.quality = -1
+        self.snapshot = None
+
+    def log_entry(self, filename: str):
+        return (
+            self.user_id,
+            filename,
+            self.camera_id,
+            datetime.utcfromtimestamp(self.first_seen),
+            datetime.utcfromtimestamp(self.last_seen),
+            self.hits,
+        )
+
+
+def _face_quality(location) -> int:
+    """
+    Face box area in pixels: a larger face is nearer and more detailed.
+    """
+    top, right, bottom, left = location
+    return max(0, bottom - top) * max(0, right - left)
+
+
+class RecognitionDebouncer:
+    """
+    Merge repeated recognitions of the same person on the same camera.
+
+    A window opens at the first recognition of a key, (camera, user) for
+    known faces and (camera, unknown cluster) for unknown ones. An unknown
+    face joins the open unknown window of its camera whose encoding is
+    within `unknown_tolerance`, otherwise it opens its own. Every further
+    recognition of the key adds a hit and replaces the window's snapshot
+    if its face is larger.
+
+    A window closes once its key was not seen for `window_seconds`, or
+    `max_window_seconds` after it opened, and is then written as one
+    RecognitionLog row with its first and last sighting, hit count and
+    best snapshot. At most `max_windows` are open; beyond that the least
+    recently seen window is closed early. Open windows are closed at exit.
+    """
+
+    def __init__(
+            self,
+            app,
+            window_seconds: float = 30.0,
+            max_window_seconds: float = 300.0,
+            max_windows: int = 1000,
+            unknown_tolerance: float = 0.5,
+    ):
+        self.app = app
+        self.window_seconds = window_seconds
+        self.max_window_seconds = max_window_seconds
+        self.max_windows = max_windows
+        self.unknown_tolerance = unknown_tolerance
+        self._windows = OrderedDict()
+        self._unknown_ids = 0
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self.observed = 0
+        self.windows_opened = 0
+        self.windows_closed = 0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        # Start the writers first so their exit handlers run after ours,
+        # when the last windows have been handed to them.
+        get_capture_writer(self.app.config.get('CAPTURE_QUEUE_SIZE', 256))._ensure_started()
+        log_writer = get_log_writer(self.app)
+        if log_writer.mode == BUFFERED:
+            log_writer._ensure_started()
+        self._thread = threading.Thread(target=self._run, name='recognition-debouncer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _unknown_key(self, camera_id: Optional[int], encoding):
+        if encoding is not None:
+            best, best_distance = None, self.unknown_tolerance
+            for window in self._windows.values():
+                if window.user_id is None and window.camera_id == camera_id and window.encoding is not None:
+                    distance = float(np.linalg.norm(window.encoding - encoding))
+                    if distance <= best_distance:
+                        best, best_distance = window.key, distance
+            if best is not None:
+                return best
+        self._unknown_ids += 1
+        return camera_id, 'unknown', self._unknown_ids
+
+    def observe(self, camera_id: Optional[int], faces, snapshot, now: float = None) -> List:
+        """
+        Add the faces recognized on one image to their windows.
+
+        :param faces: (location, user, encoding) triples; user is None for
+            unknown faces.
+        :param snapshot: The encoded image, or a callable returning it,
+            only called if one of its faces improves a window's snapshot.
+        :return: The users (None for unknown faces) whose window this
+            opened, i.e. the sightings to announce now.
+        """
+        now = now if now is not None else time.time()
+        opened, evicted = [], []
+        image = None
+        with self._lock:
+            for location, user, encoding in faces:
+                self.observed += 1
+                if user is not None:
+                    key = (camera_id, user.id)
+                else:
+                    encoding = np.asarray(encoding, dtype=np.float32) if encoding is not None else None
+                    key = self._unknown_key(camera_id, encoding)
+                window = self._windows.get(key)
+                if window is None:
+                    window = SightingWindow(key, camera_id, user.id if user else None, encoding, now)
+                    self._windows[key] = window
+                    self.windows_opened += 1
+                    opened.append(user)
+                    while len(self._windows) > self.max_windows:
+                        evicted.append(self._windows.popitem(last=False)[1])
+                else:
+                    self._windows.move_to_end(key)
+                window.hits += 1
+                window.last_seen = now
+                quality = _face_quality(location)
+                if quality > window.quality:
+                    if image is None:
+                        image = snapshot() if callable(snapshot) else snapshot
+                    window.quality = quality
+                    window.snapshot = image
+        if evicted:
+            self._emit(evicted)
+        return opened
+
+    def _due(self, now: float) -> List[SightingWindow]:
+        with self._lock:
+            due = [
+                window for window in self._windows.values()
+                if now - window.last_seen >= self.window_seconds
+                or now - window.first_seen >= self.max_window_seconds
+            ]
+            for window in due:
+                del self._windows[window.key]
+        return due
+
+    def _emit(self, windows: List[SightingWindow]):
+        """
+        Save the best snapshot of each closed window and log it as one row.
+        """
+        with self.app.app_context():
+            entries = [window.log_entry(save_capture(window.snapshot)) for window in windows]
+            get_log_writer(self.app).write(entries)
+        self.windows_closed += len(windows)
+
+    def close_due(self, now: float = None) -> int:
+        """
+        Close and log the windows that are due; returns how many.
+        """
+        due = self._due(now if now is not None else time.time())
+        if due:
+            self._emit(due)
+        return len(due)
+
+    def _run(self):
+        interval = min(1.0, self.window_seconds / 4)
+        while not self._stopping.wait(interval):
+            try:
+                self.close_due()
+            except Exception as e:
+                logger.error("Error closing recognition windows: %s", e)
+
+    def close(self, timeout: float = 5.0):
+        """
+        Stop the sweep thread and log every window still open.
+        """
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        with self._lock:
+            windows = list(self._windows.values())
+            self._windows.clear()
+        if windows:
+            self._emit(windows)
+
+    def stats(self) -> dict:
+        return {
+            'open_windows': len(self._windows),
+            'observed': self.observed,
+            'windows_opened': self.windows_opened,
+            'windows_closed': self.windows_closed,
+        }
+
+
+debouncer = None
+_debouncer_lock = threading.Lock()
+
+
+def get_debouncer(app=None) -> Optional[RecognitionDebouncer]:
+    """
+    Return the process-wide debouncer, creating and starting it on first
+    use, or None if RECOGNITION_DEBOUNCE_SECONDS disables debouncing.
+    """
+    global debouncer
+    if debouncer is None:
+        app = app if app is not None else current_app._get_current_object()
+        if app.config.get('RECOGNITION_DEBOUNCE_SECONDS', 0) <= 0:
+            return None
+        with _debouncer_lock:
+            if debouncer is None:
+                debouncer = RecognitionDebouncer(
+                    app,
+                    window_seconds=app.config['RECOGNITION_DEBOUNCE_SECONDS'],
+                    max_window_seconds=app.config.get('RECOGNITION_DEBOUNCE_MAX_SECONDS', 300),
+                    max_windows=app.config.get('RECOGNITION_DEBOUNCE_MAX_WINDOWS', 1000),
+                    unknown_tolerance=app.config.get('RECOGNITION_DEBOUNCE_UNKNOWN_TOLERANCE', 0.5),
+                )
+                debouncer.start()
+    return debouncer
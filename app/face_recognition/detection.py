@@ -0,0 +1,152 @@
+from typing import List, NamedTuple, Tuple
+
+import cv2
+import face_recognition as face_rec
+import numpy as np
+
+from app.instrumentation import stage
+
+# (top, right, bottom, left), as used throughout face_recognition.
+Box = Tuple[int, int, int, int]
+
+
+class DetectionSettings(NamedTuple):
+    """
+    How faces are detected in a frame.
+
+    max_dimension: Longest image side detection runs at; larger frames are
+        downscaled first. 0 keeps the native resolution.
+    upsample: Times the detector upsamples the (downscaled) image; each
+        step finds smaller faces at roughly 4x the cost.
+    coarse_to_fine: Re-detect every coarse box in a padded crop of the
+        full-resolution frame, tightening boxes that downscaling blurred.
+    refine_padding: Crop padding around a coarse box, as a fraction of its size.
+    model: face_recognition detector, 'hog' or 'cnn'.
+    """
+    max_dimension: int = 0
+    upsample: int = 1
+    coarse_to_fine: bool = False
+    refine_padding: float = 0.25
+    model: str = 'hog'
+
+    @classmethod
+    def from_config(cls, config, camera=None) -> 'DetectionSettings':
+        """
+        App-wide settings from config, overridden by any set on the camera.
+        """
+        settings = cls(
+            max_dimension=config.get('DETECTION_MAX_DIMENSION', 0),
+            upsample=config.get('DETECTION_UPSAMPLE', 1),
+            coarse_to_fine=config.get('DETECTION_COARSE_TO_FINE', False),
+            model=config.get('DETECTION_MODEL', 'hog'),
+        )
+        if camera is not None:
+            overrides = {
+                'max_dimension': camera.detection_max_dimension,
+                'upsample': camera.detection_upsample,
+                'coarse_to_fine': camera.detection_coarse_to_fine,
+            }
+            settings = settings._replace(**{key: value for key, value in overrides.items() if value is not None})
+        return settings
+
+
+def _clamp(box: Box, height: int, width: int) -> Box:
+    top, right, bottom, left = box
+    return max(top, 0), min(right, width), min(bottom, height), max(left, 0)
+
+
+def _refine(image: np.ndarray, box: Box, settings: DetectionSettings) -> Box:
+    height, width = image.shape[:2]
+    top, right, bottom, left = box
+    pad_y = int((bottom - top) * settings.refine_padding)
+    pad_x = int((right - left) * settings.refine_padding)
+    crop_top, crop_right, crop_bottom, crop_left = _clamp(
+        (top - pad_y, right + pad_x, bottom + pad_y, left - pad_x), height, width,
+    )
+    crop = image[crop_top:crop_bottom, crop_left:crop_right]
+    # The face fills most of the crop, so no upsampling is needed.
+    found = face_rec.face_locations(crop, number_of_times_to_upsample=0, model=settings.model)
+    if not found:
+        return box
+    # Keep the detection closest to the coarse box's centre.
+    centre_y, centre_x = (top + bottom) / 2 - crop_top, (left + right) / 2 - crop_left
+    best = min(found, key=lambda b: ((b[0] + b[2]) / 2 - centre_y) ** 2 + ((b[1] + b[3]) / 2 - centre_x) ** 2)
+    return best[0] + crop_top, best[1] + crop_left, best[2] + crop_top, best[3] + crop_left
+
+
+def _detect(image: np.ndarray, settings: DetectionSettings, scale: float) -> List[Box]:
+    height, width = image.shape[:2]
+    detection_image = image
+    if scale != 1.0:
+        detection_image = cv2.resize(
+            image,
+            (max(1, round(width * scale)), max(1, round(height * scale))),
+            interpolation=cv2.INTER_AREA,
+        )
+
+    boxes = face_rec.face_locations(
+        detection_image,
+        number_of_times_to_upsample=settings.upsample,
+        model=settings.model,
+    )
+    if scale != 1.0:
+        boxes = [
+            _clamp(
+                (round(top / scale), round(right / scale), round(bottom / scale), round(left / scale)),
+                height,
+                width,
+            )
+            for top, right, bottom, left in boxes
+        ]
+    return boxes
+
+
+def detect_faces(image: np.ndarray, settings: DetectionSettings, regions: List[Box] = None) -> List[Box]:
+    """
+    Detect faces and return their boxes in the coordinates of `image`.
+
+    With `regions`, only those parts of the image are searched, each at the
+    scale the whole image would have been detected at.
+    """
+    height, width = image.shape[:2]
+    scale = 1.0
+    if settings.max_dimension and max(height, width) > settings.max_dimension:
+        scale = settings.max_dimension / max(height, width)
+
+    with stage('detect'):
+        if regions is None:
+            boxes = _detect(image, settings, scale)
+        else:
+            boxes = []
+            for region in regions:
+                top, right, bottom, left = _clamp(region, height, width)
+                if bottom <= top or right <= left:
+                    continue
+                boxes.extend(
+                    (box_top + top, box_right + left, box_bottom + top, box_left + left)
+                    for box_top, box_right, box_bottom, box_left
+                    in _detect(image[top:bottom, left:right], settings, scale)
+                )
+        if scale != 1.0 and settings.coarse_to_fine:
+            boxes = [_refine(image, box, settings) for box in boxes]
+    return boxes
+
+
+def encode_faces(image: np.ndarray, settings: DetectionSettings,
+                 regions: List[Box] = None) -> List[Tuple[Box, np.ndarray]]:
+    """
+    Detect faces once and encode each of them; returns (box, encoding) pairs.
+    """
+    return encode_boxes(image, detect_faces(image, settings, regions))
+
+
+def encode_boxes(image: np.ndarray, boxes: List[Box]) -> List[Tuple[Box, np.ndarray]]:
+    """
+    Encode the faces at known boxes; returns (box, encoding) pairs.
+    """
+    if not boxes:
+        return []
+    # Hand the boxes to the encoder, which would otherwise run the detector again.
+    with stage('encode'):
+        encodings = face_rec.face_encodings(image, known_face_locations=boxes)
+    return list(zip(boxes, encodings))
@@ -0,0 +1,76 @@
+from typing import Optional, Tuple
+
+import numpy as np
+
+# Stored in FaceEncoding.encoding_format. Rows written before the column
+# existed have NULL there and hold raw float64 bytes.
+FORMAT_FLOAT64 = 'float64'
+FORMAT_FLOAT32 = 'float32'
+FORMAT_FLOAT16 = 'float16'
+FORMAT_INT8 = 'int8'
+
+ENCODING_FORMATS = (FORMAT_FLOAT64, FORMAT_FLOAT32, FORMAT_FLOAT16, FORMAT_INT8)
+
+_DTYPES = {
+    FORMAT_FLOAT64: np.float64,
+    FORMAT_FLOAT32: np.float32,
+    FORMAT_FLOAT16: np.float16,
+    FORMAT_INT8: np.int8,
+}
+
+
+def _resolve(encoding_format: Optional[str]) -> str:
+    encoding_format = encoding_format or FORMAT_FLOAT64
+    if encoding_format not in _DTYPES:
+        raise ValueError(f"Unknown face encoding format: {encoding_format}")
+    return encoding_format
+
+
+def encode_vector(encoding: np.ndarray, encoding_format: str) -> Tuple[bytes, Optional[float]]:
+    """
+    Serialize a face encoding in the given storage format.
+
+    :return: Tuple of (raw bytes, scale). The scale is only set for int8,
+        where each vector is quantized symmetrically to [-127, 127].
+    """
+    encoding_format = _resolve(encoding_format)
+    encoding = np.asarray(encoding, dtype=np.float64)
+    if encoding_format == FORMAT_INT8:
+        codes, scales = quantize_int8(encoding[None, :])
+        return codes[0].tobytes(), float(scales[0])
+    return encoding.astype(_DTYPES[encoding_format]).tobytes(), None
+
+
+def quantize_int8(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Quantize each row of a matrix symmetrically to [-127, 127].
+
+    :return: Tuple of (int8 codes, per-row scales); a row is approximately
+        its codes times its scale.
+    """
+    matrix = np.asarray(matrix)
+    peaks = np.abs(matrix).max(axis=1)
+    scales = np.where(peaks > 0, peaks / 127.0, 1.0).astype(matrix.dtype)
+    codes = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales
+
+
+def decode_vector(raw: bytes, encoding_format: Optional[str], scale: Optional[float] = None,
+                  dtype=np.float32) -> np.ndarray:
+    """
+    Decode one stored face encoding.
+    """
+    return decode_matrix([raw], encoding_format, [scale], dtype=dtype)[0]
+
+
+def decode_matrix(raws, encoding_format: Optional[str], scales=None, dtype=np.float32) -> np.ndarray:
+    """
+    Decode many encodings stored in the same format into one (n, d) matrix.
+    """
+    encoding_format = _resolve(encoding_format)
+    raws = list(raws)
+    matrix = np.frombuffer(b''.join(raws), dtype=_DTYPES[encoding_format]).reshape(len(raws), -1)
+    matrix = matrix.astype(dtype)
+    if encoding_format == FORMAT_INT8:
+        matrix *= np.asarray(scales, dtype=dtype)[:, None]
+    return matrix
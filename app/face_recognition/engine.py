@@ -0,0 +1,278 @@
+import atexit
+import contextvars
+import io
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import List, Optional, Tuple
+
+import numpy as np
+from flask import current_app
+
+from app.face_recognition.detection import Box, DetectionSettings, detect_faces, encode_boxes, encode_faces
+from app.instrumentation import stage
+
+logger = logging.getLogger(__name__)
+
+ENCODING_DIMENSION = 128
+# Per face in the result block: the float64 encoding followed by the int64 box.
+_FACE_RECORD_SIZE = ENCODING_DIMENSION * 8 + 4 * 8
+
+# Set in each worker process by _init_worker.
+_worker_cpu = None
+
+
+def _init_worker(cpu_counter, cpu_lock, pin_cpus: bool, threads: int):
+    """
+    Load the face_recognition models once per worker process and optionally
+    pin the worker to its own CPU.
+    """
+    global _worker_cpu
+    import cv2
+    import face_recognition  # noqa: F401  (loads the dlib models)
+
+    cv2.setNumThreads(threads)
+    if pin_cpus and hasattr(os, 'sched_setaffinity'):
+        cpus = sorted(os.sched_getaffinity(0))
+        with cpu_lock:
+            index = cpu_counter.value
+            cpu_counter.value += 1
+        _worker_cpu = cpus[index % len(cpus)]
+        os.sched_setaffinity(0, {_worker_cpu})
+
+
+def _encode_in_worker(input_name: str, input_size: int, frame_shape, result_name: str,
+                      max_faces: int, settings: DetectionSettings, boxes=None, detect_only: bool = False,
+                      regions=None) -> int:
+    """
+    Decode/encode one image in a worker process.
+
+    The input (encoded image bytes, or a raw RGB frame when `frame_shape` is
+    set) is read from shared memory and the boxes and encodings are written
+    back into the result block; only the face count travels through pickle.
+    Given `boxes`, only those faces are encoded; with `detect_only`, only
+    the boxes are written. `regions` limits detection to parts of the image.
+    """
+    import face_recognition as face_rec
+
+    input_block = SharedMemory(name=input_name)
+    result_block = SharedMemory(name=result_name)
+    try:
+        if frame_shape is None:
+            image = face_rec.load_image_file(io.BytesIO(input_block.buf[:input_size]))
+        else:
+            image = np.ndarray(frame_shape, dtype=np.uint8, buffer=input_block.buf)
+        if boxes is not None:
+            faces = encode_boxes(image, boxes[:max_faces])
+        elif detect_only:
+            faces = [(box, None) for box in detect_faces(image, settings, regions)[:max_faces]]
+        else:
+            faces = encode_faces(image, settings, regions)[:max_faces]
+        encodings = np.ndarray((max_faces, ENCODING_DIMENSION), dtype=np.float64, buffer=result_block.buf)
+        result_boxes = np.ndarray((max_faces, 4), dtype=np.int64, buffer=result_block.buf,
+                                  offset=max_faces * ENCODING_DIMENSION * 8)
+        for index, (box, encoding) in enumerate(faces):
+            if encoding is not None:
+                encodings[index] = encoding
+            result_boxes[index] = box
+        return len(faces)
+    finally:
+        # Views into the blocks must be gone before they can be closed.
+        image = encodings = result_boxes = None
+        input_block.close()
+        result_block.close()
+
+
+class RecognitionEngine:
+    """
+    Runs recognition jobs for the blueprints.
+
+    `submit` is a drop-in for ThreadPoolExecutor.submit: jobs run on a
+    thread pool inside the submitting application's context, since they
+    need config and the database. The CPU-bound part of a job, decoding,
+    detection and encoding, goes through `encode_image` / `encode_frame`.
+    In 'thread' mode that runs on the calling thread. In 'process' mode it
+    runs in a pool of worker processes that each load the dlib models once
+    at startup, optionally pinned one per CPU, with image data and results
+    exchanged through shared memory.
+    """
+
+    def __init__(
+            self,
+            mode: str = 'thread',
+            max_workers: int = 5,
+            processes: Optional[int] = None,
+            pin_cpus: bool = False,
+            threads_per_process: int = 1,
+            max_faces: int = 64,
+    ):
+        if mode not in ('thread', 'process'):
+            raise ValueError(f"Unknown recognition engine mode: {mode}")
+        self.mode = mode
+        self.processes = processes or os.cpu_count() or 1
+        self.pin_cpus = pin_cpus
+        self.threads_per_process = threads_per_process
+        self.max_faces = max_faces
+        self.max_workers = max_workers
+        self._threads = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='recognition')
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._counts_lock = threading.Lock()
+        # Jobs submitted but not started yet, and jobs running.
+        self.queued = 0
+        self.active = 0
+
+    @classmethod
+    def from_config(cls, config) -> 'RecognitionEngine':
+        return cls(
+            mode=config.get('RECOGNITION_ENGINE', 'thread'),
+            max_workers=config.get('MAX_WORKERS', 5),
+            processes=config.get('ENGINE_PROCESSES') or None,
+            pin_cpus=config.get('ENGINE_PIN_CPUS', False),
+            threads_per_process=config.get('ENGINE_THREADS_PER_PROCESS', 1),
+            max_faces=config.get('MAX_FACES_PER_FRAME', 64),
+        )
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Run `fn` on the engine's threads inside the current application
+        context, and in a copy of the caller's context variables, so stage
+        timings reach the caller's trace.
+        """
+        app = current_app._get_current_object()
+        context = contextvars.copy_context()
+
+        def run():
+            with self._counts_lock:
+                self.queued -= 1
+                self.active += 1
+            try:
+                with app.app_context():
+                    return fn(*args, **kwargs)
+            finally:
+                with self._counts_lock:
+                    self.active -= 1
+
+        with self._counts_lock:
+            self.queued += 1
+        return self._threads.submit(context.run, run)
+
+    def _process_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    # spawn, not fork: the parent holds DB connections and threads.
+                    context = multiprocessing.get_context('spawn')
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.processes,
+                        mp_context=context,
+                        initializer=_init_worker,
+                        initargs=(context.Value('i', 0), context.Lock(), self.pin_cpus, self.threads_per_process),
+                    )
+                    logger.info("Started recognition engine with %d worker processes", self.processes)
+        return self._pool
+
+    def _encode_shared(self, data, frame_shape, settings: DetectionSettings, boxes=None,
+                       detect_only: bool = False, regions=None) -> List[Tuple[Box, np.ndarray]]:
+        input_block = SharedMemory(create=True, size=max(1, len(data)))
+        result_block = SharedMemory(create=True, size=self.max_faces * _FACE_RECORD_SIZE)
+        try:
+            input_block.buf[:len(data)] = data
+            # Decode, detect and encode run in the worker and are timed as one stage.
+            with stage('worker'):
+                count = self._process_pool().submit(
+                    _encode_in_worker,
+                    input_block.name,
+                    len(data),
+                    frame_shape,
+                    result_block.name,
+                    self.max_faces,
+                    settings,
+                    boxes,
+                    detect_only,
+                    regions,
+                ).result()
+            encodings = np.ndarray((self.max_faces, ENCODING_DIMENSION), dtype=np.float64, buffer=result_block.buf)
+            result_boxes = np.ndarray((self.max_faces, 4), dtype=np.int64, buffer=result_block.buf,
+                                      offset=self.max_faces * ENCODING_DIMENSION * 8)
+            faces = [
+                (tuple(int(v) for v in result_boxes[index]), None if detect_only else encodings[index].copy())
+                for index in range(count)
+            ]
+            encodings = result_boxes = None
+            return faces
+        finally:
+            input_block.close()
+            input_block.unlink()
+            result_block.close()
+            result_block.unlink()
+
+    def encode_image(self, image_bytes: bytes, settings: DetectionSettings) -> List[Tuple[Box, np.ndarray]]:
+        """
+        Decode an encoded image and return (box, encoding) for each face.
+        """
+        if self.mode == 'thread':
+            import face_recognition as face_rec
+            with stage('decode'):
+                image = face_rec.load_image_file(io.BytesIO(image_bytes))
+            return encode_faces(image, settings)
+        return self._encode_shared(image_bytes, None, settings)
+
+    def encode_frame(self, frame: np.ndarray, settings: DetectionSettings, boxes: List[Box] = None,
+                     regions: List[Box] = None) -> List[Tuple[Box, np.ndarray]]:
+        """
+        Return (box, encoding) for each face of a decoded RGB uint8 frame,
+        or only for the faces at `boxes` when they are already known.
+        `regions` limits detection to parts of the frame.
+        """
+        if self.mode == 'thread':
+            return encode_boxes(frame, boxes) if boxes is not None else encode_faces(frame, settings, regions)
+        if boxes is not None and not boxes:
+            return []
+        frame = np.ascontiguousarray(frame, dtype=np.uint8)
+        return self._encode_shared(memoryview(frame).cast('B'), frame.shape, settings, boxes=boxes, regions=regions)
+
+    def detect_frame(self, frame: np.ndarray, settings: DetectionSettings, regions: List[Box] = None) -> List[Box]:
+        """
+        Return the face boxes of a decoded RGB uint8 frame without encoding
+        them, searching only `regions` if given.
+        """
+        if self.mode == 'thread':
+            return detect_faces(frame, settings, regions)
+        frame = np.ascontiguousarray(frame, dtype=np.uint8)
+        return [box for box, _ in self._encode_shared(memoryview(frame).cast('B'), frame.shape, settings,
+                                                      detect_only=True, regions=regions)]
+
+    def stats(self) -> dict:
+        return {
+            'mode': self.mode,
+            'max_workers': self.max_workers,
+            'processes': self.processes if self.mode == 'process' else 0,
+            'queued': self.queued,
+            'active': self.active,
+        }
+
+    def shutdown(self):
+        self._threads.shutdown(wait=False)
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+
+
+engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine(config=None) -> RecognitionEngine:
+    """
+    Return the process-wide engine, creating it from config on first use.
+    """
+    global engine
+    if engine is None:
+        with _engine_lock:
+            if engine is None:
+                engine = RecognitionEngine.from_config(config if config is not None else current_app.config)
+                atexit.register(engine.shutdown)
+    return engine
@@ -0,0 +1,516 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.face_recognition.ann import IVFIndex, IVFState
+from app.face_recognition.encoding_format import decode_matrix
+from app.face_recognition.models import FaceEncoding, GalleryState
+from app.face_recognition.snapshot import GallerySnapshot, load_snapshot, read_current
+from app.user.models import User
+
+logger = logging.getLogger(__name__)
+
+ENCODING_DIMENSION = 128
+
+# Rows updated this long before the last seen `updated_at` are pulled again on
+# sync, which absorbs clock skew between the hosts writing `updated_at`.
+_WATERMARK_SLACK = timedelta(seconds=30)
+
+# Probes matched per (probes x gallery) distance matrix in match_many.
+_MATCH_CHUNK = 64
+
+
+class GalleryView(NamedTuple):
+    row_ids: np.ndarray
+    user_ids: np.ndarray
+    encodings: np.ndarray
+    sq_norms: np.ndarray
+    ann: Optional[IVFState] = None
+
+
+class FaceGallery:
+    """
+    Process-wide in-memory index of every enrolled face encoding.
+
+    All encodings live in one contiguous matrix with parallel arrays of
+    FaceEncoding row ids and user ids, so a probe is matched against the whole
+    gallery with a single batched distance computation.
+
+    The index is kept current incrementally: commits made in this process are
+    applied through SQLAlchemy session events, and commits made by other worker
+    processes are noticed through the GalleryState generation counter and
+    pulled row by row in `sync`.
+
+    With an `ann_index` configured, large galleries are searched through an
+    approximate IVFIndex instead of the exact scan; the index is updated
+    alongside the matrix and published in the same view.
+
+    The gallery can also be served from a memory-mapped snapshot shared by
+    every worker process. Snapshot arrays are read-only: the first local
+    change copies them into private buffers, and the next published snapshot
+    brings the worker back onto the shared pages.
+    """
+
+    def __init__(self, dtype=np.float32, ann_index: Optional[IVFIndex] = None):
+        self._dtype = dtype
+        self._ann_index = ann_index
+        self._ann_state = None
+        self._lock = threading.RLock()
+        self.loaded = False
+        self.generation = None
+        # Newest updated_at loaded so far; None until a row has been seen.
+        self._watermark: Optional[datetime] = None
+        self._last_sync = 0.0
+        self.snapshot_name = None
+        # Bumped on every published view, so caches of match results can
+        # tell when the gallery changed, even between generations.
+        self.version = 0
+        self._allocate(0)
+        self._publish()
+
+    def __len__(self) -> int:
+        return len(self._view.row_ids)
+
+    @property
+    def view(self) -> GalleryView:
+        return self._view
+
+    @property
+    def watermark(self) -> Optional[datetime]:
+        return self._watermark
+
+    def _updated_since(self) -> Optional[datetime]:
+        """
+        Lower bound of updated_at for the next sync, or None to pull every row.
+        """
+        if self._watermark is None:
+            return None
+        if self._watermark - datetime.min <= _WATERMARK_SLACK:
+            return datetime.min
+        return self._watermark - _WATERMARK_SLACK
+
+    def _allocate(self, capacity: int):
+        self._row_ids = np.empty(capacity, dtype=np.int64)
+        self._user_ids = np.empty(capacity, dtype=np.int64)
+        self._encodings = np.empty((capacity, ENCODING_DIMENSION), dtype=self._dtype)
+        self._sq_norms = np.empty(capacity, dtype=self._dtype)
+        self._size = 0
+        self._ann_state = None
+
+    def _publish(self):
+        # Readers take the whole view at once. Appends only write past the end
+        # of the published slices and removals copy into fresh buffers, so a
+        # view held by a concurrent match never changes underneath it.
+        size = self._size
+        self._view = GalleryView(
+            self._row_ids[:size],
+            self._user_ids[:size],
+            self._encodings[:size],
+            self._sq_norms[:size],
+            self._ann_state,
+        )
+        self.version += 1
+
+    def _decode_rows(self, rows) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        rows = list(rows)
+        if not rows:
+            return (
+                np.empty(0, dtype=np.int64),
+                np.empty(0, dtype=np.int64),
+                np.empty((0, ENCODING_DIMENSION), dtype=self._dtype),
+            )
+        row_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        user_ids = np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows))
+        # Decode each storage format in bulk; during a migration the gallery
+        # holds a mix of legacy float64 rows and compact ones.
+        by_format = {}
+        for position, row in enumerate(rows):
+            by_format.setdefault(row[4], []).append(position)
+        encodings = np.empty((len(rows), ENCODING_DIMENSION), dtype=self._dtype)
+        for encoding_format, positions in by_format.items():
+            encodings[positions] = decode_matrix(
+                [rows[position][2] for position in positions],
+                encoding_format,
+                [rows[position][5] for position in positions],
+                dtype=self._dtype,
+            )
+        return row_ids, user_ids, encodings
+
+    def _append(self, row_ids: np.ndarray, user_ids: np.ndarray, encodings: np.ndarray):
+        count = len(row_ids)
+        if not count:
+            return
+        start, end = self._size, self._size + count
+        if end > len(self._row_ids):
+            capacity = max(end, 2 * len(self._row_ids), 64)
+            old = self._view
+            self._allocate(capacity)
+            self._ann_state = old.ann
+            self._row_ids[:start] = old.row_ids
+            self._user_ids[:start] = old.user_ids
+            self._encodings[:start] = old.encodings
+            self._sq_norms[:start] = old.sq_norms
+        self._row_ids[start:end] = row_ids
+        self._user_ids[start:end] = user_ids
+        self._encodings[start:end] = encodings
+        self._sq_norms[start:end] = np.einsum('ij,ij->i', self._encodings[start:end], self._encodings[start:end])
+        self._size = end
+        if self._ann_index is not None:
+            self._ann_state = self._ann_index.extend(self._ann_state, self._encodings[:end], start)
+        self._publish()
+
+    def _keep(self, mask: np.ndarray):
+        old = self._view
+        self._allocate(len(self._row_ids))
+        kept = int(mask.sum())
+        self._row_ids[:kept] = old.row_ids[mask]
+        self._user_ids[:kept] = old.user_ids[mask]
+        self._encodings[:kept] = old.encodings[mask]
+        self._sq_norms[:kept] = old.sq_norms[mask]
+        self._size = kept
+        if self._ann_index is not None:
+            self._ann_state = self._ann_index.keep(old.ann, mask, self._encodings[:kept])
+        self._publish()
+
+    def configure_ann(self, ann_index: Optional[IVFIndex]):
+        """
+        Switch between exact scan (None) and an approximate index.
+        """
+        with self._lock:
+            self._ann_index = ann_index
+            size = self._size
+            self._ann_state = ann_index.build(self._encodings[:size]) if ann_index is not None else None
+            self._publish()
+
+    def build(self, rows):
+        """
+        Build the index from FaceEncoding.get_all_encoding_rows() style rows.
+        """
+        rows = list(rows)
+        row_ids, user_ids, encodings = self._decode_rows(rows)
+        with self._lock:
+            self._allocate(len(row_ids))
+            self._append(row_ids, user_ids, encodings)
+            self._publish()
+            self._advance_watermark(rows)
+            self.loaded = True
+
+    def upsert(self, rows):
+        """
+        Add rows to the index, replacing any already indexed under the same id.
+        """
+        rows = list(rows)
+        row_ids, user_ids, encodings = self._decode_rows(rows)
+        with self._lock:
+            self.remove(row_ids=row_ids)
+            self._append(row_ids, user_ids, encodings)
+            self._advance_watermark(rows)
+
+    def remove(self, row_ids: Iterable[int] = (), user_ids: Iterable[int] = ()):
+        """
+        Drop the given FaceEncoding rows, and every row of the given users.
+        """
+        row_ids = np.fromiter(row_ids, dtype=np.int64)
+        user_ids = np.fromiter(user_ids, dtype=np.int64)
+        with self._lock:
+            view = self._view
+            drop = np.isin(view.row_ids, row_ids) | np.isin(view.user_ids, user_ids)
+            if drop.any():
+                self._keep(~drop)
+
+    def _advance_watermark(self, rows):
+        for row in rows:
+            if row[3] is not None and (self._watermark is None or row[3] > self._watermark):
+                self._watermark = row[3]
+
+    def load(self):
+        """
+        (Re)build the index from every FaceEncoding row in the database.
+        """
+        load_start = time.time()
+        with self._lock:
+            # Read the generation first: a commit landing between the two
+            # queries leaves us one generation behind, never silently ahead.
+            generation = GalleryState.get_generation()
+            self.build(FaceEncoding.get_all_encoding_rows())
+            self.generation = generation
+            self._last_sync = time.monotonic()
+        logger.info(
+            "Face gallery loaded with %d encodings (generation %d) in %f seconds",
+            len(self),
+            generation,
+            time.time() - load_start,
+        )
+
+    def ensure_loaded(self, ann_index: Optional[IVFIndex] = None, snapshot_dir: Optional[str] = None):
+        if self.loaded:
+            return
+        with self._lock:
+            if not self.loaded:
+                self.configure_ann(ann_index)
+                snapshot = load_snapshot(snapshot_dir) if snapshot_dir else None
+                if snapshot is not None:
+                    self.attach_snapshot(snapshot)
+                else:
+                    self.load()
+
+    def attach_snapshot(self, snapshot: GallerySnapshot):
+        """
+        Swap the index over to a memory-mapped snapshot in one step.
+        """
+        encodings = snapshot.encodings
+        sq_norms = snapshot.sq_norms
+        if encodings.dtype != self._dtype:
+            logger.warning(
+                "Gallery snapshot %s is %s, copying it to %s",
+                snapshot.name,
+                encodings.dtype,
+                np.dtype(self._dtype),
+            )
+            encodings = encodings.astype(self._dtype)
+            sq_norms = sq_norms.astype(self._dtype)
+        with self._lock:
+            self._row_ids = snapshot.row_ids
+            self._user_ids = snapshot.user_ids
+            self._encodings = encodings
+            self._sq_norms = sq_norms
+            self._size = len(snapshot.row_ids)
+            self._ann_state = self._ann_index.build(encodings) if self._ann_index is not None else None
+            self._publish()
+            self.generation = snapshot.generation
+            self._watermark = snapshot.watermark
+            self._last_sync = time.monotonic()
+            self.snapshot_name = snapshot.name
+            self.loaded = True
+
+    def refresh_snapshot(self, directory: str):
+        """
+        Attach the published snapshot if it is newer than the one in use.
+        """
+        name = read_current(directory)
+        if not name or name == self.snapshot_name:
+            return
+        with self._lock:
+            if name == self.snapshot_name:
+                return
+            snapshot = load_snapshot(directory, name)
+            if self.generation is not None and snapshot.generation < self.generation:
+                # Already synced past it from the database; wait for a newer one.
+                self.snapshot_name = name
+                return
+            self.attach_snapshot(snapshot)
+
+    def sync(self, interval: float = 0.0, snapshot_dir: Optional[str] = None):
+        """
+        Pull changes committed by other processes if the generation moved.
+
+        A newer published snapshot in `snapshot_dir` is attached first. Only
+        rows inserted or updated since then are fetched from the database;
+        deleted rows are found by diffing against the current list of ids.
+        """
+        if time.monotonic() - self._last_sync < interval:
+            return
+        with self._lock:
+            self._last_sync = time.monotonic()
+            if snapshot_dir:
+                self.refresh_snapshot(snapshot_dir)
+            generation = GalleryState.get_generation()
+            if generation == self.generation:
+                return
+            sync_start = time.time()
+            last_id = int(self._view.row_ids.max()) if len(self) else 0
+            changed = FaceEncoding.get_changed_encoding_rows(
+                last_id=last_id,
+                updated_since=self._updated_since(),
+            )
+            live_ids = FaceEncoding.get_all_ids()
+            self.upsert(changed)
+            stale = np.setdiff1d(self._view.row_ids, np.asarray(live_ids, dtype=np.int64))
+            self.remove(row_ids=stale)
+            logger.info(
+                "Face gallery synced from generation %s to %d: %d rows pulled, %d removed in %f seconds",
+                self.generation,
+                generation,
+                len(changed),
+                len(stale),
+                time.time() - sync_start,
+            )
+            self.generation = generation
+
+    def apply_commit(self, upserts, removed_row_ids, removed_user_ids, generation: int):
+        """
+        Apply a change set committed by this process.
+        """
+        with self._lock:
+            if not self.loaded:
+                return
+            self.remove(row_ids=removed_row_ids, user_ids=removed_user_ids)
+            self.upsert(upserts)
+            # Only advance when no other process committed in between; otherwise
+            # leave the generation behind so the next sync pulls their rows.
+            if self.generation is not None and generation == self.generation + 1:
+                self.generation = generation
+
+    def match(self, encoding: np.ndarray, tolerance: float) -> Tuple[Optional[int], Optional[float]]:
+        """
+        Find the closest enrolled encoding to the probe.
+
+        :param encoding: 128-d face encoding of the probe.
+        :param tolerance: Maximum euclidean distance accepted as a match.
+        :return: Tuple of (user_id, distance) for the best match, or
+            (None, distance) when the best match is over tolerance.
+        """
+        return self.match_many([encoding], tolerance)[0]
+
+    def match_many(self, encodings, tolerance: float) -> List[Tuple[Optional[int], Optional[float]]]:
+        """
+        Match several probes against the gallery in one matrix operation.
+
+        :return: One (user_id, distance) tuple per probe, as returned by `match`.
+        """
+        view = self._view
+        probes = np.asarray(encodings, dtype=self._dtype).reshape(-1, ENCODING_DIMENSION)
+        if not len(view.row_ids):
+            return [(None, None)] * len(probes)
+
+        if view.ann is not None and self._ann_index is not None:
+            searched = [self._ann_index.search(view.ann, probe, view.encodings, view.sq_norms) for probe in probes]
+            best = np.array([position for position, _ in searched], dtype=np.int64)
+            sq_distances = np.array([sq_distance for _, sq_distance in searched])
+        else:
+            best = np.empty(len(probes), dtype=np.int64)
+            sq_distances = np.empty(len(probes), dtype=np.float64)
+            probe_sq_norms = np.einsum('ij,ij->i', probes, probes)
+            for start in range(0, len(probes), _MATCH_CHUNK):
+                chunk = slice(start, start + _MATCH_CHUNK)
+                # ||a - b||^2 = ||a||^2 - 2 a.b + ||b||^2, with ||a||^2 precomputed.
+                scores = view.sq_norms[None, :] - 2.0 * (probes[chunk] @ view.encodings.T)
+                best[chunk] = np.argmin(scores, axis=1)
+                sq_distances[chunk] = scores[np.arange(len(scores)), best[chunk]] + probe_sq_norms[chunk]
+
+        results = []
+        for position, sq_distance in zip(best, sq_distances):
+            if position < 0:
+                results.append((None, None))
+                continue
+            distance = float(np.sqrt(max(sq_distance, 0.0)))
+            user_id = int(view.user_ids[position]) if distance <= tolerance else None
+            results.append((user_id, distance))
+        return results
+
+
+gallery = FaceGallery()
+
+
+def ann_index_from_config(config) -> Optional[IVFIndex]:
+    """
+    Build the approximate index selected by GALLERY_INDEX, or None for exact scan.
+    """
+    if config.get('GALLERY_INDEX', 'exact') != 'ivf':
+        return None
+    return IVFIndex(
+        nlist=config.get('IVF_NLIST', 0),
+        nprobe=config.get('IVF_NPROBE', 16),
+        rerank=config.get('IVF_RERANK', 32),
+        min_train_size=config.get('IVF_MIN_TRAIN_SIZE', 10000),
+    )
+
+
+def get_gallery(config) -> FaceGallery:
+    """
+    Return the process-wide gallery, loading it on first use and pulling
+    changes from other processes at most every GALLERY_SYNC_INTERVAL seconds.
+
+    With GALLERY_SOURCE=snapshot the gallery is mapped from the snapshot in
+    GALLERY_SNAPSHOT_DIR and swapped whenever a newer one is published.
+    """
+    snapshot_dir = config.get('GALLERY_SNAPSHOT_DIR') if config.get('GALLERY_SOURCE') == 'snapshot' else None
+    if not gallery.loaded:
+        gallery.ensure_loaded(ann_index=ann_index_from_config(config), snapshot_dir=snapshot_dir)
+        return gallery
+    gallery.sync(interval=config.get('GALLERY_SYNC_INTERVAL', 1.0), snapshot_dir=snapshot_dir)
+    return gallery
+
+
+_CHANGES_KEY = 'face_gallery_changes'
+
+
+def _encoding_row(face_encoding: FaceEncoding):
+    return (
+        face_encoding.id,
+        face_encoding.user_id,
+        face_encoding.encoding,
+        face_encoding.updated_at,
+        face_encoding.encoding_format,
+        face_encoding.encoding_scale,
+    )
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_gallery_changes(session, flush_context):
+    """
+    Record FaceEncoding/User changes of this flush and bump the generation in
+    the same transaction. The session still holds its pre-flush state here.
+    """
+    upserts = []
+    removed_row_ids = []
+    removed_user_ids = []
+    for obj in session.new:
+        if isinstance(obj, FaceEncoding) and obj.user_id is not None and obj.is_active:
+            upserts.append(_encoding_row(obj))
+    for obj in session.dirty:
+        if isinstance(obj, FaceEncoding) and session.is_modified(obj):
+            if obj.user_id is None or not obj.is_active:
+                removed_row_ids.append(obj.id)
+            else:
+                upserts.append(_encoding_row(obj))
+    for obj in session.deleted:
+        if isinstance(obj, FaceEncoding):
+            removed_row_ids.append(obj.id)
+        elif isinstance(obj, User):
+            # The FK cascades in the database, so the ORM never sees the
+            # user's FaceEncoding rows being deleted.
+            removed_user_ids.append(obj.id)
+
+    if not (upserts or removed_row_ids or removed_user_ids):
+        return
+
+    changes = session.info.setdefault(_CHANGES_KEY, {
+        'upserts': [],
+        'removed_row_ids': [],
+        'removed_user_ids': [],
+    })
+    changes['upserts'].extend(upserts)
+    changes['removed_row_ids'].extend(removed_row_ids)
+    changes['removed_user_ids'].extend(removed_user_ids)
+    if 'generation' not in changes:
+        # One bump per transaction, however many flushes it takes.
+        changes['generation'] = GalleryState.bump_generation(session.connection())
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_gallery_changes(session):
+    changes = session.info.pop(_CHANGES_KEY, None)
+    if not changes:
+        return
+    try:
+        gallery.apply_commit(
+            upserts=changes['upserts'],
+            removed_row_ids=changes['removed_row_ids'],
+            removed_user_ids=changes['removed_user_ids'],
+            generation=changes['generation'],
+        )
+    except Exception as e:
+        # The next generation check will pull the rows from the database.
+        logger.error(f"Error applying committed changes to face gallery: {e}")
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_gallery_changes(session):
+    session.info.pop(_CHANGES_KEY, None)
@@ -0,0 +1,247 @@
+import ipaddress
+import logging
+import socket
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from urllib.parse import urlsplit
+
+import requests
+from flask import current_app
+
+from app.face_recognition.engine import get_engine
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class JobStore:
+    """
+    Bounded in-process store of asynchronous recognition jobs.
+
+    Jobs are kept in submission order. Finished jobs expire `ttl` seconds
+    after they complete; when the store is full the oldest finished job is
+    evicted to make room, and a submission is refused only if every stored
+    job is still pending.
+    """
+
+    def __init__(self, max_jobs: int = 1000, ttl: float = 300.0):
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, now: float):
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job['finished_at'] is not None and now - job['finished_at'] > self.ttl
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+        if len(self._jobs) < self.max_jobs:
+            return
+        for job_id, job in self._jobs.items():
+            if job['finished_at'] is not None:
+                del self._jobs[job_id]
+                return
+
+    def create(self, callback_url: Optional[str] = None) -> Optional[str]:
+        """
+        Register a pending job and return its id, or None if the store is full.
+        """
+        now = time.time()
+        with self._lock:
+            self._evict(now)
+            if len(self._jobs) >= self.max_jobs:
+                return None
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {
+                'id': job_id,
+                'status': PENDING,
+                'created_at': now,
+                'finished_at': None,
+                'status_code': None,
+                'result': None,
+                'callback_url': callback_url,
+            }
+            return job_id
+
+    def finish(self, job_id: str, result, status_code: int):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job.update(
+                status=DONE if status_code < 500 else FAILED,
+                finished_at=time.time(),
+                result=result,
+                status_code=status_code,
+            )
+            return dict(job)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """
+        Return a copy of the job, or None if it is unknown or has expired.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job['finished_at'] is not None and time.time() - job['finished_at'] > self.ttl:
+                del self._jobs[job_id]
+                return None
+            return dict(job)
+
+
+def job_response(job: dict) -> dict:
+    """
+    Public view of a job, as returned by the polling endpoint and callbacks.
+    """
+    return {
+        'job_id': job['id'],
+        'status': job['status'],
+        'status_code': job['status_code'],
+        'result': job['result'],
+    }
+
+
+def validate_callback_url(url: str, allowed_hosts=()) -> Optional[str]:
+    """
+    Return why a client-supplied callback URL is refused, or None if it may
+    be posted to. Only http(s) URLs are accepted. With `allowed_hosts`, the
+    host must be one of them; otherwise every address it resolves to must
+    be public, so callbacks cannot reach loopback or internal services.
+    """
+    parsed = urlsplit(url)
+    if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+        return "Callback URL must be an http or https URL"
+    host = parsed.hostname.lower()
+    if allowed_hosts:
+        if host not in {allowed.lower() for allowed in allowed_hosts}:
+            return f"Callback host {host} is not allowed"
+        return None
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, parsed.port or None)}
+    except (socket.gaierror, UnicodeError):
+        return f"Callback host {host} does not resolve"
+    for address in addresses:
+        if not ipaddress.ip_address(address.split('%')[0]).is_global:
+            return f"Callback host {host} resolves to a non-public address"
+    return None
+
+
+def _post_callback(job: dict, timeout: float, allowed_hosts):
+    # Checked again at post time: the host may resolve differently by now.
+    error = validate_callback_url(job['callback_url'], allowed_hosts)
+    if error:
+        logger.error("Not posting result of job %s: %s", job['id'], error)
+        return
+    try:
+        requests.post(
+            job['callback_url'],
+            json=job_response(job),
+            timeout=timeout,
+            allow_redirects=False,
+        )
+    except Exception as e:
+        logger.error("Error posting result of job %s to %s: %s", job['id'], job['callback_url'], e)
+
+
+callback_executor = None
+_callback_executor_lock = threading.Lock()
+
+
+def get_callback_executor(config) -> ThreadPoolExecutor:
+    """
+    Return the process-wide executor posting job callbacks, so a slow
+    callback target never holds a recognition engine thread.
+    """
+    global callback_executor
+    if callback_executor is None:
+        with _callback_executor_lock:
+            if callback_executor is None:
+                callback_executor = ThreadPoolExecutor(
+                    max_workers=config.get('JOB_CALLBACK_WORKERS', 2),
+                    thread_name_prefix='job-callback',
+                )
+    return callback_executor
+
+
+bulk_executor = None
+_bulk_executor_lock = threading.Lock()
+
+
+def get_bulk_executor() -> ThreadPoolExecutor:
+    """
+    Return the process-wide single-thread executor of long-running jobs,
+    such as bulk enrollments, which run one at a time off the engine's
+    threads so they never hold up recognition.
+    """
+    global bulk_executor
+    if bulk_executor is None:
+        with _bulk_executor_lock:
+            if bulk_executor is None:
+                bulk_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='bulk-job')
+    return bulk_executor
+
+
+def submit_job(fn, *args, callback_url: Optional[str] = None, executor: ThreadPoolExecutor = None) -> Optional[str]:
+    """
+    Run a handler returning (data, status_code) on the recognition engine,
+    or on `executor`, without waiting for it. Returns the job id, or None if
+    the store is full. The callback URL must have passed `validate_callback_url`.
+    """
+    config = current_app.config
+    store = get_job_store(config)
+    job_id = store.create(callback_url)
+    if job_id is None:
+        return None
+    callback_executor = get_callback_executor(config) if callback_url else None
+    callback_options = (config.get('JOB_CALLBACK_TIMEOUT', 5), config.get('JOB_CALLBACK_ALLOWED_HOSTS', []))
+
+    def run():
+        try:
+            result, status_code = fn(*args)
+        except Exception as e:
+            logger.error("Error running job %s: %s", job_id, e)
+            result, status_code = {'error': str(e)}, 500
+        job = store.finish(job_id, result, status_code)
+        if job is not None and job['callback_url']:
+            callback_executor.submit(_post_callback, job, *callback_options)
+
+    if executor is None:
+        get_engine().submit(run)
+    else:
+        app = current_app._get_current_object()
+
+        def run_in_app():
+            with app.app_context():
+                run()
+
+        executor.submit(run_in_app)
+    return job_id
+
+
+job_store = None
+_job_store_lock = threading.Lock()
+
+
+def get_job_store(config) -> JobStore:
+    """
+    Return the process-wide job store, creating it from config on first use.
+    """
+    global job_store
+    if job_store is None:
+        with _job_store_lock:
+            if job_store is None:
+                job_store = JobStore(
+                    max_jobs=config.get('JOB_STORE_SIZE', 1000),
+                    ttl=config.get('JOB_TTL', 300),
+                )
+    return job_store
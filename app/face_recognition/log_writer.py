@@ -0,0 +1,209 @@
+import atexit
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy.exc import OperationalError
+
+from app.face_recognition.models import RecognitionLog
+from app.instrumentation import DB_COMMIT, stage
+from model_base import db
+
+logger = logging.getLogger(__name__)
+
+SYNC = 'sync'
+BUFFERED = 'buffered'
+
+
+class RecognitionLogWriter:
+    """
+    Write recognition log rows either synchronously or through a buffer.
+
+    In 'sync' mode every call inserts its rows and commits before returning.
+    In 'buffered' mode rows are stamped with their recognition time and
+    queued in memory. A background thread writes them with one bulk insert
+    once `flush_rows` are waiting, or `flush_interval_ms` after the oldest
+    was queued. Buffered rows are flushed at exit. Rows still buffered when
+    the process is killed are lost, which is the price of the lower commit
+    rate. If a flush fails on a transient database error its rows are kept
+    for the next one, up to `max_buffered_rows`, and the oldest rows are
+    dropped beyond that. Any other failure retries the rows one at a time,
+    and the rows the database still rejects are dropped.
+    """
+
+    def __init__(
+            self,
+            app,
+            mode: str = SYNC,
+            flush_rows: int = 500,
+            flush_interval_ms: int = 1000,
+            max_buffered_rows: int = 100000,
+    ):
+        if mode not in (SYNC, BUFFERED):
+            raise ValueError(f"Unknown recognition log durability mode: {mode}")
+        self.app = app
+        self.mode = mode
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_buffered_rows = max_buffered_rows
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self.written = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.flushes = 0
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='recognition-log-writer', daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def write(self, entries) -> int:
+        """
+        Log (user_id, snapshot_filename, camera_id) entries; returns how many were accepted.
+        """
+        if self.mode == SYNC:
+            count = RecognitionLog.bulk_create_logs(entries)
+            self.written += count
+            return count
+
+        rows = RecognitionLog.build_rows(entries, datetime.utcnow())
+        if not rows:
+            return 0
+        self._ensure_started()
+        with self._lock:
+            self._buffer.extend(rows)
+            overflow = len(self._buffer) - self.max_buffered_rows
+            for _ in range(max(0, overflow)):
+                self._buffer.popleft()
+            buffered = len(self._buffer)
+        if overflow > 0:
+            self.dropped += overflow
+            logger.error("Recognition log buffer full, dropped %d rows", overflow)
+        if buffered >= self.flush_rows:
+            self._wakeup.set()
+        return len(rows)
+
+    def _insert(self, rows):
+        with self.app.app_context(), stage(DB_COMMIT):
+            with db.engine.begin() as connection:
+                RecognitionLog.insert_rows(rows, connection)
+
+    def _requeue(self, rows):
+        """
+        Put rows back ahead of newer ones for the next flush.
+        """
+        with self._lock:
+            self._buffer.extendleft(reversed(rows))
+            overflow = len(self._buffer) - self.max_buffered_rows
+            for _ in range(max(0, overflow)):
+                self._buffer.popleft()
+        self.dropped += max(0, overflow)
+
+    def _insert_one_by_one(self, rows) -> int:
+        """
+        Insert rows in a transaction each after their batch failed, so one
+        bad row (say, a user deleted since) cannot block the others. Rows
+        still failing are dropped and counted; on a transient database
+        error the remaining rows are re-buffered.
+        """
+        written = 0
+        for index, row in enumerate(rows):
+            try:
+                self._insert([row])
+            except OperationalError as e:
+                logger.error("Error writing recognition log rows, keeping %d for the next flush: %s",
+                             len(rows) - index, e)
+                self._requeue(rows[index:])
+                break
+            except Exception as e:
+                self.rejected += 1
+                logger.error("Dropping recognition log row %s: %s", row, e)
+                continue
+            written += 1
+        return written
+
+    def flush(self) -> int:
+        """
+        Write every buffered row in one transaction; returns the number written.
+        """
+        with self._flush_lock:
+            with self._lock:
+                rows = list(self._buffer)
+                self._buffer.clear()
+            if not rows:
+                return 0
+            try:
+                self._insert(rows)
+                written = len(rows)
+            except OperationalError as e:
+                # The database is unreachable or locked; try again next flush.
+                logger.error("Error flushing %d recognition log rows: %s", len(rows), e)
+                self._requeue(rows)
+                return 0
+            except Exception as e:
+                logger.error("Error flushing %d recognition log rows, retrying one by one: %s", len(rows), e)
+                written = self._insert_one_by_one(rows)
+            self.written += written
+            self.flushes += 1
+            return written
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def stats(self) -> dict:
+        return {
+            'mode': self.mode,
+            'buffered': len(self._buffer),
+            'written': self.written,
+            'dropped': self.dropped,
+            'rejected': self.rejected,
+            'flushes': self.flushes,
+        }
+
+    def close(self, timeout: float = 5.0):
+        """
+        Stop the flush thread and write out what is still buffered.
+        """
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._wakeup.set()
+        self._thread.join(timeout)
+        self.flush()
+
+
+log_writer = None
+_log_writer_lock = threading.Lock()
+
+
+def get_log_writer(app=None) -> RecognitionLogWriter:
+    """
+    Return the process-wide log writer, creating it from config on first use.
+    """
+    global log_writer
+    if log_writer is None:
+        with _log_writer_lock:
+            if log_writer is None:
+                app = app if app is not None else current_app._get_current_object()
+                log_writer = RecognitionLogWriter(
+                    app,
+                    mode=app.config.get('RECOGNITION_LOG_DURABILITY', SYNC),
+                    flush_rows=app.config.get('RECOGNITION_LOG_FLUSH_ROWS', 500),
+                    flush_interval_ms=app.config.get('RECOGNITION_LOG_FLUSH_MS', 1000),
+                    max_buffered_rows=app.config.get('RECOGNITION_LOG_MAX_BUFFERED', 100000),
+                )
+    return log_writer
@@ -1,11 +1,17 @@
-from datetime import datetime
+import json
+from datetime import datetime, timedelta
+from typing import Optional
 
 import numpy as np
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index, LargeBinary
+from sqlalchemy import (
+    Boolean, Column, Integer, String, DateTime, Float, ForeignKey, Index, LargeBinary, Text, and_, delete, func, insert,
+    or_, select, update,
+)
 from sqlalchemy.orm import relationship
 
+from app.face_recognition.encoding_format import FORMAT_FLOAT32, decode_vector, encode_vector
 from app.user.models import User
-from model_base import BareBaseModel
+from model_base import BareBaseModel, db
 
 
 class FaceEncoding(BareBaseModel):
@@ -14,20 +20,41 @@ class FaceEncoding(BareBaseModel):
         Integer,
         ForeignKey('user.id', ondelete='CASCADE'),
     )
+    # NULL for rows written before the column existed, which hold raw float64.
+    encoding_format = Column(String(10), nullable=True)
+    encoding_scale = Column(Float, nullable=True)
+    # Compaction deactivates samples its templates stand for; NULL is active.
+    active = Column(Boolean, nullable=True)
+    # A centroid template derived by compaction rather than an enrolled photo.
+    template = Column(Boolean, nullable=True)
 
     __table_args__ = (
         Index('idx_face_encoding_user_id', 'user_id'),
     )
 
-    def get_face_encoding(self) -> np.ndarray:
-        return np.frombuffer(self.encoding, dtype=np.float64)
+    @property
+    def is_active(self) -> bool:
+        return self.active is not False
+
+    def get_face_encoding(self, dtype=np.float32) -> np.ndarray:
+        return decode_vector(self.encoding, self.encoding_format, self.encoding_scale, dtype=dtype)
+
+    def set_face_encoding(self, encoding: np.ndarray, encoding_format: str = FORMAT_FLOAT32):
+        self.encoding, self.encoding_scale = encode_vector(encoding, encoding_format)
+        self.encoding_format = encoding_format
 
     def __repr__(self) -> str:
         return f'<FaceEncoding {self.id}>'
 
     @classmethod
-    def create_encoding(cls, user_id: int, encoding: bytes) -> 'FaceEncoding':
-        face_encoding = cls(user_id=user_id, encoding=encoding)
+    def create_encoding(
+            cls,
+            user_id: int,
+            encoding: np.ndarray,
+            encoding_format: str = FORMAT_FLOAT32,
+    ) -> 'FaceEncoding':
+        face_encoding = cls(user_id=user_id)
+        face_encoding.set_face_encoding(encoding, encoding_format)
         face_encoding.save()
         return face_encoding
 
@@ -35,28 +62,357 @@ class FaceEncoding(BareBaseModel):
     def get_all_encodings(cls):
         return cls.query.all()
 
+    @classmethod
+    def _active(cls):
+        return and_(cls.user_id.isnot(None), or_(cls.active.is_(None), cls.active.is_(True)))
+
+    @classmethod
+    def _encoding_rows(cls):
+        return cls.query.with_entities(
+            cls.id,
+            cls.user_id,
+            cls.encoding,
+            cls.updated_at,
+            cls.encoding_format,
+            cls.encoding_scale,
+        ).filter(cls._active())
+
+    @classmethod
+    def get_all_encoding_rows(cls):
+        """
+        Fetch (id, user_id, encoding, updated_at, encoding_format, encoding_scale)
+        tuples without building ORM objects.
+        """
+        return cls._encoding_rows().all()
+
+    @classmethod
+    def get_changed_encoding_rows(cls, last_id: int, updated_since: Optional[datetime]):
+        """
+        Fetch rows inserted after `last_id` or updated after `updated_since`;
+        every row when `updated_since` is None.
+        """
+        if updated_since is None:
+            return cls._encoding_rows().all()
+        return cls._encoding_rows().filter(
+            or_(cls.id > last_id, cls.updated_at > updated_since),
+        ).all()
+
+    @classmethod
+    def get_encodings_to_migrate(cls, encoding_format: str, after_id: int, limit: int):
+        """
+        Fetch the next batch of rows not yet stored in `encoding_format`.
+        """
+        return cls.query.filter(
+            cls.id > after_id,
+            or_(cls.encoding_format.is_(None), cls.encoding_format != encoding_format),
+        ).order_by(cls.id).limit(limit).all()
+
+    @classmethod
+    def get_all_ids(cls):
+        return [row.id for row in cls.query.with_entities(cls.id).filter(cls._active())]
+
+    @classmethod
+    def get_user_encodings(cls, user_id: int):
+        """
+        Every encoding row of a user, samples and templates, active or not.
+        """
+        return cls.query.filter(cls.user_id == user_id).order_by(cls.id).all()
+
+    @classmethod
+    def count_active_by_user(cls, min_count: int = 1):
+        """
+        (user_id, active encodings) for users with at least `min_count`.
+        """
+        count = func.count(cls.id)
+        return cls.query.with_entities(cls.user_id, count).filter(cls._active()).group_by(
+            cls.user_id,
+        ).having(count >= min_count).order_by(cls.user_id).all()
+
+
+class GalleryState(BareBaseModel):
+    """
+    Single-row generation counter bumped by every committed gallery change, so
+    worker processes can tell when their in-memory gallery is stale.
+    """
+    generation = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self) -> str:
+        return f'<GalleryState {self.generation}>'
+
+    @classmethod
+    def get_generation(cls) -> int:
+        state = cls.query.with_entities(cls.generation).first()
+        return state.generation if state else 0
+
+    @classmethod
+    def bump_generation(cls, connection) -> int:
+        """
+        Increment the generation inside the caller's transaction and return it.
+        """
+        table = cls.__table__
+        now = datetime.utcnow()
+        result = connection.execute(
+            update(table).values(generation=table.c.generation + 1, updated_at=now)
+        )
+        if not result.rowcount:
+            connection.execute(
+                table.insert().values(generation=1, created_at=now, updated_at=now)
+            )
+        return connection.execute(select(table.c.generation)).scalar()
+
 
 class RecognitionLog(BareBaseModel):
     timestamp = Column(DateTime, default=datetime.utcnow)
     snapshot_filename = Column(String(255))
     user_id = Column(Integer, ForeignKey('user.id'), nullable=True)
+    camera_id = Column(Integer, ForeignKey('camera.id', ondelete='SET NULL'), nullable=True)
+    # A debounced row stands for `hit_count` recognitions from `timestamp`
+    # (the first) to `last_seen`; NULL on rows written before debouncing.
+    last_seen = Column(DateTime, nullable=True)
+    hit_count = Column(Integer, nullable=True)
     user = relationship("User", backref="recognition_logs")
     __table_args__ = (
         Index('idx_recognition_log_user_id', 'user_id'),
+        # Keyset pagination walks (timestamp, id) newest first.
+        Index('idx_recognition_log_timestamp_id', 'timestamp', 'id'),
+        Index('idx_recognition_log_camera_timestamp', 'camera_id', 'timestamp'),
     )
 
     def __repr__(self) -> str:
         return f'<RecognitionLog {self.id}>'
 
     @classmethod
-    def create_log(cls, user_id: int, snapshot_filename: str) -> 'RecognitionLog':
+    def create_log(cls, user_id: int, snapshot_filename: str, camera_id: int = None) -> 'RecognitionLog':
         log = cls(
             user_id=user_id,
             snapshot_filename=snapshot_filename,
+            camera_id=camera_id,
         )
         log.save()
         return log
 
+    @classmethod
+    def build_rows(cls, entries, timestamp: datetime = None):
+        """
+        Insert parameters for (user_id, snapshot_filename, camera_id) entries
+        recognized at `timestamp`. Debounced entries carry their own
+        (first_seen, last_seen, hit_count) after the camera_id.
+        """
+        timestamp = timestamp or datetime.utcnow()
+        rows = []
+        for user_id, snapshot_filename, camera_id, *window in entries:
+            first_seen, last_seen, hit_count = window or (timestamp, timestamp, 1)
+            rows.append({
+                'user_id': user_id,
+                'snapshot_filename': snapshot_filename,
+                'camera_id': camera_id,
+                'timestamp': first_seen,
+                'last_seen': last_seen,
+                'hit_count': hit_count,
+                'created_at': timestamp,
+                'updated_at': timestamp,
+            })
+        return rows
+
+    @classmethod
+    def insert_rows(cls, rows, connection) -> int:
+        """
+        Insert rows built by `build_rows` in one statement on `connection`,
+        leaving the transaction to the caller.
+        """
+        if rows:
+            connection.execute(insert(cls), rows)
+        return len(rows)
+
+    @classmethod
+    def bulk_create_logs(cls, entries) -> int:
+        """
+        Insert many (user_id, snapshot_filename, camera_id) entries in one statement and commit.
+        """
+        rows = cls.build_rows(entries)
+        if rows:
+            cls.insert_rows(rows, db.session)
+            db.session.commit()
+        return len(rows)
+
+    @classmethod
+    def _log_query(
+            cls,
+            user_id: int = None,
+            camera_id: int = None,
+            recognized: bool = None,
+            since: datetime = None,
+            until: datetime = None,
+    ):
+        """
+        Select the columns the log APIs return, with the recognized user's
+        name. The outer join keeps unknown faces.
+        """
+        query = (
+            select(
+                cls.id,
+                cls.timestamp,
+                cls.snapshot_filename,
+                cls.user_id,
+                cls.camera_id,
+                cls.last_seen,
+                cls.hit_count,
+                User.first_name,
+                User.last_name,
+            )
+            .outerjoin(User, cls.user_id == User.id)
+        )
+        if user_id is not None:
+            query = query.where(cls.user_id == user_id)
+        if camera_id is not None:
+            query = query.where(cls.camera_id == camera_id)
+        if recognized is not None:
+            query = query.where(cls.user_id.isnot(None) if recognized else cls.user_id.is_(None))
+        if since is not None:
+            query = query.where(cls.timestamp >= since)
+        if until is not None:
+            query = query.where(cls.timestamp < until)
+        return query
+
+    @classmethod
+    def get_logs_page(cls, limit: int, before: tuple = None, **filters):
+        """
+        One page of logs, newest first. `before` is the (timestamp, id) of
+        the last row of the previous page; `filters` as for `_log_query`.
+
+        :return: (rows, has_more)
+        """
+        query = cls._log_query(**filters)
+        if before is not None:
+            before_timestamp, before_id = before
+            query = query.where(or_(
+                cls.timestamp < before_timestamp,
+                and_(cls.timestamp == before_timestamp, cls.id < before_id),
+            ))
+        rows = db.session.execute(
+            query.order_by(cls.timestamp.desc(), cls.id.desc()).limit(limit + 1)
+        ).all()
+        return rows[:limit], len(rows) > limit
+
+    @classmethod
+    def iter_logs(cls, batch_size: int = 1000, **filters):
+        """
+        Yield every matching log oldest first, fetching `batch_size` rows at
+        a time through a server-side cursor where the driver supports one.
+        """
+        query = cls._log_query(**filters).order_by(cls.timestamp, cls.id)
+        result = db.session.execute(query.execution_options(yield_per=batch_size))
+        try:
+            for row in result:
+                yield row
+        finally:
+            result.close()
+
     @classmethod
     def get_all_logs_with_users(cls):
         return cls.query.join(User, cls.user_id == User.id).all()
+
+
+class BookmarkOutbox(BareBaseModel):
+    """
+    NX Witness bookmarks waiting to be sent. Recognition only inserts rows;
+    the bookmark dispatcher claims due rows, sends them and records the outcome.
+    """
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+
+    payload = Column(Text, nullable=False)
+    status = Column(String(10), nullable=False, default=PENDING)
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+    last_error = Column(String(255), nullable=True)
+    __table_args__ = (
+        Index('idx_bookmark_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+
+    def __repr__(self) -> str:
+        return f'<BookmarkOutbox {self.id}>'
+
+    @classmethod
+    def enqueue(cls, payloads) -> int:
+        """
+        Insert one pending row per bookmark payload in one statement and commit.
+        """
+        now = datetime.utcnow()
+        rows = [
+            {
+                'payload': json.dumps(payload),
+                'status': cls.PENDING,
+                'attempts': 0,
+                'next_attempt_at': now,
+                'created_at': now,
+                'updated_at': now,
+            }
+            for payload in payloads
+        ]
+        if rows:
+            db.session.execute(insert(cls), rows)
+            db.session.commit()
+        return len(rows)
+
+    @classmethod
+    def claim_due(cls, limit: int, lease_seconds: float):
+        """
+        Claim up to `limit` due rows by pushing their next attempt past the
+        lease, so another dispatcher skips them and a crashed one's rows are
+        retried once the lease runs out. Returns (id, payload, attempts) tuples.
+        """
+        now = datetime.utcnow()
+        due = db.session.execute(
+            select(cls.id, cls.payload, cls.attempts)
+            .where(cls.status == cls.PENDING, cls.next_attempt_at <= now)
+            .order_by(cls.id)
+            .limit(limit)
+        ).all()
+        lease_until = now + timedelta(seconds=lease_seconds)
+        claimed = []
+        for row_id, payload, attempts in due:
+            result = db.session.execute(
+                update(cls)
+                .where(cls.id == row_id, cls.status == cls.PENDING, cls.next_attempt_at <= now)
+                .values(next_attempt_at=lease_until)
+            )
+            if result.rowcount:
+                claimed.append((row_id, json.loads(payload), attempts))
+        db.session.commit()
+        return claimed
+
+    @classmethod
+    def mark_sent(cls, ids):
+        now = datetime.utcnow()
+        db.session.execute(
+            update(cls).where(cls.id.in_(ids)).values(status=cls.SENT, sent_at=now, updated_at=now)
+        )
+        db.session.commit()
+
+    @classmethod
+    def mark_retry(cls, ids, attempts: int, delay_seconds: float, error: str, give_up: bool):
+        """
+        Record a failed attempt and schedule the next one, or give up.
+        """
+        now = datetime.utcnow()
+        db.session.execute(
+            update(cls).where(cls.id.in_(ids)).values(
+                status=cls.FAILED if give_up else cls.PENDING,
+                attempts=attempts,
+                next_attempt_at=now + timedelta(seconds=delay_seconds),
+                last_error=error[:255],
+                updated_at=now,
+            )
+        )
+        db.session.commit()
+
+    @classmethod
+    def prune_sent(cls, older_than: datetime) -> int:
+        result = db.session.execute(
+            delete(cls).where(cls.status == cls.SENT, cls.sent_at < older_than)
+        )
+        db.session.commit()
+        return result.rowcount
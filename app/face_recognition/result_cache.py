@@ -0,0 +1,166 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import List, NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+from flask import current_app
+
+from app.face_recognition.detection import Box, DetectionSettings
+
+
+class CachedResult(NamedTuple):
+    faces: List[Tuple[Box, np.ndarray]]
+    user_ids: List[Optional[int]]
+    dhash: Optional[int]
+    settings: DetectionSettings
+    expires_at: float
+
+
+def dhash(image_bytes: bytes) -> Optional[int]:
+    """
+    64-bit difference hash of an encoded image: whether each pixel of a
+    9x8 grey thumbnail is brighter than its right neighbour. Re-encoded,
+    resized or slightly recompressed copies of a frame land within a few
+    bits of each other. None if the image cannot be decoded.
+    """
+    # The reduced decode skips most of the IDCT work on JPEGs.
+    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if image is None:
+        return None
+    thumbnail = cv2.resize(image, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (thumbnail[:, 1:] > thumbnail[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+class ResultCache:
+    """
+    Bounded LRU cache of recognition results for repeated uploads.
+
+    Entries hold the face locations and encodings found in an image, and
+    the users they matched, keyed by the SHA-256 of the image bytes and the
+    detection settings used. With `perceptual` on, a miss on the exact key
+    falls back to the entry whose dHash is within `max_distance` bits,
+    which catches a gateway re-encoding the same still frame.
+
+    Entries expire `ttl` seconds after they were stored, the least recently
+    used entry is evicted beyond `max_entries`, and the whole cache is
+    dropped when the gallery token (generation and version) changes, since
+    enrolments and deletions change the matches.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 30.0, perceptual: bool = False, max_distance: int = 4):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.perceptual = perceptual
+        self.max_distance = max_distance
+        self._entries = OrderedDict()
+        self._gallery_token = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.perceptual_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _check_token(self, gallery_token: tuple):
+        if gallery_token != self._gallery_token:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._gallery_token = gallery_token
+
+    def _find_similar(self, image_hash: int, settings: DetectionSettings, now: float):
+        best, best_distance = None, self.max_distance + 1
+        for key, entry in self._entries.items():
+            if entry.dhash is None or entry.settings != settings or entry.expires_at <= now:
+                continue
+            distance = bin(entry.dhash ^ image_hash).count('1')
+            if distance < best_distance:
+                best, best_distance = key, distance
+        return best
+
+    def get(self, image_bytes: bytes, settings: DetectionSettings, gallery_token: tuple):
+        """
+        Return the cached (faces, user_ids) for the image, or None.
+        """
+        key = (hashlib.sha256(image_bytes).digest(), settings)
+        now = time.monotonic()
+        with self._lock:
+            self._check_token(gallery_token)
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= now:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.faces, entry.user_ids
+            if not self.perceptual:
+                self.misses += 1
+                return None
+        # Hash outside the lock; it decodes the image.
+        image_hash = dhash(image_bytes)
+        with self._lock:
+            similar = self._find_similar(image_hash, settings, now) if image_hash is not None else None
+            if similar is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(similar)
+            self.perceptual_hits += 1
+            entry = self._entries[similar]
+            return entry.faces, entry.user_ids
+
+    def put(self, image_bytes: bytes, settings: DetectionSettings, gallery_token: tuple, faces, user_ids):
+        key = (hashlib.sha256(image_bytes).digest(), settings)
+        image_hash = dhash(image_bytes) if self.perceptual else None
+        entry = CachedResult(
+            list(faces), list(user_ids), image_hash, settings, time.monotonic() + self.ttl,
+        )
+        with self._lock:
+            self._check_token(gallery_token)
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.perceptual_hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'perceptual_hits': self.perceptual_hits,
+            'misses': self.misses,
+            'hit_ratio': round((self.hits + self.perceptual_hits) / lookups, 4) if lookups else None,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
+
+
+result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache(config=None) -> Optional[ResultCache]:
+    """
+    Return the process-wide result cache, creating it from config on first
+    use, or None if RESULT_CACHE_SIZE disables it.
+    """
+    global result_cache
+    if result_cache is None:
+        config = config if config is not None else current_app.config
+        if config.get('RESULT_CACHE_SIZE', 0) <= 0:
+            return None
+        with _result_cache_lock:
+            if result_cache is None:
+                result_cache = ResultCache(
+                    max_entries=config['RESULT_CACHE_SIZE'],
+                    ttl=config.get('RESULT_CACHE_TTL', 30.0),
+                    perceptual=config.get('RESULT_CACHE_PERCEPTUAL', False),
+                    max_distance=config.get('RESULT_CACHE_PERCEPTUAL_DISTANCE', 4),
+                )
+    return result_cache
@@ -1,17 +1,54 @@
 import logging
-from concurrent.futures import ThreadPoolExecutor
 
-from flask import Blueprint, request, current_app
+from flask import Blueprint, request, current_app, url_for
 
-from app.face_recognition.services import FaceRecognitionHandler, handle_camera_feed
-from app.utils import format_response
+from app.camera.services import handle_camera_feed, process_camera_feed
+from app.face_recognition.engine import get_engine
+from app.face_recognition.jobs import get_job_store, job_response, submit_job, validate_callback_url
+from app.face_recognition.result_cache import get_result_cache
+from app.face_recognition.services import FaceRecognitionHandler
+from app.utils import ArchiveTooLarge, format_response, read_image_archive
+
+logger = logging.getLogger(__name__)
 
 face_recognition_bp = Blueprint('face_recognition', __name__)
 
-logging.basicConfig(level=logging.INFO)
 
-max_workers = current_app.config.get('MAX_WORKERS', 5)
-executor = ThreadPoolExecutor(max_workers=max_workers)
+def _async_requested() -> bool:
+    """
+    Whether the client asked for a job id instead of waiting for the result.
+    """
+    value = request.args.get('async', request.form.get('async', ''))
+    return value.lower() in ['true', '1', 'yes']
+
+
+def _accept_job(fn, *args):
+    """
+    Queue `fn` as an asynchronous job and answer 202 with its id, 400 when
+    the callback URL is refused, or 503 when the job store is full of
+    pending jobs.
+    """
+    callback_url = request.form.get('callbackUrl', request.args.get('callbackUrl')) or None
+    if callback_url:
+        error = validate_callback_url(callback_url, current_app.config.get('JOB_CALLBACK_ALLOWED_HOSTS', []))
+        if error:
+            return format_response(
+                data={"error": error},
+                message="Bad Request",
+                status_code=400,
+            )
+    job_id = submit_job(fn, *args, callback_url=callback_url)
+    if job_id is None:
+        return format_response(
+            data={"error": "Too many pending jobs"},
+            message="Service Unavailable",
+            status_code=503,
+        )
+    return format_response(
+        data={"job_id": job_id, "status_url": url_for('face_recognition.get_job', job_id=job_id)},
+        message="Face recognition accepted",
+        status_code=202,
+    )
 
 
 @face_recognition_bp.route('/api/receive', methods=['POST'])
@@ -28,9 +65,11 @@ def face_recognition_route():
 
     file = request.files['faceImage']
     file_bytes = file.read()
+    if _async_requested():
+        return _accept_job(FaceRecognitionHandler().handle_face_recognition, file_bytes)
 
     try:
-        future = executor.submit(lambda: FaceRecognitionHandler().handle_face_recognition(file_bytes))
+        future = get_engine().submit(FaceRecognitionHandler().handle_face_recognition, file_bytes)
         response_data, status_code = future.result()
         return format_response(
             data=response_data,
@@ -38,7 +77,70 @@ def face_recognition_route():
             status_code=status_code,
         )
     except Exception as e:
-        logging.error(f"Error processing face recognition request: {e}")
+        logger.error(f"Error processing face recognition request: {e}")
+        return format_response(
+            data={"error": "Internal Server Error"},
+            message="Internal Server Error",
+            status_code=500,
+        )
+
+
+@face_recognition_bp.route('/api/receive/batch', methods=['POST'])
+def face_recognition_batch_route():
+    """
+    Handle a batch of face images sent as several `faceImage` parts and/or
+    one zip/tar `archive` part; results are returned per image.
+    """
+    max_images = current_app.config.get('MAX_BATCH_IMAGES', 64)
+    too_many = format_response(
+        data={"error": f"At most {max_images} images per batch"},
+        message="Payload Too Large",
+        status_code=413,
+    )
+    files = request.files.getlist('faceImage')
+    if len(files) > max_images:
+        return too_many
+    images = [(file.filename, file.read()) for file in files]
+    if 'archive' in request.files:
+        try:
+            images.extend(read_image_archive(
+                request.files['archive'].read(),
+                max_images=max_images - len(images),
+                max_image_bytes=current_app.config.get('MAX_BATCH_IMAGE_BYTES'),
+            ))
+        except ArchiveTooLarge as e:
+            return format_response(
+                data={"error": str(e)},
+                message="Payload Too Large",
+                status_code=413,
+            )
+        except ValueError as e:
+            return format_response(
+                data={"error": str(e)},
+                message="Bad Request",
+                status_code=400,
+            )
+
+    if not images:
+        return format_response(
+            data={"error": "No face image provided"},
+            message="Bad Request",
+            status_code=400,
+        )
+
+    if _async_requested():
+        return _accept_job(FaceRecognitionHandler().handle_batch_face_recognition, images)
+
+    try:
+        future = get_engine().submit(FaceRecognitionHandler().handle_batch_face_recognition, images)
+        response_data, status_code = future.result()
+        return format_response(
+            data=response_data,
+            message="Batch face recognition completed",
+            status_code=status_code,
+        )
+    except Exception as e:
+        logger.error(f"Error processing batch face recognition request: {e}")
         return format_response(
             data={"error": "Internal Server Error"},
             message="Internal Server Error",
@@ -60,19 +162,58 @@ def recognize_faces_from_camera(camera_id):
 
     file = request.files['faceImage']
     file_bytes = file.read()
+    if _async_requested():
+        return _accept_job(process_camera_feed, camera_id, file_bytes)
 
     try:
-        future = executor.submit(lambda: handle_camera_feed(camera_id, file_bytes))
-        response_data, status_code = future.result()
+        response_data, status_code = handle_camera_feed(camera_id, file_bytes).result()
         return format_response(
             data=response_data,
             message="Face recognition completed",
             status_code=status_code,
         )
     except Exception as e:
-        logging.error(f"Error processing face recognition request from camera {camera_id}: {e}")
+        logger.error(f"Error processing face recognition request from camera {camera_id}: {e}")
         return format_response(
             data={"error": "Internal Server Error"},
             message="Internal Server Error",
             status_code=500,
         )
+
+
+@face_recognition_bp.route('/api/result-cache', methods=['GET'])
+def get_result_cache_stats():
+    """
+    Hit and miss counters of the upload result cache.
+    """
+    cache = get_result_cache(current_app.config)
+    if cache is None:
+        return format_response(
+            data={"error": "Result cache is disabled"},
+            message="Not Found",
+            status_code=404,
+        )
+    return format_response(
+        data=cache.stats(),
+        message="Result cache statistics retrieved successfully",
+        status_code=200,
+    )
+
+
+@face_recognition_bp.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    Poll an asynchronous recognition job.
+    """
+    job = get_job_store(current_app.config).get(job_id)
+    if job is None:
+        return format_response(
+            data={"error": "Job not found"},
+            message="Not Found",
+            status_code=404,
+        )
+    return format_response(
+        data=job_response(job),
+        message="Job retrieved successfully",
+        status_code=200,
+    )
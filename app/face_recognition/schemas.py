@@ -1,7 +1,21 @@
-from typing import Optional
+from typing import List, Optional
 from pydantic import BaseModel
 
 
+class FaceBox(BaseModel):
+    top: int
+    right: int
+    bottom: int
+    left: int
+
+
+class RecognizedFace(BaseModel):
+    box: FaceBox
+    message: str
+    user: Optional[str]
+
+
 class FaceRecognitionResponse(BaseModel):
     message: str
     user: Optional[str]
+    faces: List[RecognizedFace] = []
@@ -1,162 +1,349 @@
-import io
-import json
 import logging
-import os
 import time
-from datetime import datetime, timezone
 
-import face_recognition as face_rec
-import requests
+import cv2
+import numpy as np
 from flask import current_app
 from pydantic import ValidationError
-from werkzeug.datastructures import FileStorage
 
-from app.face_recognition.models import FaceEncoding, RecognitionLog
-from app.face_recognition.schemas import FaceRecognitionResponse
+from app.camera.models import Camera
+from app.camera.motion import MotionGate, MotionSettings, get_motion_gate
+from app.camera.tracking import FaceTracker, Identity
+from app.face_recognition.bookmarks import enqueue_bookmarks
+from app.face_recognition.capture_writer import save_capture
+from app.face_recognition.debounce import get_debouncer
+from app.face_recognition.detection import DetectionSettings
+from app.face_recognition.engine import get_engine
+from app.face_recognition.gallery import get_gallery
+from app.face_recognition.log_writer import get_log_writer
+from app.face_recognition.models import RecognitionLog
+from app.face_recognition.result_cache import get_result_cache
+from app.face_recognition.schemas import FaceBox, FaceRecognitionResponse, RecognizedFace
+from app.instrumentation import stage
+from app.logging_setup import sampled
 from app.user.models import User
 
+logger = logging.getLogger(__name__)
+
 
 class FaceRecognitionHandler:
-    def __init__(self):
-        pass
+    def __init__(self, camera_id=None):
+        self.camera_id = camera_id
+
+    def _camera(self):
+        return Camera.get_camera_by_id(self.camera_id) if self.camera_id is not None else None
+
+    def _detection_settings(self, camera=None) -> DetectionSettings:
+        """
+        Detection settings for this handler's camera, or the app defaults.
+        """
+        return DetectionSettings.from_config(current_app.config, camera or self._camera())
 
     @staticmethod
-    def _process_face_image(file):
-        """
-        Process the uploaded face image and extract face encoding.
-        """
-        timestamp = time.strftime('%Y%m%d_%H%M%S')
-        filename = f"{timestamp}.jpg"
-        file_path = os.path.join(current_app.config['CAPTURED_FACES_PATH'], filename)
-        file.save(file_path)
-        logging.info(
-            "Image saved at %s to %s",
-            datetime.now(timezone.utc),
-            file_path,
-        )
+    def _process_face_image(file_bytes: bytes, detection_settings: DetectionSettings):
+        """
+        Decode the uploaded image in memory and extract the location and
+        encoding of every face in it.
+        """
         load_image_start = time.time()
-        image = face_rec.load_image_file(file_path)
-        face_encodings = face_rec.face_encodings(image)
+        faces = get_engine(current_app.config).encode_image(file_bytes, detection_settings)
         load_image_end = time.time()
-        logging.info(
-            "Image loaded and encoded in %f seconds",
+        logger.debug(
+            "Image decoded and %d faces encoded in %f seconds",
+            len(faces),
             load_image_end - load_image_start,
         )
-        if not face_encodings:
-            return None, filename
-
-        encoding = face_encodings[0]
-        return encoding, filename
+        return faces
 
     @staticmethod
     def _recognize_face(encoding):
         """
-        Recognize the face by comparing with known encodings.
+        Recognize the face by matching it against the in-memory gallery.
         """
-        known_faces = FaceEncoding.get_all_encodings()
-        known_encodings = {face.user_id: face.get_face_encoding() for face in known_faces}
+        return FaceRecognitionHandler._recognize_faces([encoding])[0]
 
-        for user_id, known_encoding in known_encodings.items():
-            compare_start = time.time()
-            matches = face_rec.compare_faces([known_encoding], encoding)
-            compare_end = time.time()
-            logging.info(
-                "Face comparison for user %d took %f seconds",
-                user_id,
+    @staticmethod
+    def _recognize_faces(encodings):
+        """
+        Recognize several faces with one gallery query and one user lookup.
+        """
+        if not encodings:
+            return []
+        compare_start = time.time()
+        with stage('match'):
+            matches = get_gallery(current_app.config).match_many(
+                encodings,
+                tolerance=current_app.config.get('FACE_MATCH_TOLERANCE', 0.6),
+            )
+        compare_end = time.time()
+        # Per-comparison detail is sampled: one line per request adds up at
+        # camera frame rates.
+        if logger.isEnabledFor(logging.DEBUG) and sampled(current_app.config.get('LOG_MATCH_SAMPLE_RATE', 0.01)):
+            logger.debug(
+                "Gallery match of %d faces took %f seconds (best distances: %s)",
+                len(encodings),
                 compare_end - compare_start,
+                [distance for _, distance in matches],
             )
-            if True in matches:
-                return User.get_user_by_id(user_id)
-
-        return None
+        with stage('lookup'):
+            users = User.get_users_by_ids(user_id for user_id, _ in matches if user_id is not None)
+        return [users.get(user_id) if user_id is not None else None for user_id, _ in matches]
 
     @staticmethod
-    def _create_recognition_log(user, filename):
+    def _create_recognition_log(user, filename, camera_id=None):
         """
         Create a recognition log entry in the database.
         """
         user_id = user.id if user else None
-        return RecognitionLog.create_log(user_id=user_id, snapshot_filename=filename)
+        return RecognitionLog.create_log(user_id=user_id, snapshot_filename=filename, camera_id=camera_id)
 
-    @staticmethod
-    def _create_nx_bookmark(user, filename):
-        """
-        Create a bookmark in NX Witness for the recognized face.
-        """
-        now_utc = int(time.time() * 1000)  # Convert current time to milliseconds
-        payload = {
-            "serverId": current_app.config['NX_SERVER_ID'],
-            "name": "Face Recognized",
-            "description": f"{user.first_name} {user.last_name}" if user else "Unknown",
-            "startTimeMs": now_utc,
-            "durationMs": 1000,
-            "tags": ["Face Recognition"],
-            "creationTimeMs": now_utc
-        }
-        headers = {
-            "Content-Type": "application/json"
-        }
+    def _recognize_and_log(self, captures, users=None):
+        """
+        Match every face of every capture in one gallery query, write one log
+        row per face in one insert and build the response for each capture.
 
-        try:
-            logging.debug("Sending bookmark request to NX Witness")
-            response = requests.post(
-                url=current_app.config['NX_WITNESS_URL'].format(deviceId=current_app.config['NX_DEVICE_ID']),
-                headers=headers,
-                data=json.dumps(payload),
-                auth=current_app.config['NX_WITNESS_AUTH'],
-                timeout=10,
-                verify=False,
-                allow_redirects=False
-            )
+        :param captures: List of (faces, snapshot), faces being the
+            (location, encoding) pairs returned by `_process_face_image`
+            and snapshot the encoded image, or a callable returning it.
+        :param users: The users of all faces, in order, when they are
+            already known, e.g. from the result cache.
+        :return: One response dict per capture.
+        """
+        if users is None:
+            users = self._recognize_faces([encoding for faces, _ in captures for _, encoding in faces])
+        users = iter(users)
+        recognized = [
+            [(location, next(users), encoding) for location, encoding in faces]
+            for faces, _ in captures
+        ]
+        self._log_recognitions(recognized, [snapshot for _, snapshot in captures])
+        return [self._build_response([(location, user) for location, user, _ in faces]) for faces in recognized]
 
-            if response.status_code == 307:
-                redirected_url = response.headers['Location']
-                response = requests.post(
-                    url=redirected_url,
-                    headers=headers,
-                    data=json.dumps(payload),
-                    auth=current_app.config['NX_WITNESS_AUTH'],
-                    timeout=10,
-                    verify=False
-                )
+    def _log_recognitions(self, recognized, snapshots):
+        """
+        Save the snapshots, write one log row per face and queue the NX
+        Witness bookmarks. With debouncing, faces are merged into their
+        sighting windows instead, which are logged when they close, and
+        only the sightings that open a window are bookmarked.
 
-            if response.status_code == 200:
-                logging.info("Bookmark created successfully: %s", response.json())
+        :param recognized: Per capture, its (location, user, encoding) triples.
+        :param snapshots: Per capture, its encoded image, or a callable returning it.
+        """
+        with stage('log'):
+            debouncer = get_debouncer()
+            if debouncer is not None:
+                users = []
+                for faces, snapshot in zip(recognized, snapshots):
+                    users.extend(debouncer.observe(self.camera_id, faces, snapshot))
             else:
-                logging.error(
-                    "Failed to create bookmark: %d, %s",
-                    response.status_code,
-                    response.text,
+                filenames = [save_capture(snapshot() if callable(snapshot) else snapshot) for snapshot in snapshots]
+                get_log_writer().write(
+                    (user.id if user else None, filename, self.camera_id)
+                    for faces, filename in zip(recognized, filenames)
+                    for _, user, _ in faces
                 )
-        except Exception as e:
-            logging.error("Exception while creating bookmark: %s", e)
+                users = [user for faces in recognized for _, user, _ in faces]
+
+        if users and current_app.config.get('USE_NX_WITNESS', False):
+            with stage('bookmark'):
+                enqueue_bookmarks(users)
+
+    @staticmethod
+    def _build_response(faces):
+        """
+        Build the response for one image from its (location, user) pairs.
+        """
+        recognized_faces = []
+        for (top, right, bottom, left), user in faces:
+            recognized_faces.append(RecognizedFace(
+                box=FaceBox(top=top, right=right, bottom=bottom, left=left),
+                message="Face recognized" if user else "Face not recognized",
+                user=f"{user.first_name} {user.last_name}" if user else None,
+            ))
+        names = [face.user for face in recognized_faces if face.user]
+        return FaceRecognitionResponse(
+            message="Face recognized" if names else "Face not recognized",
+            user=names[0] if names else None,
+            faces=recognized_faces,
+        ).dict()
+
+    def _cached_recognition(self, file_bytes: bytes, detection_settings: DetectionSettings):
+        """
+        Faces and matched users of an upload, from the result cache when
+        the same (or, with perceptual hashing, a near-identical) image was
+        recognized recently against the current gallery.
+        """
+        cache = get_result_cache(current_app.config)
+        if cache is None:
+            faces = self._process_face_image(file_bytes, detection_settings)
+            return faces, self._recognize_faces([encoding for _, encoding in faces])
+
+        gallery = get_gallery(current_app.config)
+        gallery_token = (gallery.generation, gallery.version)
+        cached = cache.get(file_bytes, detection_settings, gallery_token)
+        if cached is not None:
+            faces, user_ids = cached
+            users = User.get_users_by_ids(user_id for user_id in user_ids if user_id is not None)
+            return faces, [users.get(user_id) if user_id is not None else None for user_id in user_ids]
+
+        faces = self._process_face_image(file_bytes, detection_settings)
+        users = self._recognize_faces([encoding for _, encoding in faces])
+        cache.put(file_bytes, detection_settings, gallery_token, faces, [user.id if user else None for user in users])
+        return faces, users
 
     def handle_face_recognition(self, file_bytes: bytes):
         """
         Main handler for processing face recognition requests.
         """
         try:
-            file = FileStorage(stream=io.BytesIO(file_bytes), filename='image.jpg')
-            encoding, filename = self._process_face_image(file)
-            if encoding is None:
+            faces, users = self._cached_recognition(file_bytes, self._detection_settings())
+            if not faces:
                 return {"error": "No face found in the image"}, 400
 
-            user = self._recognize_face(encoding)
-            self._create_recognition_log(user, filename)
-
-            if current_app.config.get('USE_NX_WITNESS', False):
-                self._create_nx_bookmark(user, filename)
-
-            if user:
-                return FaceRecognitionResponse(
-                    message="Face recognized",
-                    user=f"{user.first_name} {user.last_name}"
-                ).dict(), 200
-            else:
-                return {'message': 'Face not recognized'}, 200
+            return self._recognize_and_log([(faces, file_bytes)], users)[0], 200
 
         except ValidationError as e:
             return {'error': str(e)}, 400
 
         except Exception as e:
             return {'error': str(e)}, 500
+
+    def _recognize_tracked_frame(self, frame, rgb_frame, detection_settings: DetectionSettings,
+                                 tracker: FaceTracker, regions=None, snapshot: bytes = None):
+        """
+        Detect faces, continue their tracks and encode and match only the
+        tracks that are new or due for re-verification. A sighting is logged
+        when its track starts or its identity changes.
+        """
+        engine = get_engine(current_app.config)
+        now = time.time()
+        tracks = tracker.update(engine.detect_frame(rgb_frame, detection_settings, regions), now, regions)
+        if not tracks:
+            return None, 204
+
+        stale = [track for track in tracks if tracker.needs_verification(track, now)]
+        to_log = []
+        if stale:
+            faces = engine.encode_frame(rgb_frame, detection_settings, boxes=[track.box for track in stale])
+            users = self._recognize_faces([encoding for _, encoding in faces])
+            for track, user, (_, encoding) in zip(stale, users, faces):
+                if tracker.verify(track, Identity.from_user(user), now):
+                    to_log.append((track.box, track.identity, encoding))
+        if to_log:
+            self._log_recognitions([to_log], [snapshot or (lambda: cv2.imencode('.jpg', frame)[1].tobytes())])
+        return self._build_response([(track.box, track.identity) for track in tracks]), 200
+
+    def handle_frame_recognition(
+            self,
+            frame: np.ndarray,
+            detection_settings: DetectionSettings = None,
+            tracker: FaceTracker = None,
+            motion_gate: MotionGate = None,
+            snapshot: bytes = None,
+    ):
+        """
+        Recognize the faces of a decoded BGR frame, as read by OpenCV from a
+        camera stream. Frames without faces are neither saved nor logged.
+        With a tracker, faces already identified on earlier frames of the
+        camera reuse their identity instead of being encoded again. With a
+        motion gate, unchanged frames skip detection and changed ones are
+        only searched where they changed.
+
+        :param snapshot: The frame's original encoded image, saved instead
+            of re-encoding the frame.
+        :return: (response, 200), or (None, 204) if the frame has no face.
+        """
+        try:
+            regions = None
+            if motion_gate is not None:
+                regions = motion_gate.check(frame)
+                if regions == MotionGate.SKIP:
+                    return self._unchanged_frame_response(tracker, motion_gate)
+            detection_settings = detection_settings or self._detection_settings()
+            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            if tracker is not None:
+                return self._recognize_tracked_frame(frame, rgb_frame, detection_settings, tracker, regions, snapshot)
+            faces = get_engine(current_app.config).encode_frame(rgb_frame, detection_settings, regions=regions)
+            response = None
+            if faces:
+                snapshot = snapshot or (lambda: cv2.imencode('.jpg', frame)[1].tobytes())
+                response = self._recognize_and_log([(faces, snapshot)])[0]
+            if motion_gate is not None:
+                motion_gate.last_response = response
+            return (response, 200) if response is not None else (None, 204)
+
+        except Exception as e:
+            return {'error': str(e)}, 500
+
+    def _unchanged_frame_response(self, tracker: FaceTracker = None, motion_gate: MotionGate = None):
+        """
+        Response for a frame the motion gate skipped: the faces still
+        tracked on the camera or, without a tracker, those found on the
+        last frame that was searched. (None, 204) if there were none.
+        """
+        if tracker is not None:
+            tracker.hold(time.time())
+            response = self._build_response([(track.box, track.identity) for track in tracker.tracks])
+        elif motion_gate is not None and motion_gate.last_response is not None:
+            response = dict(motion_gate.last_response)
+        else:
+            return None, 204
+        response['motion'] = False
+        return response, 200
+
+    def handle_camera_image(self, file_bytes: bytes):
+        """
+        Recognize an image pushed by a camera, passing it through the
+        camera's motion gate when gating is enabled for it.
+        """
+        camera = self._camera()
+        motion_gate = None
+        if camera is not None:
+            motion_gate = get_motion_gate(camera.id, MotionSettings.from_config(current_app.config, camera))
+        if motion_gate is None:
+            return self.handle_face_recognition(file_bytes)
+
+        with stage('decode'):
+            frame = cv2.imdecode(np.frombuffer(file_bytes, np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            return {"error": "Cannot decode the image"}, 400
+        response, status_code = self.handle_frame_recognition(
+            frame,
+            self._detection_settings(camera),
+            motion_gate=motion_gate,
+            snapshot=file_bytes,
+        )
+        if status_code == 204:
+            return {"error": "No face found in the image"}, 400
+        return response, status_code
+
+    def handle_batch_face_recognition(self, images):
+        """
+        Recognize a batch of (name, bytes) images: encode each image, match
+        all faces in one gallery query and write the logs in one insert.
+        """
+        try:
+            results = []
+            captures = []
+            detection_settings = self._detection_settings()
+            for name, image_bytes in images:
+                result = {'image': name}
+                results.append(result)
+                try:
+                    faces = self._process_face_image(image_bytes, detection_settings)
+                except Exception as e:
+                    result['error'] = str(e)
+                    continue
+                if not faces:
+                    result['error'] = "No face found in the image"
+                    continue
+                captures.append((result, (faces, image_bytes)))
+
+            responses = self._recognize_and_log([capture for _, capture in captures])
+            for (result, _), response in zip(captures, responses):
+                result.update(response)
+
+            return {'results': results}, 200
+
+        except Exception as e:
+            return {'error': str(e)}, 500
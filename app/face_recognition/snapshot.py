@@ -0,0 +1,108 @@
+import json
+import logging
+import os
+import shutil
+import time
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Name of the pointer file holding the directory name of the live snapshot.
+CURRENT_POINTER = 'CURRENT'
+
+_ARRAYS = ('row_ids', 'user_ids', 'encodings', 'sq_norms')
+
+
+class GallerySnapshot(NamedTuple):
+    name: str
+    generation: int
+    watermark: Optional[datetime]
+    row_ids: np.ndarray
+    user_ids: np.ndarray
+    encodings: np.ndarray
+    sq_norms: np.ndarray
+
+
+def _read_watermark(value: Optional[str]) -> Optional[datetime]:
+    # Older snapshots of an empty gallery recorded datetime.min instead of null.
+    watermark = datetime.fromisoformat(value) if value else None
+    return None if watermark == datetime.min else watermark
+
+
+def read_current(directory: str) -> Optional[str]:
+    """
+    Return the name of the published snapshot, or None if nothing was published.
+    """
+    try:
+        with open(os.path.join(directory, CURRENT_POINTER)) as pointer:
+            return pointer.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def export_snapshot(directory: str, view, generation: int, watermark: Optional[datetime], keep: int = 2) -> str:
+    """
+    Write a gallery view to a new snapshot directory and publish it.
+
+    The arrays are written under a temporary name, renamed into place, and
+    only then is the CURRENT pointer replaced, so readers never see a partial
+    snapshot. The newest `keep` snapshots are kept for workers still mapping
+    an older one.
+    """
+    os.makedirs(directory, exist_ok=True)
+    name = f"gallery-{generation:010d}-{time.strftime('%Y%m%d_%H%M%S')}"
+    staging = os.path.join(directory, f".{name}.tmp")
+    os.makedirs(staging, exist_ok=True)
+    for array_name in _ARRAYS:
+        np.save(os.path.join(staging, f'{array_name}.npy'), np.ascontiguousarray(getattr(view, array_name)))
+    with open(os.path.join(staging, 'meta.json'), 'w') as meta:
+        json.dump({
+            'generation': generation,
+            'watermark': watermark.isoformat() if watermark is not None else None,
+            'count': len(view.row_ids),
+            'dtype': str(view.encodings.dtype),
+        }, meta)
+    os.replace(staging, os.path.join(directory, name))
+
+    pointer_tmp = os.path.join(directory, f'.{CURRENT_POINTER}.tmp')
+    with open(pointer_tmp, 'w') as pointer:
+        pointer.write(name)
+        pointer.flush()
+        os.fsync(pointer.fileno())
+    os.replace(pointer_tmp, os.path.join(directory, CURRENT_POINTER))
+
+    snapshots = sorted(entry for entry in os.listdir(directory) if entry.startswith('gallery-'))
+    for stale in snapshots[:-keep]:
+        # Workers that still map a removed snapshot keep reading it until they
+        # swap; POSIX only frees the pages once the last mapping goes away.
+        shutil.rmtree(os.path.join(directory, stale), ignore_errors=True)
+    return name
+
+
+def load_snapshot(directory: str, name: Optional[str] = None) -> Optional[GallerySnapshot]:
+    """
+    Memory-map a published snapshot read-only.
+
+    Every worker mapping the same files shares their pages through the OS
+    page cache instead of holding a private copy of the gallery.
+    """
+    name = name or read_current(directory)
+    if not name:
+        return None
+    path = os.path.join(directory, name)
+    with open(os.path.join(path, 'meta.json')) as meta_file:
+        meta = json.load(meta_file)
+    arrays = {
+        array_name: np.load(os.path.join(path, f'{array_name}.npy'), mmap_mode='r')
+        for array_name in _ARRAYS
+    }
+    logger.info("Mapped gallery snapshot %s with %d encodings", name, meta['count'])
+    return GallerySnapshot(
+        name=name,
+        generation=meta['generation'],
+        watermark=_read_watermark(meta.get('watermark')),
+        **arrays,
+    )
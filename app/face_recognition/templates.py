@@ -0,0 +1,79 @@
+import logging
+from typing import List, Tuple
+
+import numpy as np
+
+from app.face_recognition.models import FaceEncoding
+from model_base import db
+
+logger = logging.getLogger(__name__)
+
+
+def select_templates(samples: np.ndarray, max_templates: int, outlier_distance: float) -> Tuple[np.ndarray, List[int]]:
+    """
+    Reduce a user's sample encodings to representative templates.
+
+    The centroid of the samples stands for the typical photo. Samples that
+    the centroid represents badly (farther than `outlier_distance`), such
+    as glasses or a different haircut, are kept too, farthest first, each
+    one chosen far from the centroid and from the samples already kept, up
+    to `max_templates` templates in total.
+
+    :return: (centroid, indices of the samples kept as templates)
+    """
+    centroid = samples.mean(axis=0)
+    kept: List[int] = []
+    # Distance of every sample to its nearest template so far.
+    nearest = np.linalg.norm(samples - centroid, axis=1)
+    while len(kept) + 1 < max_templates:
+        candidate = int(np.argmax(nearest))
+        if nearest[candidate] <= outlier_distance:
+            break
+        kept.append(candidate)
+        nearest = np.minimum(nearest, np.linalg.norm(samples - samples[candidate], axis=1))
+    return centroid, kept
+
+
+def compact_user(user_id: int, max_templates: int = 3, outlier_distance: float = 0.35,
+                 encoding_format: str = 'float32') -> int:
+    """
+    Replace a user's active encodings with templates from `select_templates`
+    in one transaction. Templates are recomputed from every sample, active
+    or not, so repeated compaction does not drift. Samples that are not
+    kept are deactivated rather than deleted, and previous centroid
+    templates are deleted. Users with no more samples than `max_templates`
+    keep all their samples.
+
+    :return: The number of active encodings the user has afterwards.
+    """
+    rows = FaceEncoding.get_user_encodings(user_id)
+    samples = [row for row in rows if not row.template]
+    if not samples:
+        return len(rows)
+
+    if len(samples) <= max_templates:
+        for row in rows:
+            if row.template:
+                db.session.delete(row)
+        for row in samples:
+            row.active = True
+        db.session.commit()
+        return len(samples)
+
+    centroid, kept = select_templates(
+        np.stack([row.get_face_encoding(dtype=np.float64) for row in samples]),
+        max_templates,
+        outlier_distance,
+    )
+    for row in rows:
+        if row.template:
+            db.session.delete(row)
+    kept = set(kept)
+    for index, row in enumerate(samples):
+        row.active = index in kept
+    template = FaceEncoding(user_id=user_id, active=True, template=True)
+    template.set_face_encoding(centroid, encoding_format)
+    db.session.add(template)
+    db.session.commit()
+    logger.info("Compacted %d encodings of user %d into %d templates", len(samples), user_id, len(kept) + 1)
+    return len(kept) + 1
@@ -0,0 +1,167 @@
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+logger = logging.getLogger(__name__)
+
+TEXT_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+# Attributes every LogRecord has; anything else was passed in `extra`.
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_traceback_formatter = logging.Formatter()
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line, with the fields passed in `extra` merged in.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'thread': record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    QueueHandler that drops, and counts, records when its bounded queue is
+    full instead of blocking the logging thread.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge the arguments here, since they may change once the call
+        # returns, but leave formatting, traceback included, to the listener.
+        record = copy.copy(record)
+        record.message = record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _traceback_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def parse_levels(levels: str) -> dict:
+    """
+    Parse 'app.face_recognition=DEBUG,sqlalchemy.engine=WARNING' into
+    {logger name: level}.
+    """
+    parsed = {}
+    for item in (levels or '').split(','):
+        if not item.strip():
+            continue
+        name, _, level = item.partition('=')
+        if not level.strip():
+            raise ValueError(f"Invalid log level setting: {item!r}")
+        parsed[name.strip()] = level.strip().upper()
+    return parsed
+
+
+def sampled(rate: float) -> bool:
+    """
+    Whether to emit one occurrence of a log line sampled at `rate` (0-1).
+    """
+    return rate >= 1 or (rate > 0 and random.random() < rate)
+
+
+def _is_level(level: str) -> bool:
+    return isinstance(logging.getLevelName(level), int)
+
+
+_listener = None
+_queue_handler = None
+_setup_lock = threading.Lock()
+
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
+
+
+def configure_logging(config):
+    """
+    Route every log record through a bounded queue to a listener thread
+    that formats and writes it, so request threads never wait on file I/O.
+
+    LOG_LEVEL sets the root level and LOG_LEVELS overrides it per logger.
+    LOG_FORMAT is 'text' or 'json'. Records are written to a dated file in
+    LOG_DIR. Calling this again replaces the previous handlers. An invalid
+    setting is logged as an error and replaced by text, INFO or no
+    override, so a typo does not keep the application from starting.
+    """
+    global _listener, _queue_handler
+    errors = []
+    log_dir = config.get('LOG_DIR') or os.path.join(os.getcwd(), 'logs')
+    os.makedirs(log_dir, exist_ok=True)
+    file_handler = logging.FileHandler(
+        os.path.join(log_dir, f'face_engine_{datetime.now().strftime("%Y%m%d")}.log'),
+        encoding='utf-8',
+    )
+    log_format = config.get('LOG_FORMAT', 'text')
+    if log_format == 'json':
+        file_handler.setFormatter(JsonFormatter())
+    else:
+        if log_format != 'text':
+            errors.append(f"Unknown log format {log_format!r}, logging as text")
+        file_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    level = config.get('LOG_LEVEL', 'INFO').upper()
+    if not _is_level(level):
+        errors.append(f"Unknown log level {level!r}, logging at INFO")
+        level = 'INFO'
+    try:
+        levels = parse_levels(config.get('LOG_LEVELS', ''))
+    except ValueError as e:
+        errors.append(f"{e}, ignoring LOG_LEVELS")
+        levels = {}
+    for name, logger_level in list(levels.items()):
+        if not _is_level(logger_level):
+            errors.append(f"Unknown log level {logger_level!r} for {name}, ignoring it")
+            del levels[name]
+
+    with _setup_lock:
+        root = logging.getLogger()
+        if _listener is not None:
+            root.removeHandler(_queue_handler)
+            _listener.stop()
+            for handler in _listener.handlers:
+                handler.close()
+        else:
+            atexit.register(_stop_listener)
+        _queue_handler = DroppingQueueHandler(queue.Queue(maxsize=config.get('LOG_QUEUE_SIZE', 10000)))
+        _listener = QueueListener(_queue_handler.queue, file_handler)
+        _listener.start()
+        root.addHandler(_queue_handler)
+        root.setLevel(level)
+        for name, logger_level in levels.items():
+            logging.getLogger(name).setLevel(logger_level)
+    for error in errors:
+        logger.error("Invalid logging setting: %s", error)
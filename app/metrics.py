@@ -0,0 +1,288 @@
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from flask import Blueprint, Response
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.instrumentation import DB_COMMIT, NX_SEND, STAGES, add_stage_listener
+
+# Upper bounds, in seconds, of the latency histogram buckets.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _format_labels(labels: Dict[str, object]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """
+    Prometheus histogram with one series per combination of label values.
+
+    `observe` costs a bisect and a short critical section. Buckets are
+    counted individually and only made cumulative when rendered.
+    """
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [count per bucket..., count above the last bucket, sum]
+        self._series: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, label_values: tuple = ()):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = {label_values: list(values) for label_values, values in self._series.items()}
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for label_values, values in sorted(series.items(), key=lambda item: tuple(map(str, item[0]))):
+            labels = dict(zip(self.label_names, label_values))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), values[:-1]):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_format_labels({**labels, "le": _format_value(bound)})} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(labels)} {values[-1]!r}')
+            lines.append(f'{self.name}_count{_format_labels(labels)} {cumulative}')
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Histograms observed on the hot path, plus collectors that read gauges
+    and counters from the application's components when /metrics is
+    scraped, so those cost nothing between scrapes.
+
+    A collector returns (name, type, help, samples) tuples.
+    """
+
+    def __init__(self):
+        self.histograms: List[Histogram] = []
+        self.collectors: List[Callable[[], Iterable[tuple]]] = []
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        histogram = Histogram(*args, **kwargs)
+        self.histograms.append(histogram)
+        return histogram
+
+    def add_collector(self, collector: Callable[[], Iterable[tuple]]):
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for histogram in self.histograms:
+            lines.extend(histogram.render())
+        for collector in self.collectors:
+            for name, kind, documentation, samples in collector():
+                lines.append(f'# HELP {name} {documentation}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in samples:
+                    lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+stage_seconds = registry.histogram(
+    'face_recognition_stage_seconds',
+    'Time spent in each recognition pipeline stage.',
+    ('stage', 'camera'),
+)
+db_commit_seconds = registry.histogram(
+    'db_commit_seconds',
+    'Time to flush and commit an ORM session, or to run a Core transaction.',
+)
+nx_bookmark_send_seconds = registry.histogram(
+    'nx_bookmark_send_seconds',
+    'Time to post one bookmark to NX Witness, redirect included.',
+)
+# Operations timed with `stage` outside the pipeline, with their own histograms.
+_operation_seconds = {DB_COMMIT: db_commit_seconds, NX_SEND: nx_bookmark_send_seconds}
+
+
+def _observe_stage(name: str, seconds: float, camera_id: Optional[int]):
+    histogram = _operation_seconds.get(name)
+    if histogram is not None:
+        histogram.observe(seconds)
+    elif name in STAGES:
+        stage_seconds.observe(seconds, (name, '' if camera_id is None else str(camera_id)))
+
+
+def _commit_started(session):
+    session.info['metrics_commit_started'] = time.perf_counter()
+
+
+def _commit_finished(session):
+    started = session.info.pop('metrics_commit_started', None)
+    if started is not None:
+        db_commit_seconds.observe(time.perf_counter() - started)
+
+
+def _commit_failed(session):
+    session.info.pop('metrics_commit_started', None)
+
+
+def _component_metrics():
+    """
+    Gauges and counters of the process-wide components that have been
+    created; the getters are not called, so scraping starts nothing.
+    """
+    from app import logging_setup
+    from app.face_recognition import bookmarks, capture_writer, debounce, engine, log_writer, result_cache
+    from app.face_recognition.gallery import gallery
+
+    if logging_setup._queue_handler is not None:
+        yield 'log_records_dropped_total', 'counter', 'Log records dropped on a full logging queue.', [
+            ({}, logging_setup._queue_handler.dropped),
+        ]
+
+    if engine.engine is not None:
+        stats = engine.engine.stats()
+        yield 'recognition_engine_queued_jobs', 'gauge', 'Jobs waiting for an engine thread.', [({}, stats['queued'])]
+        yield 'recognition_engine_active_jobs', 'gauge', 'Jobs running on engine threads.', [({}, stats['active'])]
+        yield 'recognition_engine_max_workers', 'gauge', 'Engine threads.', [({}, stats['max_workers'])]
+        yield 'recognition_engine_processes', 'gauge', 'Engine worker processes.', [({}, stats['processes'])]
+
+    if gallery.loaded:
+        yield 'face_gallery_encodings', 'gauge', 'Encodings in the in-memory gallery.', [({}, len(gallery))]
+        yield 'face_gallery_generation', 'gauge', 'Gallery generation last loaded or synced.', [({}, gallery.generation or 0)]
+        yield 'face_gallery_version', 'counter', 'Changes published to the in-memory gallery.', [({}, gallery.version)]
+
+    if result_cache.result_cache is not None:
+        stats = result_cache.result_cache.stats()
+        yield 'result_cache_entries', 'gauge', 'Entries in the upload result cache.', [({}, stats['entries'])]
+        yield 'result_cache_lookups_total', 'counter', 'Result cache lookups by outcome.', [
+            ({'result': 'hit'}, stats['hits']),
+            ({'result': 'perceptual_hit'}, stats['perceptual_hits']),
+            ({'result': 'miss'}, stats['misses']),
+        ]
+        yield 'result_cache_evictions_total', 'counter', 'Result cache LRU evictions.', [({}, stats['evictions'])]
+        yield 'result_cache_invalidations_total', 'counter', 'Result cache flushes on gallery changes.', [
+            ({}, stats['invalidations']),
+        ]
+
+    if log_writer.log_writer is not None:
+        stats = log_writer.log_writer.stats()
+        yield 'recognition_log_buffered_rows', 'gauge', 'Recognition log rows waiting for a flush.', [
+            ({}, stats['buffered']),
+        ]
+        yield 'recognition_log_rows_written_total', 'counter', 'Recognition log rows written.', [({}, stats['written'])]
+        yield 'recognition_log_rows_dropped_total', 'counter', 'Recognition log rows dropped.', [({}, stats['dropped'])]
+        yield 'recognition_log_rows_rejected_total', 'counter', 'Recognition log rows the database refused.', [
+            ({}, stats['rejected']),
+        ]
+
+    if capture_writer.capture_writer is not None:
+        stats = capture_writer.capture_writer.stats()
+        yield 'capture_writer_queued', 'gauge', 'Snapshots waiting to be written.', [({}, stats['queued'])]
+        yield 'capture_writer_written_total', 'counter', 'Snapshots written.', [({}, stats['written'])]
+        yield 'capture_writer_dropped_total', 'counter', 'Snapshots dropped on a full queue.', [({}, stats['dropped'])]
+
+    if bookmarks.bookmark_dispatcher is not None:
+        stats = bookmarks.bookmark_dispatcher.stats()
+        yield 'nx_bookmarks_total', 'counter', 'NX Witness bookmarks by outcome.', [
+            ({'result': 'sent'}, stats['sent']),
+            ({'result': 'failed'}, stats['failed']),
+        ]
+
+    if debounce.debouncer is not None:
+        stats = debounce.debouncer.stats()
+        yield 'debounce_open_windows', 'gauge', 'Open sighting windows.', [({}, stats['open_windows'])]
+        yield 'debounce_observed_total', 'counter', 'Recognitions seen by the debouncer.', [({}, stats['observed'])]
+        yield 'debounce_windows_closed_total', 'counter', 'Sighting windows closed and logged.', [
+            ({}, stats['windows_closed']),
+        ]
+
+
+def _camera_metrics():
+    """
+    Per-camera stream and motion gating counters.
+    """
+    from app.camera import ingestion, motion
+
+    streams = ingestion.ingestion_manager.status() if ingestion.ingestion_manager is not None else []
+    if streams:
+        yield 'camera_stream_up', 'gauge', 'Whether the camera stream is running.', [
+            ({'camera': status['camera_id']}, int(status['state'] == ingestion.RUNNING)) for status in streams
+        ]
+        yield 'camera_stream_process_fps', 'gauge', 'Frames recognized per second.', [
+            ({'camera': status['camera_id']}, status['process_fps']) for status in streams
+        ]
+        for key, documentation in (
+                ('frames_read', 'Frames read from the stream.'),
+                ('frames_processed', 'Frames recognized.'),
+                ('frames_dropped', 'Frames replaced before they were recognized.'),
+                ('faces_seen', 'Faces found in recognized frames.'),
+        ):
+            yield f'camera_stream_{key}_total', 'counter', documentation, [
+                ({'camera': status['camera_id']}, status[key]) for status in streams
+            ]
+
+    gates = [(camera_id, gate.stats()) for camera_id, gate in list(motion._gates.items())]
+    if gates:
+        yield 'camera_motion_frames_total', 'counter', 'Frames seen by the motion gate, by outcome.', [
+            ({'camera': camera_id, 'result': result}, stats[f'frames_{result}'])
+            for camera_id, stats in gates
+            for result in ('skipped', 'partial', 'full')
+        ]
+
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Prometheus text exposition of the application's metrics.
+    """
+    return Response(registry.render(), content_type=CONTENT_TYPE)
+
+
+_installed = False
+_install_lock = threading.Lock()
+
+
+def init_metrics(app):
+    """
+    Start recording stage and commit latencies and serve /metrics, unless
+    METRICS_ENABLED is off.
+    """
+    global _installed
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+    with _install_lock:
+        if not _installed:
+            add_stage_listener(_observe_stage)
+            event.listen(Session, 'before_commit', _commit_started)
+            event.listen(Session, 'after_commit', _commit_finished)
+            event.listen(Session, 'after_rollback', _commit_failed)
+            registry.add_collector(_component_metrics)
+            registry.add_collector(_camera_metrics)
+            _installed = True
+    app.register_blueprint(metrics_bp)
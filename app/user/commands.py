@@ -0,0 +1,63 @@
+import csv
+import time
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from app.user.enrollment import MANIFEST_NAME, BulkEnrollment, PortraitSource, read_manifest, summarize
+
+users_cli = AppGroup('users', help='User management commands.')
+
+
+@users_cli.command('enroll')
+@click.option('--portraits', required=True, type=click.Path(exists=True),
+              help='Directory, zip or tar file holding the portraits.')
+@click.option('--manifest', type=click.Path(exists=True, dir_okay=False), default=None,
+              help=f'CSV manifest (defaults to {MANIFEST_NAME} in the portraits).')
+@click.option('--processes', type=int, default=None, help='Encoding processes (defaults to ENROLL_PROCESSES).')
+@click.option('--batch-size', type=int, default=None, help='Rows per transaction (defaults to ENROLL_BATCH_SIZE).')
+@click.option('--report', type=click.Path(dir_okay=False, writable=True), default=None,
+              help='Write the result of every row to this CSV file.')
+def enroll_users(portraits, manifest, processes, batch_size, report):
+    """
+    Enroll the users of a CSV manifest (first_name, last_name, email, phone,
+    portrait) in bulk.
+
+    Emails that are already enrolled are skipped, so an interrupted run is
+    resumed by running the same command again.
+    """
+    source = PortraitSource(portraits)
+    try:
+        if manifest:
+            with open(manifest, encoding='utf-8-sig') as manifest_file:
+                manifest_text = manifest_file.read()
+        else:
+            try:
+                manifest_text = source.read(MANIFEST_NAME).decode('utf-8-sig')
+            except KeyError:
+                raise click.UsageError(f"No --manifest given and no {MANIFEST_NAME} in {portraits}")
+        rows = read_manifest(manifest_text)
+        enrollment = BulkEnrollment.from_config(
+            source, current_app.config, processes=processes, batch_size=batch_size,
+        )
+        enroll_start = time.time()
+        done = []
+
+        def progress(batch_results):
+            done.extend(batch_results)
+            click.echo(f"{len(done)}/{len(rows)} rows, {summarize(done)}")
+
+        results = enrollment.run(rows, progress=progress)
+    finally:
+        source.close()
+
+    for result in results:
+        if result['status'] == 'failed':
+            click.echo(f"row {result['row']} ({result['email']}): {result['error']}", err=True)
+    if report:
+        with open(report, 'w', newline='') as report_file:
+            writer = csv.DictWriter(report_file, fieldnames=['row', 'email', 'status', 'user_id', 'error'])
+            writer.writeheader()
+            writer.writerows(results)
+    click.echo(f"Enrolled {len(rows)} rows in {time.time() - enroll_start:.1f}s: {summarize(results)}")
@@ -0,0 +1,314 @@
+import csv
+import io
+import logging
+import multiprocessing
+import os
+import tarfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+from flask import current_app
+from pydantic import ValidationError
+from sqlalchemy.exc import IntegrityError
+from werkzeug.utils import secure_filename
+
+from app.face_recognition.models import FaceEncoding
+from app.user.models import User
+from app.user.schemas import UserCreateRequest
+from model_base import db
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'manifest.csv'
+
+CREATED = 'created'
+EXISTS = 'exists'
+FAILED = 'failed'
+
+
+class PortraitSource:
+    """
+    Portrait images by manifest name, read one at a time from a directory
+    or from a zip or tar archive on disk, so an archive of thousands of
+    portraits is never held in memory at once.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._directory = None
+        self._zip = None
+        self._tar = None
+        if os.path.isdir(path):
+            self._directory = os.path.realpath(path)
+        elif zipfile.is_zipfile(path):
+            self._zip = zipfile.ZipFile(path)
+        else:
+            try:
+                self._tar = tarfile.open(path, mode='r:*')
+            except tarfile.TarError:
+                raise ValueError("Portraits must be a directory, a zip or a tar file.")
+
+    def read(self, name: str) -> bytes:
+        """
+        Bytes of the member `name`; raises KeyError if there is none.
+        """
+        if self._directory is not None:
+            path = os.path.realpath(os.path.join(self._directory, name))
+            if not path.startswith(self._directory + os.sep) or not os.path.isfile(path):
+                raise KeyError(name)
+            with open(path, 'rb') as portrait:
+                return portrait.read()
+        if self._zip is not None:
+            return self._zip.read(name)
+        member = self._tar.extractfile(name)
+        if member is None:
+            raise KeyError(name)
+        return member.read()
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+        if self._tar is not None:
+            self._tar.close()
+
+
+def read_manifest(text: str) -> List[Dict[str, str]]:
+    """
+    Rows of a CSV manifest with a header of first_name, last_name, email,
+    phone (optional) and portrait, the portrait's path in the source.
+    """
+    reader = csv.DictReader(io.StringIO(text))
+    missing = {'first_name', 'last_name', 'email', 'portrait'} - set(reader.fieldnames or [])
+    if missing:
+        raise ValueError(f"Manifest is missing columns: {', '.join(sorted(missing))}")
+    return [{key: (value or '').strip() for key, value in row.items() if key} for row in reader]
+
+
+def _init_enroll_worker():
+    import face_recognition  # noqa: F401  (loads the dlib models once per worker)
+
+
+def _encode_portrait(image_bytes: bytes):
+    """
+    Encode the largest face of a portrait, as `encode_face` does for a
+    single enrolment. Runs in a worker process.
+
+    :return: (encoding, None), or (None, error message).
+    """
+    import face_recognition as face_rec
+
+    try:
+        image = face_rec.load_image_file(io.BytesIO(image_bytes))
+        face_locations = face_rec.face_locations(image)
+        if not face_locations:
+            return None, "No face found in the image."
+        largest = max(face_locations, key=lambda box: (box[2] - box[0]) * (box[1] - box[3]))
+        return face_rec.face_encodings(image, known_face_locations=[largest])[0], None
+    except Exception as e:
+        return None, f"Failed to encode face: {e}"
+
+
+class BulkEnrollment:
+    """
+    Enroll the users of a CSV manifest with their portraits.
+
+    Rows are handled `batch_size` at a time. Rows whose email is already
+    enrolled are reported as 'exists' and skipped, so an interrupted run is
+    resumed by running it again and the import is idempotent on email. The
+    remaining portraits are encoded in parallel on `processes` worker
+    processes (inline when 1). Each batch's users and encodings are then
+    inserted in one transaction, so a batch is either fully enrolled or not
+    at all, and the portraits of the users created are only written once it
+    has committed. Every row gets a result with its status and error.
+    """
+
+    def __init__(self, source: PortraitSource, processes: Optional[int] = None, batch_size: int = 200,
+                 encoding_format: str = 'float32', upload_folder: str = None):
+        self.source = source
+        self.processes = processes or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.encoding_format = encoding_format
+        self.upload_folder = upload_folder
+        self._pool = None
+
+    @classmethod
+    def from_config(cls, source: PortraitSource, config, **overrides) -> 'BulkEnrollment':
+        options = {
+            'processes': config.get('ENROLL_PROCESSES') or None,
+            'batch_size': config.get('ENROLL_BATCH_SIZE', 200),
+            'encoding_format': config.get('FACE_ENCODING_FORMAT', 'float32'),
+            'upload_folder': config['UPLOAD_FOLDER'],
+        }
+        options.update({key: value for key, value in overrides.items() if value})
+        return cls(source, **options)
+
+    def _encode(self, images: List[bytes]):
+        if self.processes <= 1:
+            return [_encode_portrait(image) for image in images]
+        if self._pool is None:
+            # spawn, not fork: the parent holds DB connections and threads.
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.processes,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_enroll_worker,
+            )
+        return list(self._pool.map(_encode_portrait, images, chunksize=max(1, len(images) // (4 * self.processes))))
+
+    def _portrait_path(self, email: str, name: str) -> str:
+        # Prefixed with the email: portraits of different people often share a file name.
+        return os.path.join(self.upload_folder, f"{secure_filename(email)}_{secure_filename(os.path.basename(name))}")
+
+    @staticmethod
+    def _save_portrait(result: dict, portrait_path: str, image_bytes: bytes):
+        try:
+            with open(portrait_path, 'wb') as portrait:
+                portrait.write(image_bytes)
+        except OSError as e:
+            logger.error("Error saving portrait of user %s: %s", result['user_id'], e)
+            result['error'] = f"Failed to save portrait: {e}"
+
+    def _insert(self, pending) -> None:
+        """
+        Insert the (result, user_data, portrait_path, image_bytes, encoding)
+        of a batch in one transaction. If it fails on a concurrent duplicate
+        email, the rows are retried one transaction each to isolate it.
+        """
+        try:
+            self._insert_rows(pending)
+        except IntegrityError:
+            db.session.rollback()
+            for row in pending:
+                try:
+                    self._insert_rows([row])
+                except IntegrityError:
+                    db.session.rollback()
+                    row[0].update(status=EXISTS, error='Email already exists')
+
+    def _insert_rows(self, pending):
+        users = [
+            User(
+                first_name=user_data.first_name,
+                last_name=user_data.last_name,
+                email=user_data.email,
+                phone=user_data.phone,
+                portrait_path=portrait_path,
+            )
+            for _, user_data, portrait_path, _, _ in pending
+        ]
+        db.session.add_all(users)
+        db.session.flush()
+        encodings = []
+        for user, (_, _, _, _, encoding) in zip(users, pending):
+            face_encoding = FaceEncoding(user_id=user.id)
+            face_encoding.set_face_encoding(np.asarray(encoding), self.encoding_format)
+            encodings.append(face_encoding)
+        db.session.add_all(encodings)
+        db.session.commit()
+        for user, (result, _, portrait_path, image_bytes, _) in zip(users, pending):
+            result.update(status=CREATED, user_id=user.id, error=None)
+            self._save_portrait(result, portrait_path, image_bytes)
+
+    def _run_batch(self, batch, seen_emails: set) -> List[dict]:
+        results, candidates = [], []
+        for row_number, row in batch:
+            result = {'row': row_number, 'email': row.get('email'), 'status': FAILED, 'user_id': None, 'error': None}
+            results.append(result)
+            try:
+                user_data = UserCreateRequest(
+                    first_name=row.get('first_name'),
+                    last_name=row.get('last_name'),
+                    email=row.get('email'),
+                    phone=row.get('phone') or None,
+                )
+            except ValidationError as e:
+                result['error'] = f"Invalid row: {e.errors()[0]['loc'][0]}: {e.errors()[0]['msg']}"
+                continue
+            if user_data.email in seen_emails:
+                result['error'] = 'Duplicate email in the manifest'
+                continue
+            seen_emails.add(user_data.email)
+            candidates.append((result, user_data, row.get('portrait')))
+
+        existing = {
+            user.email: user.id
+            for user in User.query.filter(User.email.in_([user_data.email for _, user_data, _ in candidates]))
+        } if candidates else {}
+        to_encode = []
+        for result, user_data, portrait in candidates:
+            if user_data.email in existing:
+                result.update(status=EXISTS, user_id=existing[user_data.email])
+                continue
+            try:
+                image_bytes = self.source.read(portrait)
+            except KeyError:
+                result['error'] = f"Portrait not found: {portrait}"
+                continue
+            to_encode.append((result, user_data, portrait, image_bytes))
+
+        pending = []
+        encoded = self._encode([image_bytes for _, _, _, image_bytes in to_encode])
+        for (result, user_data, portrait, image_bytes), (encoding, error) in zip(to_encode, encoded):
+            if error:
+                result['error'] = error
+                continue
+            pending.append((result, user_data, self._portrait_path(user_data.email, portrait), image_bytes, encoding))
+        if pending:
+            self._insert(pending)
+        return results
+
+    def run(self, rows: List[Dict[str, str]], progress=None) -> List[dict]:
+        """
+        Enroll `rows`; returns one result per row, numbered from 1.
+
+        :param progress: Called with the results of each finished batch.
+        """
+        results = []
+        seen_emails = set()
+        numbered = list(enumerate(rows, start=1))
+        start = time.time()
+        try:
+            for offset in range(0, len(numbered), self.batch_size):
+                batch_results = self._run_batch(numbered[offset:offset + self.batch_size], seen_emails)
+                results.extend(batch_results)
+                logger.info("Bulk enrollment: %d/%d rows in %.1fs", len(results), len(rows), time.time() - start)
+                if progress is not None:
+                    progress(batch_results)
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+        return results
+
+
+def summarize(results: List[dict]) -> dict:
+    summary = {CREATED: 0, EXISTS: 0, FAILED: 0}
+    for result in results:
+        summary[result['status']] += 1
+    return summary
+
+
+def enroll_from_path(path: str, manifest_text: str = None, **options) -> dict:
+    """
+    Enroll from a portraits directory or archive at `path`. The manifest is
+    `manifest_text`, or the source's own manifest.csv.
+
+    :return: The summary counts and the rows that were not created.
+    """
+    source = PortraitSource(path)
+    try:
+        if manifest_text is None:
+            try:
+                manifest_text = source.read(MANIFEST_NAME).decode('utf-8-sig')
+            except KeyError:
+                raise ValueError(f"No manifest given and no {MANIFEST_NAME} in the portraits")
+        rows = read_manifest(manifest_text)
+        results = BulkEnrollment.from_config(source, current_app.config, **options).run(rows)
+    finally:
+        source.close()
+    return {
+        'summary': summarize(results),
+        'rows': [result for result in results if result['status'] != CREATED],
+    }
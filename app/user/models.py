@@ -1,4 +1,4 @@
-from typing import Optional, Tuple, List
+from typing import Dict, Iterable, Optional, Tuple, List
 
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import Column, Integer, String, Boolean
@@ -63,3 +63,13 @@ class User(BareBaseModel):
     @classmethod
     def get_user_by_id(cls, id: int) -> Optional['User']:
         return cls.query.filter_by(id=id).first()
+
+    @classmethod
+    def get_users_by_ids(cls, ids: Iterable[int]) -> Dict[int, 'User']:
+        """
+        Fetch several users in one query, keyed by id.
+        """
+        ids = set(ids)
+        if not ids:
+            return {}
+        return {user.id: user for user in cls.query.filter(cls.id.in_(ids)).all()}
@@ -1,9 +1,15 @@
 import os
+import tempfile
 
-from flask import Blueprint, request, send_from_directory, current_app
+from flask import Blueprint, Response, request, send_from_directory, current_app, stream_with_context, url_for
+
+from app.face_recognition.jobs import get_bulk_executor, submit_job
 
 from app.user.schemas import UserCreateRequest, RecognitionLogResponse, UserLoginRequest
-from app.user.services import handle_get_users, handle_create_user, handle_get_recognition_logs, handle_login
+from app.user.services import (
+    handle_get_users, handle_create_user, handle_get_recognition_logs, handle_export_recognition_logs, handle_login,
+    handle_bulk_enrollment, handle_add_user_encodings,
+)
 from app.utils import format_response
 
 user_bp = Blueprint(
@@ -59,9 +65,64 @@ def create_user():
     )
 
 
+@user_bp.route('/users/<int:user_id>/encodings', methods=['POST'])
+def add_user_encodings(user_id):
+    portraits = request.files.getlist('portrait')
+    if not portraits:
+        return format_response(
+            data={'error': 'Portrait file is missing'},
+            message="Bad Request",
+            status_code=400,
+        )
+
+    response_data = handle_add_user_encodings(user_id=user_id, portraits=portraits)
+    return format_response(
+        data=response_data,
+        message="User encodings processed",
+        status_code=response_data['status_code'],
+    )
+
+
+@user_bp.route('/users/bulk', methods=['POST'])
+def bulk_enroll_users():
+    """
+    Enroll users in bulk from a zip or tar of portraits and a CSV manifest
+    (the 'manifest' file, or manifest.csv inside the archive). The import
+    runs as a job; poll the returned status_url for the per-row report.
+    """
+    portraits = request.files.get('portraits')
+    if not portraits:
+        return format_response(
+            data={'error': 'Portraits archive is missing'},
+            message="Bad Request",
+            status_code=400,
+        )
+    manifest = request.files.get('manifest')
+    manifest_text = manifest.read().decode('utf-8-sig') if manifest else None
+
+    # Spool the archive to disk; the job reads it one portrait at a time.
+    fd, portraits_path = tempfile.mkstemp(prefix='enroll-', dir=current_app.config['UPLOAD_FOLDER'])
+    with os.fdopen(fd, 'wb') as archive:
+        portraits.save(archive)
+
+    job_id = submit_job(handle_bulk_enrollment, portraits_path, manifest_text, executor=get_bulk_executor())
+    if job_id is None:
+        os.remove(portraits_path)
+        return format_response(
+            data={"error": "Too many pending jobs"},
+            message="Service Unavailable",
+            status_code=503,
+        )
+    return format_response(
+        data={"job_id": job_id, "status_url": url_for('face_recognition.get_job', job_id=job_id)},
+        message="Bulk enrollment accepted",
+        status_code=202,
+    )
+
+
 @user_bp.route('/recognition-logs', methods=['GET'])
 def get_recognition_logs():
-    response_data = handle_get_recognition_logs()
+    response_data = handle_get_recognition_logs(request.args)
     return format_response(
         data=response_data,
         message="Recognition logs retrieved successfully",
@@ -69,6 +130,23 @@ def get_recognition_logs():
     )
 
 
+@user_bp.route('/recognition-logs/export', methods=['GET'])
+def export_recognition_logs():
+    result = handle_export_recognition_logs(request.args)
+    if isinstance(result, dict):
+        return format_response(
+            data=result,
+            message="Bad Request",
+            status_code=result.get('status_code', 400),
+        )
+    chunks, mimetype, filename = result
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'},
+    )
+
+
 @user_bp.route('/uploads/portraits/<filename>')
 def uploaded_portrait(filename):
     return send_from_directory(
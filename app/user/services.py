@@ -1,11 +1,23 @@
+import base64
+import binascii
+import csv
+import io
+import json
 import os
+import zlib
+from datetime import datetime
+from typing import List
 
+from flask import current_app
 from werkzeug.datastructures import FileStorage
 
 from app.face_recognition.models import FaceEncoding, RecognitionLog
+from app.face_recognition.templates import compact_user
+from app.user.enrollment import enroll_from_path
 from app.user.models import User
 from app.user.schemas import UserCreateRequest, UserResponse, UserLoginRequest
 from app.utils import encode_face, save_portrait
+from model_base import db
 
 
 def handle_login(user_login_data: UserLoginRequest):
@@ -51,7 +63,8 @@ def handle_create_user(
         user_encoding = encode_face(portrait_path)
         FaceEncoding.create_encoding(
             user_id=user.id,
-            encoding=user_encoding.tobytes(),
+            encoding=user_encoding,
+            encoding_format=current_app.config.get('FACE_ENCODING_FORMAT', 'float32'),
         )
     except Exception as e:
         return {'error': f'Failed to encode face: {e}', 'status_code': 500}
@@ -59,21 +72,230 @@ def handle_create_user(
     return {'status_code': 201}
 
 
-def handle_get_recognition_logs():
+def handle_add_user_encodings(user_id: int, portraits: List[FileStorage]):
+    """
+    Add enrollment photos to an existing user, one encoding each. Users
+    whose active encodings then exceed ENCODING_MAX_PER_USER are compacted.
+    """
+    user = User.get_user_by_id(user_id)
+    if user is None:
+        return {'error': 'User not found', 'status_code': 404}
+
+    config = current_app.config
+    added, errors = 0, []
+    for portrait in portraits:
+        try:
+            encoding = encode_face(save_portrait(portrait=portrait))
+        except Exception as e:
+            errors.append({'portrait': portrait.filename, 'error': str(e)})
+            continue
+        face_encoding = FaceEncoding(user_id=user.id)
+        face_encoding.set_face_encoding(encoding, config.get('FACE_ENCODING_FORMAT', 'float32'))
+        db.session.add(face_encoding)
+        added += 1
+    db.session.commit()
+
+    active = sum(row.is_active for row in FaceEncoding.get_user_encodings(user.id))
+    max_per_user = config.get('ENCODING_MAX_PER_USER', 10)
+    if max_per_user and active > max_per_user:
+        active = compact_user(
+            user.id,
+            max_templates=config.get('ENCODING_MAX_TEMPLATES', 3),
+            outlier_distance=config.get('ENCODING_OUTLIER_DISTANCE', 0.35),
+            encoding_format=config.get('FACE_ENCODING_FORMAT', 'float32'),
+        )
+    return {
+        'added': added,
+        'errors': errors,
+        'active_encodings': active,
+        'status_code': 201 if added else 400,
+    }
+
+
+def handle_bulk_enrollment(portraits_path: str, manifest_text: str = None):
+    """
+    Enroll the users of a manifest from an uploaded portraits archive, then
+    delete the archive. Runs as an asynchronous job.
+    """
+    try:
+        return enroll_from_path(
+            portraits_path, manifest_text, processes=current_app.config.get('ENROLL_JOB_PROCESSES', 2),
+        ), 200
+    except ValueError as e:
+        return {'error': str(e)}, 400
+    finally:
+        os.remove(portraits_path)
+
+
+def _encode_cursor(timestamp: datetime, log_id: int) -> str:
+    return base64.urlsafe_b64encode(f'{timestamp.isoformat()}|{log_id}'.encode()).decode()
+
+
+def _decode_cursor(cursor: str):
+    timestamp, log_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    return datetime.fromisoformat(timestamp), int(log_id)
+
+
+def _parse_bool(value: str) -> bool:
+    if value.lower() in ['true', '1', 'yes']:
+        return True
+    if value.lower() in ['false', '0', 'no']:
+        return False
+    raise ValueError(f"Invalid boolean: {value}")
+
+
+def _parse_log_filters(params) -> dict:
+    """
+    Recognition log filters from query parameters; raises ValueError.
+    """
+    return {
+        'user_id': int(params['user_id']) if params.get('user_id') else None,
+        'camera_id': int(params['camera_id']) if params.get('camera_id') else None,
+        'recognized': _parse_bool(params['recognized']) if params.get('recognized') else None,
+        'since': datetime.fromisoformat(params['since']) if params.get('since') else None,
+        'until': datetime.fromisoformat(params['until']) if params.get('until') else None,
+    }
+
+
+def _log_item(row) -> dict:
+    return {
+        'id': row.id,
+        'timestamp': row.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+        'recognized_user': {
+            'first_name': row.first_name,
+            'last_name': row.last_name,
+        } if row.user_id is not None else None,
+        'camera_id': row.camera_id,
+        'image_path': row.snapshot_filename,
+        'last_seen': row.last_seen.strftime('%Y-%m-%d %H:%M:%S') if row.last_seen else None,
+        'hit_count': row.hit_count or 1,
+    }
+
+
+def handle_get_recognition_logs(params=None):
     """
     دریافت لیست لاگ‌های شناسایی.
+
+    Returns one page, newest first. Supported query parameters: limit,
+    cursor (the next_cursor of the previous page), user_id, camera_id,
+    recognized (true/false), since and until (ISO 8601, UTC).
+    """
+    params = params or {}
+    try:
+        default_limit = current_app.config.get('RECOGNITION_LOG_PAGE_SIZE', 100)
+        limit = min(
+            int(params.get('limit', default_limit)),
+            current_app.config.get('RECOGNITION_LOG_MAX_PAGE_SIZE', 1000),
+        )
+        if limit < 1:
+            raise ValueError("limit must be positive")
+        before = _decode_cursor(params['cursor']) if params.get('cursor') else None
+        filters = _parse_log_filters(params)
+    except (ValueError, binascii.Error) as e:
+        return {'error': f'Invalid query parameter: {e}', 'status_code': 400}
+
+    rows, has_more = RecognitionLog.get_logs_page(limit, before=before, **filters)
+    logs_list = [_log_item(row) for row in rows]
+    next_cursor = _encode_cursor(rows[-1].timestamp, rows[-1].id) if has_more else None
+    return {'logs_list': logs_list, 'next_cursor': next_cursor, 'status_code': 200}
+
+
+EXPORT_COLUMNS = [
+    'id', 'timestamp', 'user_id', 'first_name', 'last_name', 'camera_id', 'image_path', 'last_seen', 'hit_count',
+]
+
+
+def _export_lines(rows, export_format: str):
+    """
+    Serialize log rows one line at a time as NDJSON or CSV.
     """
-    logs = RecognitionLog.get_all_logs_with_users()
-    logs_list = []
-    for log in logs:
-        logs_list.append({
-            'id': log.id,
-            'timestamp': log.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-            'recognized_user': {
-                'first_name': log.user.first_name if log.user else None,
-                'last_name': log.user.last_name if log.user else None,
-            } if log.user else None,
-            'image_path': log.snapshot_filename
-        })
-    return {'logs_list': logs_list, 'status_code': 200}
+    if export_format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+        for row in rows:
+            writer.writerow([
+                row.id,
+                row.timestamp.isoformat(),
+                row.user_id,
+                row.first_name,
+                row.last_name,
+                row.camera_id,
+                row.snapshot_filename,
+                row.last_seen.isoformat() if row.last_seen else None,
+                row.hit_count or 1,
+            ])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+        return
+    for row in rows:
+        yield json.dumps({
+            'id': row.id,
+            'timestamp': row.timestamp.isoformat(),
+            'user_id': row.user_id,
+            'first_name': row.first_name,
+            'last_name': row.last_name,
+            'camera_id': row.camera_id,
+            'image_path': row.snapshot_filename,
+            'last_seen': row.last_seen.isoformat() if row.last_seen else None,
+            'hit_count': row.hit_count or 1,
+        }) + '\n'
+
 
+def _chunked(lines, chunk_size: int, compress: bool):
+    """
+    Group lines into chunks of about `chunk_size` bytes, gzip-compressing
+    them on the fly if asked, so the response is written in a few large
+    writes instead of one per row.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    pending, size = [], 0
+    for line in lines:
+        pending.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            data = ''.join(pending).encode()
+            pending, size = [], 0
+            data = compressor.compress(data) if compressor else data
+            if data:
+                yield data
+    data = ''.join(pending).encode()
+    if compressor:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
+
+
+def handle_export_recognition_logs(params=None):
+    """
+    Stream every matching recognition log as NDJSON (default) or CSV.
+
+    Query parameters: format (ndjson/csv), gzip (true/false) and the
+    filters of `handle_get_recognition_logs`.
+
+    :return: (chunks, mimetype, filename), or an error dict.
+    """
+    params = params or {}
+    export_format = params.get('format', 'ndjson').lower()
+    try:
+        if export_format not in ['ndjson', 'csv']:
+            raise ValueError(f"Unknown format: {export_format}")
+        compress = _parse_bool(params.get('gzip', 'false'))
+        filters = _parse_log_filters(params)
+    except ValueError as e:
+        return {'error': f'Invalid query parameter: {e}', 'status_code': 400}
+
+    rows = RecognitionLog.iter_logs(current_app.config.get('RECOGNITION_LOG_EXPORT_BATCH_SIZE', 1000), **filters)
+    chunks = _chunked(
+        _export_lines(rows, export_format),
+        current_app.config.get('RECOGNITION_LOG_EXPORT_CHUNK_SIZE', 65536),
+        compress,
+    )
+    filename = f"recognition_logs.{export_format}"
+    mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    if compress:
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    return chunks, mimetype, filename
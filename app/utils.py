@@ -1,5 +1,8 @@
+import io
 import os
-from typing import Optional
+import tarfile
+import zipfile
+from typing import List, Optional, Tuple
 
 import numpy as np
 from flask import current_app, jsonify
@@ -29,7 +32,7 @@ def encode_face(image_path: str) -> np.ndarray:
         image_path (str): The path to the image file.
 
     Returns:
-        np.ndarray: The encoding of the face found in the image.
+        np.ndarray: The encoding of the largest face found in the image.
 
     Raises:
         ValueError: If no face is found in the image.
@@ -39,13 +42,14 @@ def encode_face(image_path: str) -> np.ndarray:
         raise FileNotFoundError(f"The file at {image_path} does not exist.")
 
     image = face_rec.load_image_file(image_path)
-    encodings = face_rec.face_encodings(image)
-
-    if encodings:
-        return encodings[0]
-    else:
+    face_locations = face_rec.face_locations(image)
+    if not face_locations:
         raise ValueError("No face found in the image.")
 
+    # A portrait may catch someone in the background; enroll the largest face.
+    largest = max(face_locations, key=lambda box: (box[2] - box[0]) * (box[1] - box[3]))
+    return face_rec.face_encodings(image, known_face_locations=[largest])[0]
+
 
 def save_portrait(portrait: Optional[FileStorage]) -> str:
 
@@ -58,3 +62,68 @@ def save_portrait(portrait: Optional[FileStorage]) -> str:
         raise RuntimeError(f'Failed to save portrait: {e}')
 
 
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+class ArchiveTooLarge(ValueError):
+    """
+    An archive holds more images, or larger ones, than allowed.
+    """
+
+
+def _check_member(name: str, size: int, count: int, max_images: Optional[int], max_image_bytes: Optional[int]):
+    if max_images is not None and count > max_images:
+        raise ArchiveTooLarge(f"At most {max_images} images per batch")
+    if max_image_bytes is not None and size > max_image_bytes:
+        raise ArchiveTooLarge(f"Image {name} is larger than {max_image_bytes} bytes")
+
+
+def read_image_archive(archive_bytes: bytes, max_images: Optional[int] = None,
+                       max_image_bytes: Optional[int] = None) -> List[Tuple[str, bytes]]:
+    """
+    Extract the images of a zip or tar archive held in memory.
+
+    The member count and the declared size of every image are checked
+    against the limits before any member is decompressed, and no member is
+    read past its declared size, so an archive bomb is rejected up front.
+
+    Args:
+        archive_bytes (bytes): Raw bytes of a zip, tar, tar.gz or tar.bz2 file.
+        max_images (int): Most image members allowed.
+        max_image_bytes (int): Largest uncompressed image allowed, in bytes.
+
+    Returns:
+        List[Tuple[str, bytes]]: (member name, image bytes) for every image member.
+
+    Raises:
+        ArchiveTooLarge: If the archive exceeds a limit.
+        ValueError: If the bytes are not a supported archive.
+    """
+    stream = io.BytesIO(archive_bytes)
+    if zipfile.is_zipfile(stream):
+        with zipfile.ZipFile(stream) as archive:
+            members = [
+                member for member in archive.infolist()
+                if not member.is_dir() and member.filename.lower().endswith(IMAGE_EXTENSIONS)
+            ]
+            for count, member in enumerate(members, start=1):
+                _check_member(member.filename, member.file_size, count, max_images, max_image_bytes)
+            images = []
+            for member in members:
+                # ZipExtFile stops at the declared file_size.
+                with archive.open(member) as image:
+                    images.append((member.filename, image.read()))
+        return images
+
+    stream.seek(0)
+    try:
+        with tarfile.open(fileobj=stream, mode='r:*') as archive:
+            members = []
+            # Iterate rather than getmembers() so the count check stops early.
+            for member in archive:
+                if member.isfile() and member.name.lower().endswith(IMAGE_EXTENSIONS):
+                    members.append(member)
+                    _check_member(member.name, member.size, len(members), max_images, max_image_bytes)
+            return [(member.name, archive.extractfile(member).read()) for member in members]
+    except tarfile.TarError:
+        raise ValueError("Archive must be a zip or tar file.")
@@ -0,0 +1,75 @@
+"""
+Recall@1 and latency of the IVF gallery index against the exact scan.
+
+Builds synthetic galleries of clustered 128-d encodings, probes them with
+noisy copies of enrolled faces, and reports for each `nprobe` how often the
+IVF index returns the same nearest neighbour as the exact scan.
+
+    python benchmarks/bench_ann.py --sizes 10000 100000 --nprobe 4 8 16 32
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.face_recognition.ann import IVFIndex  # noqa: E402
+from app.face_recognition.gallery import ENCODING_DIMENSION, FaceGallery  # noqa: E402
+
+
+def synthetic_gallery(size, rng):
+    # Face encodings are not uniform: people cluster by demographics and
+    # capture conditions, which is what makes a coarse quantizer useful.
+    centers = rng.normal(0.0, 0.15, size=(max(1, size // 500), ENCODING_DIMENSION))
+    encodings = centers[rng.integers(len(centers), size=size)] + rng.normal(0.0, 0.05, size=(size, ENCODING_DIMENSION))
+    rows = [(row_id, row_id, encodings[row_id].tobytes(), None, 'float64', None) for row_id in range(size)]
+    return rows, encodings
+
+
+def run(gallery, probes, tolerance):
+    results, times = [], []
+    for probe in probes:
+        start = time.perf_counter()
+        results.append(gallery.match(probe, tolerance)[0])
+        times.append(time.perf_counter() - start)
+    return results, np.percentile(times, 50) * 1000, np.percentile(times, 99) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 8, 16, 32])
+    parser.add_argument('--rerank', type=int, default=32)
+    parser.add_argument('--nlist', type=int, default=0)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--noise', type=float, default=0.02)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    # A tolerance no probe can fail keeps recall about neighbour identity only.
+    tolerance = np.inf
+    print(f"{'size':>8} {'index':>10} {'p50 ms':>8} {'p99 ms':>8} {'recall@1':>9}")
+    for size in args.sizes:
+        rows, encodings = synthetic_gallery(size, rng)
+        probes = encodings[rng.integers(size, size=args.queries)]
+        probes = probes + rng.normal(0.0, args.noise, size=probes.shape)
+
+        gallery = FaceGallery()
+        gallery.build(rows)
+        exact, p50, p99 = run(gallery, probes, tolerance)
+        print(f"{size:>8} {'exact':>10} {p50:>8.3f} {p99:>8.3f} {1.0:>9.3f}")
+
+        for nprobe in args.nprobe:
+            ann_index = IVFIndex(nlist=args.nlist, nprobe=nprobe, rerank=args.rerank, min_train_size=0)
+            gallery.configure_ann(ann_index)
+            approximate, p50, p99 = run(gallery, probes, tolerance)
+            recall = np.mean([a == e for a, e in zip(approximate, exact)])
+            print(f"{size:>8} {f'ivf/{nprobe}':>10} {p50:>8.3f} {p99:>8.3f} {recall:>9.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Throughput of /api/receive/batch compared with one /api/receive call per image.
+
+Runs the Flask app against a throwaway SQLite database with a synthetic
+gallery, then posts the same face images once per request and in batches.
+
+    python benchmarks/bench_batch.py --images path/to/faces --gallery 5000 --batch-size 16
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+
+def load_images(directory, limit):
+    names = sorted(
+        name for name in os.listdir(directory)
+        if name.lower().endswith(('.jpg', '.jpeg', '.png'))
+    )[:limit]
+    if not names:
+        sys.exit(f"No images found in {directory}")
+    images = []
+    for name in names:
+        with open(os.path.join(directory, name), 'rb') as image:
+            images.append((name, image.read()))
+    return images
+
+
+def create_benchmark_app(workdir, gallery_size, seed):
+    # Config paths are resolved from the working directory at import time.
+    os.chdir(workdir)
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ['USE_NX_WITNESS'] = 'false'
+
+    from app import create_app
+    from app.face_recognition.models import FaceEncoding
+    from app.user.models import User
+    from model_base import db
+
+    app = create_app()
+    rng = np.random.default_rng(seed)
+    with app.app_context():
+        users = [
+            User(first_name='Bench', last_name=str(index), email=f'bench{index}@example.com')
+            for index in range(gallery_size)
+        ]
+        db.session.add_all(users)
+        db.session.flush()
+        for user in users:
+            face_encoding = FaceEncoding(user_id=user.id)
+            face_encoding.set_face_encoding(rng.normal(0.0, 0.1, size=128))
+            db.session.add(face_encoding)
+        db.session.commit()
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', required=True, help='Directory of face images.')
+    parser.add_argument('--limit', type=int, default=64, help='Number of images to send.')
+    parser.add_argument('--gallery', type=int, default=1000, help='Synthetic gallery size.')
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    images = load_images(os.path.abspath(args.images), args.limit)
+    app = create_benchmark_app(tempfile.mkdtemp(prefix='face-bench-'), args.gallery, args.seed)
+    client = app.test_client()
+
+    # Warm the gallery and the models before timing.
+    client.post('/api/receive', data={'faceImage': (io.BytesIO(images[0][1]), images[0][0])})
+
+    start = time.perf_counter()
+    for name, image_bytes in images:
+        client.post('/api/receive', data={'faceImage': (io.BytesIO(image_bytes), name)})
+    single = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for offset in range(0, len(images), args.batch_size):
+        batch = images[offset:offset + args.batch_size]
+        client.post('/api/receive/batch', data={
+            'faceImage': [(io.BytesIO(image_bytes), name) for name, image_bytes in batch],
+        })
+    batched = time.perf_counter() - start
+
+    print(f"images: {len(images)}, gallery: {args.gallery}, batch size: {args.batch_size}")
+    print(f"single  : {len(images) / single:8.2f} images/s ({single * 1000 / len(images):.1f} ms/image)")
+    print(f"batched : {len(images) / batched:8.2f} images/s ({batched * 1000 / len(images):.1f} ms/image)")
+
+
+if __name__ == '__main__':
+    main()
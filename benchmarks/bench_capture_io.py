@@ -0,0 +1,87 @@
+"""
+Per-request latency with and without the capture disk round-trip.
+
+"disk" reproduces the old path (write the upload to CAPTURED_FACES_PATH,
+then face_recognition.load_image_file from that path); "memory" decodes the
+bytes directly and hands them to the background CaptureWriter.
+
+    python benchmarks/bench_capture_io.py --images path/to/faces [--encode]
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import face_recognition as face_rec  # noqa: E402
+
+from app.face_recognition.capture_writer import CaptureWriter  # noqa: E402
+
+
+def process(image, encode):
+    if encode:
+        face_rec.face_encodings(image, known_face_locations=face_rec.face_locations(image))
+
+
+def disk_path(image_bytes, directory, index, encode):
+    file_path = os.path.join(directory, f'disk_{index}.jpg')
+    with open(file_path, 'wb') as capture:
+        capture.write(image_bytes)
+    process(face_rec.load_image_file(file_path), encode)
+
+
+def memory_path(image_bytes, directory, index, encode, writer):
+    writer.submit(os.path.join(directory, f'memory_{index}.jpg'), image_bytes)
+    process(face_rec.load_image_file(io.BytesIO(image_bytes)), encode)
+
+
+def report(label, times):
+    times = np.asarray(times) * 1000
+    print(f"{label:>7}: p50 {np.percentile(times, 50):7.2f} ms  p95 {np.percentile(times, 95):7.2f} ms  "
+          f"p99 {np.percentile(times, 99):7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', required=True, help='Directory of face images.')
+    parser.add_argument('--rounds', type=int, default=5, help='Passes over the image set.')
+    parser.add_argument('--encode', action='store_true', help='Include detection and encoding in the timing.')
+    parser.add_argument('--dir', default=None, help='Capture directory (defaults to a temp dir).')
+    args = parser.parse_args()
+
+    images = []
+    for name in sorted(os.listdir(args.images)):
+        if name.lower().endswith(('.jpg', '.jpeg', '.png')):
+            with open(os.path.join(args.images, name), 'rb') as image:
+                images.append(image.read())
+    if not images:
+        sys.exit(f"No images found in {args.images}")
+
+    directory = args.dir or tempfile.mkdtemp(prefix='capture-bench-')
+    writer = CaptureWriter()
+    disk_times, memory_times = [], []
+    for round_index in range(args.rounds):
+        for image_index, image_bytes in enumerate(images):
+            index = round_index * len(images) + image_index
+            start = time.perf_counter()
+            disk_path(image_bytes, directory, index, args.encode)
+            disk_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            memory_path(image_bytes, directory, index, args.encode, writer)
+            memory_times.append(time.perf_counter() - start)
+    writer.close()
+
+    print(f"{len(disk_times)} requests, capture dir {directory}, encode={args.encode}")
+    report('disk', disk_times)
+    report('memory', memory_times)
+    print(f"capture writer: {writer.written} written, {writer.dropped} dropped")
+
+
+if __name__ == '__main__':
+    main()
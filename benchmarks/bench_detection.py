@@ -0,0 +1,79 @@
+"""
+Detection latency and accuracy at each detection scale.
+
+Runs detect_faces over a set of frames with every combination of target
+resolution, upsampling and coarse-to-fine refinement, and compares the boxes
+with a reference run at native resolution (upsample 1). A face counts as
+found when a box overlaps a reference box with IoU >= 0.5.
+
+    python benchmarks/bench_detection.py --images path/to/frames --dimensions 0 1280 960 640 480
+"""
+import argparse
+import itertools
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import face_recognition as face_rec  # noqa: E402
+
+from app.face_recognition.detection import DetectionSettings, detect_faces  # noqa: E402
+
+
+def iou(a, b):
+    top, right = max(a[0], b[0]), min(a[1], b[1])
+    bottom, left = min(a[2], b[2]), max(a[3], b[3])
+    inter = max(0, bottom - top) * max(0, right - left)
+    area = (a[2] - a[0]) * (a[1] - a[3]) + (b[2] - b[0]) * (b[1] - b[3]) - inter
+    return inter / area if area else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', required=True, help='Directory of camera frames.')
+    parser.add_argument('--dimensions', type=int, nargs='+', default=[0, 1280, 960, 640, 480])
+    parser.add_argument('--upsample', type=int, nargs='+', default=[0, 1, 2])
+    parser.add_argument('--model', default='hog')
+    args = parser.parse_args()
+
+    frames = [
+        face_rec.load_image_file(os.path.join(args.images, name))
+        for name in sorted(os.listdir(args.images))
+        if name.lower().endswith(('.jpg', '.jpeg', '.png'))
+    ]
+    if not frames:
+        sys.exit(f"No images found in {args.images}")
+
+    reference = [detect_faces(frame, DetectionSettings(upsample=1, model=args.model)) for frame in frames]
+    total = sum(len(boxes) for boxes in reference)
+    print(f"{len(frames)} frames, {total} reference faces")
+    print(f"{'max dim':>8} {'upsample':>8} {'c2f':>5} {'p50 ms':>8} {'p95 ms':>8} {'recall':>7} {'extra':>6}")
+
+    for dimension, upsample, coarse_to_fine in itertools.product(args.dimensions, args.upsample, (False, True)):
+        if coarse_to_fine and not dimension:
+            continue
+        settings = DetectionSettings(
+            max_dimension=dimension,
+            upsample=upsample,
+            coarse_to_fine=coarse_to_fine,
+            model=args.model,
+        )
+        times, found, extra = [], 0, 0
+        for frame, expected in zip(frames, reference):
+            start = time.perf_counter()
+            boxes = detect_faces(frame, settings)
+            times.append(time.perf_counter() - start)
+            matched = sum(any(iou(box, ref) >= 0.5 for box in boxes) for ref in expected)
+            found += matched
+            extra += max(0, len(boxes) - matched)
+        times = np.asarray(times) * 1000
+        recall = found / total if total else 1.0
+        print(f"{dimension or 'native':>8} {upsample:>8} {str(coarse_to_fine):>5} "
+              f"{np.percentile(times, 50):>8.1f} {np.percentile(times, 95):>8.1f} {recall:>7.3f} {extra:>6}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Storage size, gallery load time and match accuracy per encoding format.
+
+Encodes a synthetic gallery in every FaceEncoding storage format, times how
+long FaceGallery takes to decode and index it, and compares matches against
+the float64 reference.
+
+    python benchmarks/bench_encoding_formats.py --size 50000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.face_recognition.encoding_format import ENCODING_FORMATS, FORMAT_FLOAT64, encode_vector  # noqa: E402
+from app.face_recognition.gallery import ENCODING_DIMENSION, FaceGallery  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=50000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--noise', type=float, default=0.03)
+    parser.add_argument('--tolerance', type=float, default=0.6)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    encodings = rng.normal(0.0, 0.1, size=(args.size, ENCODING_DIMENSION))
+    targets = rng.integers(args.size, size=args.queries)
+    # Half the probes are noisy copies of enrolled faces, half are strangers.
+    probes = encodings[targets] + rng.normal(0.0, args.noise, size=(args.queries, ENCODING_DIMENSION))
+    probes[args.queries // 2:] = rng.normal(0.0, 0.1, size=(args.queries - args.queries // 2, ENCODING_DIMENSION))
+
+    reference = None
+    print(f"{'format':>8} {'bytes/row':>10} {'load ms':>9} {'agree@1':>8} {'decision':>9} {'max |dd|':>9}")
+    for encoding_format in ENCODING_FORMATS:
+        rows = []
+        for row_id, encoding in enumerate(encodings):
+            raw, scale = encode_vector(encoding, encoding_format)
+            rows.append((row_id, row_id, raw, None, encoding_format, scale))
+
+        gallery = FaceGallery(dtype=np.float64 if encoding_format == FORMAT_FLOAT64 else np.float32)
+        load_start = time.perf_counter()
+        gallery.build(rows)
+        load_ms = (time.perf_counter() - load_start) * 1000
+
+        # tolerance=inf returns the nearest neighbour for every probe.
+        nearest = [gallery.match(probe, np.inf) for probe in probes]
+        if reference is None:
+            reference = nearest
+        agree = np.mean([n[0] == r[0] for n, r in zip(nearest, reference)])
+        decision = np.mean([(n[1] <= args.tolerance) == (r[1] <= args.tolerance) for n, r in zip(nearest, reference)])
+        max_error = max(abs(n[1] - r[1]) for n, r in zip(nearest, reference))
+        print(f"{encoding_format:>8} {len(rows[0][2]):>10} {load_ms:>9.1f} {agree:>8.3f} {decision:>9.3f} {max_error:>9.5f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Encoding throughput of the recognition engine in thread and process mode.
+
+Submits every image from --images through engine.encode_image from
+--concurrency client threads, as the blueprints do, and reports images per
+second and per-image latency for each mode.
+
+    python benchmarks/bench_engine.py --images path/to/faces --processes 16 --concurrency 32 --pin
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.face_recognition.detection import DetectionSettings  # noqa: E402
+from app.face_recognition.engine import RecognitionEngine  # noqa: E402
+
+
+def run(engine, images, concurrency, settings):
+    def timed(image_bytes):
+        start = time.perf_counter()
+        engine.encode_image(image_bytes, settings)
+        return time.perf_counter() - start
+
+    # Warm-up: starts the worker processes and loads their models.
+    for image_bytes in images[:concurrency]:
+        timed(image_bytes)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as clients:
+        latencies = list(clients.map(timed, images))
+    return time.perf_counter() - start, np.asarray(latencies) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', required=True, help='Directory of face images.')
+    parser.add_argument('--rounds', type=int, default=3, help='Passes over the image set.')
+    parser.add_argument('--concurrency', type=int, default=os.cpu_count())
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    parser.add_argument('--pin', action='store_true', help='Pin each worker process to one CPU.')
+    args = parser.parse_args()
+
+    images = []
+    for name in sorted(os.listdir(args.images)):
+        if name.lower().endswith(('.jpg', '.jpeg', '.png')):
+            with open(os.path.join(args.images, name), 'rb') as image:
+                images.append(image.read())
+    if not images:
+        sys.exit(f"No images found in {args.images}")
+    images = images * args.rounds
+
+    settings = DetectionSettings()
+    print(f"{len(images)} images, {args.concurrency} concurrent clients")
+    for mode in ('thread', 'process'):
+        engine = RecognitionEngine(
+            mode=mode,
+            max_workers=args.concurrency,
+            processes=args.processes,
+            pin_cpus=args.pin,
+        )
+        try:
+            elapsed, latencies = run(engine, images, args.concurrency, settings)
+        finally:
+            engine.shutdown()
+        print(f"{mode:>8}: {len(images) / elapsed:8.1f} images/s  p50 {np.percentile(latencies, 50):7.1f} ms  "
+              f"p95 {np.percentile(latencies, 95):7.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Gallery matching latency against gallery size.
+
+Compares the original per-user `face_recognition.compare_faces` loop with the
+vectorized FaceGallery.match on synthetic 128-d encodings.
+
+    python benchmarks/bench_gallery.py --sizes 100 1000 5000 20000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import face_recognition as face_rec  # noqa: E402
+
+from app.face_recognition.gallery import ENCODING_DIMENSION, FaceGallery  # noqa: E402
+
+
+def synthetic_rows(size, rng):
+    encodings = rng.normal(0.0, 0.1, size=(size, ENCODING_DIMENSION))
+    rows = [(user_id, user_id, encodings[user_id].tobytes(), None, 'float64', None) for user_id in range(size)]
+    return rows, encodings
+
+
+def time_loop(known_encodings, probe, tolerance):
+    start = time.perf_counter()
+    for known_encoding in known_encodings.values():
+        if True in face_rec.compare_faces([known_encoding], probe, tolerance=tolerance):
+            break
+    return time.perf_counter() - start
+
+
+def time_gallery(gallery, probe, tolerance):
+    start = time.perf_counter()
+    gallery.match(probe, tolerance)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 5000, 20000])
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--tolerance', type=float, default=0.6)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    print(f"{'size':>8} {'loop p50 ms':>12} {'gallery p50 ms':>15} {'speedup':>8}")
+    for size in args.sizes:
+        rows, encodings = synthetic_rows(size, rng)
+        known_encodings = {user_id: encodings[user_id] for user_id in range(size)}
+        gallery = FaceGallery()
+        gallery.build(rows)
+
+        # Probes far from every enrolled face force a full scan, the worst case
+        # for the loop and the common case for unknown visitors.
+        probes = rng.normal(5.0, 0.1, size=(args.queries, ENCODING_DIMENSION))
+        loop_times = [time_loop(known_encodings, probe, args.tolerance) for probe in probes]
+        gallery_times = [time_gallery(gallery, probe, args.tolerance) for probe in probes]
+
+        loop_p50 = np.median(loop_times) * 1000
+        gallery_p50 = np.median(gallery_times) * 1000
+        print(f"{size:>8} {loop_p50:>12.3f} {gallery_p50:>15.3f} {loop_p50 / gallery_p50:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Detection time per frame with and without motion gating on a recorded clip.
+
+Samples the clip at --fps as the ingestion workers do and runs face
+detection on every sampled frame, then only where the motion gate lets it
+through (skipped, restricted to the changed regions, or the whole frame).
+A mostly static clip, such as an empty corridor, shows the saving.
+
+    python benchmarks/bench_motion.py --clip path/to/clip.mp4 --fps 5 --threshold 25 --min-area 0.002
+"""
+import argparse
+import os
+import sys
+import time
+
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.camera.motion import MotionGate, MotionSettings  # noqa: E402
+from app.face_recognition.detection import DetectionSettings, detect_faces  # noqa: E402
+
+
+def sample_frames(path, fps):
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        sys.exit(f"Cannot open {path}")
+    step = max(1, round((capture.get(cv2.CAP_PROP_FPS) or 25) / fps))
+    frames, index = [], 0
+    while True:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        if index % step == 0:
+            frames.append(frame)
+        index += 1
+    capture.release()
+    return frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clip', required=True, help='Recorded camera clip.')
+    parser.add_argument('--fps', type=float, default=5.0, help='Sampling rate.')
+    parser.add_argument('--threshold', type=int, default=25, help='Grey-level change per pixel.')
+    parser.add_argument('--min-area', type=float, default=0.002, help='Changed fraction that triggers detection.')
+    parser.add_argument('--width', type=int, default=320, help='Width the comparison runs on.')
+    parser.add_argument('--max-dimension', type=int, default=0)
+    args = parser.parse_args()
+
+    frames = sample_frames(args.clip, args.fps)
+    settings = DetectionSettings(max_dimension=args.max_dimension)
+    print(f"{len(frames)} frames sampled at {args.fps} fps")
+
+    start = time.perf_counter()
+    faces = sum(len(detect_faces(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), settings)) for frame in frames)
+    elapsed = time.perf_counter() - start
+    print(f"{'ungated':>8}: {1000 * elapsed / len(frames):7.2f} ms/frame  {faces:6d} faces")
+
+    gate = MotionGate(MotionSettings(enabled=True, threshold=args.threshold, min_area=args.min_area, width=args.width))
+    faces = 0
+    start = time.perf_counter()
+    for frame in frames:
+        regions = gate.check(frame)
+        if regions != MotionGate.SKIP:
+            faces += len(detect_faces(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), settings, regions))
+    elapsed = time.perf_counter() - start
+    stats = gate.stats()
+    print(f"{'gated':>8}: {1000 * elapsed / len(frames):7.2f} ms/frame  {faces:6d} faces  "
+          f"{stats['frames_skipped']} skipped, {stats['frames_partial']} partial, {stats['frames_full']} full")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Encodings per second with and without face tracking on a recorded clip.
+
+Samples the clip at --fps as the ingestion workers do and processes every
+sampled frame twice: detect and encode every face (no tracking), and
+detect, track and encode only new or re-verified tracks. Reports frames
+and encodings per second, and how many log rows each mode would write.
+
+    python benchmarks/bench_tracking.py --clip path/to/clip.mp4 --fps 5 --reverify 5
+"""
+import argparse
+import os
+import sys
+import time
+
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.camera.tracking import FaceTracker  # noqa: E402
+from app.face_recognition.detection import DetectionSettings, detect_faces, encode_boxes, encode_faces  # noqa: E402
+
+
+def sample_frames(path, fps):
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        sys.exit(f"Cannot open {path}")
+    native_fps = capture.get(cv2.CAP_PROP_FPS) or 25
+    step = max(1, round(native_fps / fps))
+    frames, index = [], 0
+    while True:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        if index % step == 0:
+            # Timestamps in clip time, so tracks age as they would live.
+            frames.append((index / native_fps, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)))
+        index += 1
+    capture.release()
+    return frames
+
+
+def without_tracking(frames, settings):
+    encodings = 0
+    for _, frame in frames:
+        encodings += len(encode_faces(frame, settings))
+    # Every face of every frame is logged.
+    return encodings, encodings
+
+
+def with_tracking(frames, settings, tracker):
+    encodings = logged = 0
+    for now, frame in frames:
+        tracks = tracker.update(detect_faces(frame, settings), now)
+        stale = [track for track in tracks if tracker.needs_verification(track, now)]
+        faces = encode_boxes(frame, [track.box for track in stale])
+        encodings += len(faces)
+        for track in stale:
+            # Without a gallery every face is unknown, so only new tracks log.
+            logged += tracker.verify(track, None, now)
+    return encodings, logged
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clip', required=True, help='Recorded camera clip.')
+    parser.add_argument('--fps', type=float, default=5.0, help='Sampling rate.')
+    parser.add_argument('--reverify', type=float, default=5.0, help='Track re-verification interval, seconds.')
+    parser.add_argument('--max-age', type=float, default=1.0, help='Seconds before an unseen track ends.')
+    parser.add_argument('--max-dimension', type=int, default=0)
+    args = parser.parse_args()
+
+    frames = sample_frames(args.clip, args.fps)
+    settings = DetectionSettings(max_dimension=args.max_dimension)
+    print(f"{len(frames)} frames sampled at {args.fps} fps")
+
+    start = time.perf_counter()
+    encodings, logged = without_tracking(frames, settings)
+    elapsed = time.perf_counter() - start
+    print(f"{'no tracking':>12}: {len(frames) / elapsed:7.1f} frames/s  {encodings:6d} encodings "
+          f"({encodings / elapsed:7.1f}/s)  {logged:6d} log rows")
+
+    tracker = FaceTracker(max_age=args.max_age, reverify_interval=args.reverify)
+    start = time.perf_counter()
+    encodings, logged = with_tracking(frames, settings, tracker)
+    elapsed = time.perf_counter() - start
+    print(f"{'tracking':>12}: {len(frames) / elapsed:7.1f} frames/s  {encodings:6d} encodings "
+          f"({encodings / elapsed:7.1f}/s)  {logged:6d} log rows  {tracker.tracks_started} tracks")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Local stand-in for the NX Witness bookmark API.
+
+Answers POST /rest/v2/devices/<id>/bookmarks with a 307 to
+/redirected/rest/v2/devices/<id>/bookmarks, like a server that forwards to
+the camera's owner, and the redirected path with 200. Responses can be
+delayed and a fraction of them failed to exercise retries. Request and
+connection counts are printed every few seconds.
+
+    python benchmarks/nx_stub_server.py --port 7001 --delay 0.5 --fail-rate 0.1
+
+then run the app against it with
+    USE_NX_WITNESS=true NX_SERVER_IP=127.0.0.1 NX_SERVER_PORT=7001 NX_DEVICE_ID=cam NX_SERVER_ID=srv
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+stats = {'connections': 0, 'redirects': 0, 'bookmarks': 0, 'failures': 0}
+stats_lock = threading.Lock()
+
+
+def make_handler(delay: float, fail_rate: float):
+    class BookmarkHandler(BaseHTTPRequestHandler):
+        # Keep-alive, so pooled clients reuse one connection.
+        protocol_version = 'HTTP/1.1'
+
+        def setup(self):
+            super().setup()
+            with stats_lock:
+                stats['connections'] += 1
+
+        def _reply(self, status: int, body: dict = None, headers: dict = None):
+            data = json.dumps(body or {}).encode()
+            self.send_response(status)
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            if not self.path.startswith('/redirected/'):
+                with stats_lock:
+                    stats['redirects'] += 1
+                host = self.headers.get('Host')
+                self._reply(307, headers={'Location': f'http://{host}/redirected{self.path}'})
+                return
+            time.sleep(delay)
+            if random.random() < fail_rate:
+                with stats_lock:
+                    stats['failures'] += 1
+                self._reply(503, {'error': 'stub failure'})
+                return
+            with stats_lock:
+                stats['bookmarks'] += 1
+            self._reply(200, {'id': stats['bookmarks'], **payload})
+
+        def log_message(self, format, *args):
+            pass
+
+    return BookmarkHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7001)
+    parser.add_argument('--delay', type=float, default=0.0, help='Seconds before answering a bookmark.')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='Fraction of bookmarks answered with 503.')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args.delay, args.fail_rate))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"NX stub listening on http://{args.host}:{args.port}")
+    try:
+        while True:
+            time.sleep(5)
+            with stats_lock:
+                print(json.dumps(stats))
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,303 @@
+"""
+Offline benchmark suite for the recognition pipeline.
+
+For each synthetic gallery size (random 128-d encodings, one user each),
+runs three scenarios and reports throughput and p50/p95/p99 latency, with
+the pipeline stages (decode, detect, encode, worker, match, lookup, log,
+bookmark) broken down from app.instrumentation:
+
+    match-<size>     FaceGallery.match_many on one random probe at a time.
+    handler-<size>   FaceRecognitionHandler.handle_face_recognition in the
+                     app context, against a temporary SQLite database.
+    http-<size>      POST /api/receive through the Flask test client.
+
+Bookmarks are enabled against an in-process NX stub (see nx_stub_server.py),
+so the bookmark stage covers the outbox insert on the request path; the
+result cache and debouncing are off so every request runs the pipeline.
+
+Face images are not shipped with the repository. Pass a directory of them
+with --images; without it, synthetic frames are used, in which no face is
+found, so only the decode and detect stages are exercised.
+
+Results are written as JSON with --output. With --baseline, they are
+compared with a previous run's JSON and the suite exits with status 1 when
+a latency p95 grew, or a throughput fell, by more than --tolerance.
+
+    python benchmarks/suite.py --images path/to/faces --sizes 1000 10000 100000 --output results.json
+    python benchmarks/suite.py --images path/to/faces --baseline results.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from nx_stub_server import make_handler  # noqa: E402
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+PERCENTILES = (50, 95, 99)
+
+
+def load_images(directory, limit):
+    if not directory:
+        rng = np.random.default_rng(0)
+        images = []
+        for index in range(8):
+            y, x = np.mgrid[0:480, 0:640]
+            frame = np.dstack([(x + 40 * index) % 256, y % 256, (x + y) // 5 % 256]).astype(np.uint8)
+            frame = cv2.add(frame, rng.integers(0, 24, frame.shape, dtype=np.uint8))
+            images.append((f'synthetic-{index}.jpg', cv2.imencode('.jpg', frame)[1].tobytes()))
+        return images
+    names = sorted(name for name in os.listdir(directory) if name.lower().endswith(IMAGE_EXTENSIONS))[:limit]
+    if not names:
+        sys.exit(f"No images in {directory}")
+    images = []
+    for name in names:
+        with open(os.path.join(directory, name), 'rb') as image:
+            images.append((name, image.read()))
+    return images
+
+
+def summarize(latencies, stage_samples, elapsed):
+    """
+    Throughput and latency percentiles, in ms, of one scenario.
+    """
+    latencies = np.asarray(latencies) * 1000
+    result = {
+        'requests': len(latencies),
+        'throughput': round(len(latencies) / elapsed, 2) if elapsed else None,
+        'latency_ms': {f'p{p}': round(float(np.percentile(latencies, p)), 3) for p in PERCENTILES},
+        'stages': {},
+    }
+    for name, samples in stage_samples.items():
+        samples = np.asarray(samples) * 1000
+        result['stages'][name] = {
+            'calls': len(samples),
+            **{f'p{p}': round(float(np.percentile(samples, p)), 3) for p in PERCENTILES},
+        }
+    return result
+
+
+def run_timed(call, inputs, warmup):
+    """
+    Call `call(input)` for every input, tracing its stages. The first
+    `warmup` calls are not counted.
+    """
+    from app.instrumentation import trace_stages
+
+    for item in inputs[:warmup]:
+        call(item)
+    latencies, stage_samples = [], {}
+    start = time.perf_counter()
+    for item in inputs[warmup:]:
+        with trace_stages() as stages:
+            call_start = time.perf_counter()
+            call(item)
+            latencies.append(time.perf_counter() - call_start)
+        for name, seconds in stages.items():
+            stage_samples.setdefault(name, []).append(seconds)
+    return summarize(latencies, stage_samples, time.perf_counter() - start)
+
+
+def bench_match(size, queries, warmup, rng):
+    from app.face_recognition.gallery import ENCODING_DIMENSION, FaceGallery
+    from app.instrumentation import stage
+
+    encodings = rng.normal(0.0, 0.1, size=(size, ENCODING_DIMENSION))
+    gallery = FaceGallery()
+    gallery.build([(index, index, encodings[index].tobytes(), None, 'float64', None) for index in range(size)])
+    probes = list(rng.normal(0.0, 0.1, size=(warmup + queries, ENCODING_DIMENSION)))
+
+    def match(probe):
+        with stage('match'):
+            gallery.match_many([probe], tolerance=0.6)
+
+    return run_timed(match, probes, warmup)
+
+
+def fill_gallery(size, rng):
+    """
+    Replace the users and encodings with `size` synthetic ones, in bulk.
+    """
+    from sqlalchemy import delete, insert
+
+    from app.face_recognition.encoding_format import encode_vector
+    from app.face_recognition.gallery import ENCODING_DIMENSION, gallery
+    from app.face_recognition.models import FaceEncoding, GalleryState, RecognitionLog
+    from app.user.models import User
+    from model_base import db
+
+    now = datetime.utcnow()
+    with db.engine.begin() as connection:
+        connection.execute(delete(RecognitionLog))
+        connection.execute(delete(FaceEncoding))
+        connection.execute(delete(User))
+        for start in range(0, size, 10000):
+            count = min(10000, size - start)
+            connection.execute(insert(User), [
+                {'id': start + index + 1, 'first_name': 'Bench', 'last_name': str(start + index),
+                 'email': f'bench{start + index}@example.com', 'created_at': now, 'updated_at': now}
+                for index in range(count)
+            ])
+            encodings = rng.normal(0.0, 0.1, size=(count, ENCODING_DIMENSION))
+            rows = []
+            for index in range(count):
+                data, scale = encode_vector(encodings[index], 'float32')
+                rows.append({'user_id': start + index + 1, 'encoding': data, 'encoding_format': 'float32',
+                             'encoding_scale': scale, 'created_at': now, 'updated_at': now})
+            connection.execute(insert(FaceEncoding), rows)
+        GalleryState.bump_generation(connection)
+    gallery.load()
+
+
+def create_bench_app(workdir, nx_port):
+    os.environ.update({
+        'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        'USE_NX_WITNESS': 'true',
+        'NX_SERVER_IP': '127.0.0.1',
+        'NX_SERVER_PORT': str(nx_port),
+        'NX_DEVICE_ID': 'bench',
+        'NX_SERVER_ID': 'bench',
+        'RESULT_CACHE_SIZE': '0',
+        'RECOGNITION_DEBOUNCE_SECONDS': '0',
+    })
+    # Upload folders are created relative to the working directory.
+    os.chdir(workdir)
+    from app import create_app
+    return create_app()
+
+
+def bench_pipeline(app, images, requests, warmup):
+    from app.face_recognition.services import FaceRecognitionHandler
+
+    inputs = [images[index % len(images)][1] for index in range(warmup + requests)]
+
+    def handle(image_bytes):
+        with app.app_context():
+            FaceRecognitionHandler().handle_face_recognition(image_bytes)
+
+    handler_result = run_timed(handle, inputs, warmup)
+
+    client = app.test_client()
+
+    def post(image_bytes):
+        import io
+        client.post('/api/receive', data={'faceImage': (io.BytesIO(image_bytes), 'bench.jpg')})
+
+    return handler_result, run_timed(post, inputs, warmup)
+
+
+def compare(results, baseline, tolerance):
+    """
+    Print scenario metrics next to the baseline; returns the regressions.
+    """
+    regressions = []
+    print(f"\n{'scenario':<16} {'metric':<22} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, current in results['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if previous is None:
+            continue
+        metrics = [('throughput', previous['throughput'], current['throughput'], False),
+                   ('latency p95 ms', previous['latency_ms']['p95'], current['latency_ms']['p95'], True)]
+        for stage_name, stage in current['stages'].items():
+            if stage_name in previous['stages']:
+                metrics.append((f'{stage_name} p95 ms', previous['stages'][stage_name]['p95'], stage['p95'], True))
+        for metric, old, new, lower_is_better in metrics:
+            if not old or new is None:
+                continue
+            change = new / old - 1
+            regressed = change > tolerance if lower_is_better else change < -tolerance
+            if regressed:
+                regressions.append(f"{name} {metric}")
+            print(f"{name:<16} {metric:<22} {old:>10.3f} {new:>10.3f} {change:>+7.1%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def print_results(results):
+    print(f"{'scenario':<16} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}  stages p50 ms")
+    for name, result in results['scenarios'].items():
+        latency = result['latency_ms']
+        stages = '  '.join(f"{stage}={values['p50']:.2f}" for stage, values in result['stages'].items())
+        print(f"{name:<16} {result['throughput']:>9.1f} {latency['p50']:>9.2f} {latency['p95']:>9.2f} "
+              f"{latency['p99']:>9.2f}  {stages}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', default=None, help='Directory of face images (synthetic frames if omitted).')
+    parser.add_argument('--max-images', type=int, default=100)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--queries', type=int, default=500, help='Probes per match scenario.')
+    parser.add_argument('--requests', type=int, default=50, help='Requests per handler and http scenario.')
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--skip-pipeline', action='store_true', help='Only run the match scenarios.')
+    parser.add_argument('--output', default=None, help='Write the results as JSON to this file.')
+    parser.add_argument('--baseline', default=None, help='Compare with the JSON results of a previous run.')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative change before a regression.')
+    args = parser.parse_args()
+
+    images = load_images(args.images, args.max_images)
+    if not args.images:
+        print("No --images given: synthetic frames have no faces, only decode and detect are exercised.")
+
+    results = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'images': args.images or 'synthetic',
+            'image_count': len(images),
+            'args': vars(args),
+        },
+        'scenarios': {},
+    }
+
+    rng = np.random.default_rng(args.seed)
+    for size in args.sizes:
+        results['scenarios'][f'match-{size}'] = bench_match(size, args.queries, args.warmup, rng)
+
+    if not args.skip_pipeline:
+        server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(0.0, 0.0))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        workdir = tempfile.mkdtemp(prefix='bench-suite-')
+        app = create_bench_app(workdir, server.server_address[1])
+        for size in args.sizes:
+            with app.app_context():
+                fill_gallery(size, rng)
+            handler_result, http_result = bench_pipeline(app, images, args.requests, args.warmup)
+            results['scenarios'][f'handler-{size}'] = handler_result
+            results['scenarios'][f'http-{size}'] = http_result
+        server.shutdown()
+
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regressions over {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+        print("\nNo regressions.")
+
+
+if __name__ == '__main__':
+    main()
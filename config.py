@@ -16,7 +16,95 @@ class Config:
     NX_AUTH_USER = os.getenv('NX_AUTH_USER')
     NX_AUTH_PASS = os.getenv('NX_AUTH_PASS')
     USE_NX_WITNESS: bool = os.getenv('USE_NX_WITNESS', 'False').lower() in ['true', '1', 'yes']
+    NX_REQUEST_TIMEOUT = float(os.getenv('NX_REQUEST_TIMEOUT', 10))
+    NX_OUTBOX_POLL_INTERVAL = float(os.getenv('NX_OUTBOX_POLL_INTERVAL', 1.0))
+    NX_OUTBOX_BATCH_SIZE = int(os.getenv('NX_OUTBOX_BATCH_SIZE', 100))
+    NX_OUTBOX_LEASE = float(os.getenv('NX_OUTBOX_LEASE', 60))
+    NX_OUTBOX_RETENTION = float(os.getenv('NX_OUTBOX_RETENTION', 86400))
+    # Merge one person's bookmarks starting within this many ms; 0 keeps every bookmark.
+    NX_BOOKMARK_COALESCE_MS = int(os.getenv('NX_BOOKMARK_COALESCE_MS', 0))
+    NX_MAX_ATTEMPTS = int(os.getenv('NX_MAX_ATTEMPTS', 8))
+    NX_RETRY_BASE = float(os.getenv('NX_RETRY_BASE', 1.0))
+    NX_RETRY_MAX = float(os.getenv('NX_RETRY_MAX', 300))
     MAX_WORKERS = int(os.getenv('MAX_WORKERS', 5))
+    RECOGNITION_ENGINE = os.getenv('RECOGNITION_ENGINE', 'thread')
+    ENGINE_PROCESSES = int(os.getenv('ENGINE_PROCESSES', 0))
+    ENGINE_PIN_CPUS = os.getenv('ENGINE_PIN_CPUS', 'False').lower() in ['true', '1', 'yes']
+    ENGINE_THREADS_PER_PROCESS = int(os.getenv('ENGINE_THREADS_PER_PROCESS', 1))
+    MAX_FACES_PER_FRAME = int(os.getenv('MAX_FACES_PER_FRAME', 64))
+    JOB_STORE_SIZE = int(os.getenv('JOB_STORE_SIZE', 1000))
+    JOB_TTL = float(os.getenv('JOB_TTL', 300))
+    JOB_CALLBACK_TIMEOUT = float(os.getenv('JOB_CALLBACK_TIMEOUT', 5))
+    JOB_CALLBACK_WORKERS = int(os.getenv('JOB_CALLBACK_WORKERS', 2))
+    # Hosts job callbacks may be posted to; empty allows any public address.
+    JOB_CALLBACK_ALLOWED_HOSTS = [host.strip() for host in os.getenv('JOB_CALLBACK_ALLOWED_HOSTS', '').split(',') if host.strip()]
+    RECOGNITION_LOG_DURABILITY = os.getenv('RECOGNITION_LOG_DURABILITY', 'sync')
+    RECOGNITION_LOG_FLUSH_ROWS = int(os.getenv('RECOGNITION_LOG_FLUSH_ROWS', 500))
+    RECOGNITION_LOG_FLUSH_MS = int(os.getenv('RECOGNITION_LOG_FLUSH_MS', 1000))
+    RECOGNITION_LOG_MAX_BUFFERED = int(os.getenv('RECOGNITION_LOG_MAX_BUFFERED', 100000))
+    RECOGNITION_LOG_PAGE_SIZE = int(os.getenv('RECOGNITION_LOG_PAGE_SIZE', 100))
+    RECOGNITION_LOG_MAX_PAGE_SIZE = int(os.getenv('RECOGNITION_LOG_MAX_PAGE_SIZE', 1000))
+    RECOGNITION_LOG_EXPORT_BATCH_SIZE = int(os.getenv('RECOGNITION_LOG_EXPORT_BATCH_SIZE', 1000))
+    RECOGNITION_LOG_EXPORT_CHUNK_SIZE = int(os.getenv('RECOGNITION_LOG_EXPORT_CHUNK_SIZE', 65536))
+    INGEST_FPS = float(os.getenv('INGEST_FPS', 2.0))
+    INGEST_RECONNECT_DELAY = float(os.getenv('INGEST_RECONNECT_DELAY', 5.0))
+    # Streams run inside one server process: with several workers (e.g.
+    # gunicorn -w 4) only the one holding INGEST_LOCK_FILE autostarts them,
+    # and the /cameras/<id>/stream routes only see the worker they reach, so
+    # run ingestion with a single worker.
+    INGEST_AUTOSTART = os.getenv('INGEST_AUTOSTART', 'False').lower() in ['true', '1', 'yes']
+    # Accept local video files as stream URLs; for testing only.
+    INGEST_ALLOW_FILES = os.getenv('INGEST_ALLOW_FILES', 'False').lower() in ['true', '1', 'yes']
+    INGEST_LOCK_FILE = os.getenv('INGEST_LOCK_FILE', os.path.join(os.getcwd(), 'uploads', 'ingest.lock'))
+    TRACKING_ENABLED = os.getenv('TRACKING_ENABLED', 'True').lower() in ['true', '1', 'yes']
+    TRACK_IOU_THRESHOLD = float(os.getenv('TRACK_IOU_THRESHOLD', 0.3))
+    TRACK_MAX_AGE = float(os.getenv('TRACK_MAX_AGE', 1.0))
+    TRACK_REVERIFY_INTERVAL = float(os.getenv('TRACK_REVERIFY_INTERVAL', 5.0))
+    RECOGNITION_DEBOUNCE_SECONDS = float(os.getenv('RECOGNITION_DEBOUNCE_SECONDS', 0))
+    RECOGNITION_DEBOUNCE_MAX_SECONDS = float(os.getenv('RECOGNITION_DEBOUNCE_MAX_SECONDS', 300))
+    RECOGNITION_DEBOUNCE_MAX_WINDOWS = int(os.getenv('RECOGNITION_DEBOUNCE_MAX_WINDOWS', 1000))
+    RECOGNITION_DEBOUNCE_UNKNOWN_TOLERANCE = float(os.getenv('RECOGNITION_DEBOUNCE_UNKNOWN_TOLERANCE', 0.5))
+    RESULT_CACHE_SIZE = int(os.getenv('RESULT_CACHE_SIZE', 1024))
+    RESULT_CACHE_TTL = float(os.getenv('RESULT_CACHE_TTL', 30))
+    RESULT_CACHE_PERCEPTUAL = os.getenv('RESULT_CACHE_PERCEPTUAL', 'False').lower() in ['true', '1', 'yes']
+    RESULT_CACHE_PERCEPTUAL_DISTANCE = int(os.getenv('RESULT_CACHE_PERCEPTUAL_DISTANCE', 4))
+    # Encoding processes of `flask users enroll` (0: one per CPU), and the
+    # smaller number used by imports posted to /users/bulk, which share the
+    # machine with recognition.
+    ENROLL_PROCESSES = int(os.getenv('ENROLL_PROCESSES', 0))
+    ENROLL_JOB_PROCESSES = int(os.getenv('ENROLL_JOB_PROCESSES', 2))
+    ENROLL_BATCH_SIZE = int(os.getenv('ENROLL_BATCH_SIZE', 200))
+    MOTION_GATING = os.getenv('MOTION_GATING', 'False').lower() in ['true', '1', 'yes']
+    MOTION_THRESHOLD = int(os.getenv('MOTION_THRESHOLD', 25))
+    MOTION_MIN_AREA = float(os.getenv('MOTION_MIN_AREA', 0.002))
+    MOTION_WIDTH = int(os.getenv('MOTION_WIDTH', 320))
+    LOG_DIR = os.getenv('LOG_DIR', os.path.join(os.getcwd(), 'logs'))
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_LEVELS = os.getenv('LOG_LEVELS', '')
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+    LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+    LOG_MATCH_SAMPLE_RATE = float(os.getenv('LOG_MATCH_SAMPLE_RATE', 0.01))
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True').lower() in ['true', '1', 'yes']
+    MAX_BATCH_IMAGES = int(os.getenv('MAX_BATCH_IMAGES', 64))
+    MAX_BATCH_IMAGE_BYTES = int(os.getenv('MAX_BATCH_IMAGE_BYTES', 20 * 1024 * 1024))
+    CAPTURE_QUEUE_SIZE = int(os.getenv('CAPTURE_QUEUE_SIZE', 256))
+    DETECTION_MAX_DIMENSION = int(os.getenv('DETECTION_MAX_DIMENSION', 0))
+    DETECTION_UPSAMPLE = int(os.getenv('DETECTION_UPSAMPLE', 1))
+    DETECTION_COARSE_TO_FINE = os.getenv('DETECTION_COARSE_TO_FINE', 'False').lower() in ['true', '1', 'yes']
+    DETECTION_MODEL = os.getenv('DETECTION_MODEL', 'hog')
+    FACE_MATCH_TOLERANCE = float(os.getenv('FACE_MATCH_TOLERANCE', 0.6))
+    FACE_ENCODING_FORMAT = os.getenv('FACE_ENCODING_FORMAT', 'float32')
+    ENCODING_MAX_PER_USER = int(os.getenv('ENCODING_MAX_PER_USER', 10))
+    ENCODING_MAX_TEMPLATES = int(os.getenv('ENCODING_MAX_TEMPLATES', 3))
+    ENCODING_OUTLIER_DISTANCE = float(os.getenv('ENCODING_OUTLIER_DISTANCE', 0.35))
+    GALLERY_SYNC_INTERVAL = float(os.getenv('GALLERY_SYNC_INTERVAL', 1.0))
+    GALLERY_INDEX = os.getenv('GALLERY_INDEX', 'exact')
+    IVF_NLIST = int(os.getenv('IVF_NLIST', 0))
+    IVF_NPROBE = int(os.getenv('IVF_NPROBE', 16))
+    IVF_RERANK = int(os.getenv('IVF_RERANK', 32))
+    IVF_MIN_TRAIN_SIZE = int(os.getenv('IVF_MIN_TRAIN_SIZE', 10000))
+    GALLERY_SOURCE = os.getenv('GALLERY_SOURCE', 'database')
+    GALLERY_SNAPSHOT_DIR = os.getenv('GALLERY_SNAPSHOT_DIR', os.path.join(os.getcwd(), 'gallery_snapshots'))
 
 
 class DevelopmentConfig(Config):
@@ -1,7 +1,7 @@
 from datetime import datetime
 
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import Column, DateTime, Integer
+from sqlalchemy import Column, DateTime, Integer, inspect, text
 from sqlalchemy.ext.declarative import declared_attr
 
 db = SQLAlchemy()
@@ -18,6 +18,12 @@ class BareBaseModel(db.Model):
     def __tablename__(cls) -> str:
         return cls.__name__.lower()
 
+    def to_dict(self) -> dict:
+        """
+        Return the column values of the instance.
+        """
+        return {column.name: getattr(self, column.name) for column in self.__table__.columns}
+
     def save(self):
         """
         Save the current instance to the database.
@@ -31,3 +37,31 @@ class BareBaseModel(db.Model):
         """
         db.session.delete(self)
         db.session.commit()
+
+
+def add_missing_columns(*models):
+    """
+    Add columns and indexes declared on the models but missing from tables
+    that already exist. db.create_all() only creates missing tables, so this
+    lets existing deployments pick up new nullable columns without a
+    migration tool.
+    """
+    inspector = inspect(db.engine)
+    preparer = db.engine.dialect.identifier_preparer
+    for model in models:
+        table = model.__table__
+        if not inspector.has_table(table.name):
+            continue
+        existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+        existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        with db.engine.begin() as connection:
+            for column in table.columns:
+                if column.name not in existing_columns:
+                    column_type = column.type.compile(dialect=db.engine.dialect)
+                    connection.execute(text(
+                        f'ALTER TABLE {preparer.quote(table.name)} '
+                        f'ADD COLUMN {preparer.quote(column.name)} {column_type}'
+                    ))
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(connection)
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from app.face_recognition.ann import IVFIndex
+
+
+@pytest.mark.parametrize('options', [{'rerank': 0}, {'nprobe': 0}, {'rerank': -1}])
+def test_rejects_empty_shortlists(options):
+    with pytest.raises(ValueError):
+        IVFIndex(**options)
+
+
+def _gallery(rng, size):
+    centers = rng.normal(0.0, 0.15, size=(20, 128))
+    encodings = centers[rng.integers(len(centers), size=size)] + rng.normal(0.0, 0.05, size=(size, 128))
+    return encodings.astype(np.float32)
+
+
+def _nearest(index, state, encodings, probe):
+    return index.search(state, probe, encodings, np.einsum('ij,ij->i', encodings, encodings))[0]
+
+
+def test_codes_are_compressed():
+    encodings = _gallery(np.random.default_rng(0), 2000)
+    state = IVFIndex(nlist=16, min_train_size=0).build(encodings)
+    assert all(cell.codes.dtype == np.int8 for cell in state.lists)
+    assert sum(len(cell.positions) for cell in state.lists) == len(encodings)
+
+
+def test_extend_only_copies_the_cells_it_adds_to():
+    rng = np.random.default_rng(1)
+    encodings = _gallery(rng, 2000)
+    index = IVFIndex(nlist=16, nprobe=16, min_train_size=0)
+    state = index.build(encodings[:1990])
+
+    extended = index.extend(state, encodings, 1990)
+    changed = [old is not new for old, new in zip(state.lists, extended.lists)]
+    assert 0 < sum(changed) <= 10
+    assert sorted(np.concatenate([cell.positions for cell in extended.lists])) == list(range(2000))
+    for position in range(1990, 2000):
+        assert _nearest(index, extended, encodings, encodings[position]) == position
+
+
+def test_keep_renumbers_the_remaining_rows():
+    rng = np.random.default_rng(2)
+    encodings = _gallery(rng, 2000)
+    index = IVFIndex(nlist=16, nprobe=16, min_train_size=0)
+    state = index.build(encodings)
+    mask = np.ones(len(encodings), dtype=bool)
+    mask[::3] = False
+
+    kept = index.keep(state, mask, encodings[mask])
+    assert sorted(np.concatenate([cell.positions for cell in kept.lists])) == list(range(int(mask.sum())))
+    assert _nearest(index, kept, encodings[mask], encodings[1]) == 0
@@ -0,0 +1,31 @@
+from types import SimpleNamespace
+
+from app.face_recognition.bookmarks import build_bookmark_payload, coalesce_bookmarks
+
+
+def _row(row_id, user, start_ms):
+    return row_id, build_bookmark_payload(user, 'server', start_ms), 0
+
+
+ALICE = SimpleNamespace(id=1, first_name='Alice', last_name='Smith, Jr.')
+BOB = SimpleNamespace(id=2, first_name='Bob', last_name='Jones')
+
+
+def test_merges_one_persons_bookmarks_within_the_window():
+    groups = coalesce_bookmarks([_row(1, ALICE, 0), _row(2, BOB, 500), _row(3, ALICE, 1500)], 2000)
+
+    assert [ids for ids, _, _ in groups] == [[1, 3], [2]]
+    alice = groups[0][1]
+    assert alice['description'] == 'Alice Smith, Jr.'
+    assert alice['durationMs'] == 2500
+
+
+def test_never_merges_unknown_faces_or_when_disabled():
+    rows = [_row(1, None, 0), _row(2, None, 100), _row(3, ALICE, 200), _row(4, ALICE, 300)]
+    assert [ids for ids, _, _ in coalesce_bookmarks(rows, 2000)] == [[1], [2], [3, 4]]
+    assert [ids for ids, _, _ in coalesce_bookmarks(rows, 0)] == [[1], [2], [3], [4]]
+
+
+def test_starts_a_new_group_after_the_window():
+    groups = coalesce_bookmarks([_row(1, ALICE, 0), _row(2, ALICE, 2500)], 2000)
+    assert [ids for ids, _, _ in groups] == [[1], [2]]
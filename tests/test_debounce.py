@@ -0,0 +1,93 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from app.face_recognition.debounce import RecognitionDebouncer
+
+ALICE = SimpleNamespace(id=1)
+BOB = SimpleNamespace(id=2)
+SMALL = (0, 10, 10, 0)
+LARGE = (0, 50, 50, 0)
+
+
+@pytest.fixture
+def debouncer(monkeypatch):
+    debouncer = RecognitionDebouncer(app=None, window_seconds=30, max_window_seconds=300, max_windows=10)
+    debouncer.closed = []
+    # Collect closed windows instead of saving and logging them.
+    monkeypatch.setattr(debouncer, '_emit', debouncer.closed.extend)
+    return debouncer
+
+
+def _closed(debouncer):
+    return sorted((window.camera_id, window.user_id, window.hits) for window in debouncer.closed)
+
+
+def test_window_is_per_camera_and_person(debouncer):
+    assert debouncer.observe(1, [(SMALL, ALICE, None)], b'a', now=0) == [ALICE]
+    assert debouncer.observe(1, [(SMALL, ALICE, None), (SMALL, BOB, None)], b'b', now=10) == [BOB]
+    assert debouncer.observe(2, [(SMALL, ALICE, None)], b'c', now=10) == [ALICE]
+    assert debouncer.stats()['open_windows'] == 3
+
+    assert debouncer.close_due(now=39) == 0
+    assert debouncer.close_due(now=40) == 3
+    assert _closed(debouncer) == [(1, 1, 2), (1, 2, 1), (2, 1, 1)]
+
+
+def test_window_expires_after_the_person_was_last_seen(debouncer):
+    debouncer.observe(1, [(SMALL, ALICE, None)], b'a', now=0)
+    debouncer.observe(1, [(SMALL, ALICE, None)], b'a', now=25)
+
+    assert debouncer.close_due(now=50) == 0
+    assert debouncer.close_due(now=55) == 1
+    window = debouncer.closed[0]
+    assert (window.first_seen, window.last_seen, window.hits) == (0, 25, 2)
+    # The next sighting opens a new window and is announced again.
+    assert debouncer.observe(1, [(SMALL, ALICE, None)], b'a', now=60) == [ALICE]
+
+
+def test_window_closes_after_its_maximum_length(debouncer):
+    for now in range(0, 301, 20):
+        debouncer.observe(1, [(SMALL, ALICE, None)], b'a', now=now)
+
+    assert debouncer.close_due(now=300) == 1
+    assert debouncer.closed[0].hits == 16
+
+
+def test_window_keeps_the_snapshot_of_the_largest_face(debouncer):
+    calls = []
+
+    def snapshot(image):
+        return lambda: calls.append(image) or image
+
+    debouncer.observe(1, [(SMALL, ALICE, None)], snapshot(b'small'), now=0)
+    debouncer.observe(1, [(LARGE, ALICE, None)], snapshot(b'large'), now=1)
+    debouncer.observe(1, [(SMALL, ALICE, None)], snapshot(b'later'), now=2)
+    debouncer.close_due(now=100)
+
+    assert debouncer.closed[0].snapshot == b'large'
+    assert calls == [b'small', b'large']
+
+
+def test_unknown_faces_share_a_window_when_their_encodings_are_close(debouncer):
+    face = np.zeros(128)
+    other = np.full(128, 0.1)
+    debouncer.observe(1, [(SMALL, None, face)], b'a', now=0)
+    debouncer.observe(1, [(SMALL, None, face + 0.01)], b'a', now=1)
+    debouncer.observe(1, [(SMALL, None, other)], b'a', now=2)
+    debouncer.observe(2, [(SMALL, None, face)], b'a', now=3)
+    debouncer.close_due(now=100)
+
+    assert _closed(debouncer) == [(1, None, 1), (1, None, 2), (2, None, 1)]
+
+
+def test_least_recently_seen_window_is_closed_beyond_max_windows(debouncer):
+    debouncer.max_windows = 2
+    debouncer.observe(1, [(SMALL, ALICE, None)], b'a', now=0)
+    debouncer.observe(2, [(SMALL, ALICE, None)], b'a', now=1)
+    debouncer.observe(1, [(SMALL, ALICE, None)], b'a', now=2)
+    debouncer.observe(3, [(SMALL, ALICE, None)], b'a', now=3)
+
+    assert _closed(debouncer) == [(2, 1, 1)]
+    assert debouncer.stats()['open_windows'] == 2
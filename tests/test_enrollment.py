@@ -0,0 +1,54 @@
+import io
+
+import numpy as np
+import pytest
+from flask import Flask
+from PIL import Image
+
+from app.camera.models import Camera  # noqa: F401  (referenced by RecognitionLog)
+from app.face_recognition.gallery import ENCODING_DIMENSION
+from app.user.enrollment import CREATED, EXISTS, BulkEnrollment
+from app.user.models import User
+from model_base import db
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'enroll.db'}"
+    app.config['UPLOAD_FOLDER'] = str(tmp_path / 'portraits')
+    (tmp_path / 'portraits').mkdir()
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+class Portraits:
+    def read(self, name):
+        image = io.BytesIO()
+        Image.new('RGB', (64, 64), (len(name) * 10, 0, 0)).save(image, 'PNG')
+        return image.getvalue()
+
+
+def _row(email):
+    return {'first_name': 'A', 'last_name': 'B', 'email': email, 'portrait': f'{email}.png'}
+
+
+def test_portrait_of_a_concurrent_duplicate_is_not_written(app, tmp_path):
+    enrollment = BulkEnrollment.from_config(Portraits(), app.config, processes=1)
+
+    def encode_while_another_import_enrolls(images):
+        # Enrolled after the batch checked for existing emails.
+        db.session.add(User(first_name='C', last_name='D', email='taken@example.com'))
+        db.session.commit()
+        return [(np.full(ENCODING_DIMENSION, 0.1), None) for _ in images]
+
+    enrollment._encode = encode_while_another_import_enrolls
+    results = enrollment.run([_row('new@example.com'), _row('taken@example.com')])
+
+    assert [result['status'] for result in results] == [CREATED, EXISTS]
+    assert sorted(path.name for path in (tmp_path / 'portraits').iterdir()) == [
+        'newexample.com_newexample.com.png',
+    ]
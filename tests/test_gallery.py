@@ -0,0 +1,69 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+from flask import Flask
+from sqlalchemy import insert
+
+from app.camera.models import Camera  # noqa: F401  (referenced by RecognitionLog)
+from app.face_recognition.encoding_format import encode_vector
+from app.face_recognition.gallery import ENCODING_DIMENSION, FaceGallery
+from app.face_recognition.models import FaceEncoding, GalleryState
+from app.user.models import User
+from model_base import db
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'gallery.db'}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+def _add_encoding_from_another_process(user_id: int):
+    """
+    Insert a user and an encoding and bump the generation on a separate
+    connection, as another worker process would.
+    """
+    now = datetime.utcnow()
+    data, scale = encode_vector(np.full(ENCODING_DIMENSION, 0.1), 'float32')
+    with db.engine.begin() as connection:
+        connection.execute(insert(User), [{
+            'id': user_id, 'first_name': 'A', 'last_name': 'B', 'email': f'{user_id}@example.com',
+            'created_at': now, 'updated_at': now,
+        }])
+        connection.execute(insert(FaceEncoding), [{
+            'user_id': user_id, 'encoding': data, 'encoding_format': 'float32', 'encoding_scale': scale,
+            'created_at': now, 'updated_at': now,
+        }])
+        GalleryState.bump_generation(connection)
+
+
+def test_sync_empty_gallery_pulls_rows_from_other_processes(app):
+    gallery = FaceGallery()
+    gallery.load()
+    assert len(gallery) == 0
+    assert gallery.watermark is None
+
+    _add_encoding_from_another_process(user_id=1)
+    gallery.sync()
+
+    assert len(gallery) == 1
+    assert gallery.generation == GalleryState.get_generation()
+    assert gallery.watermark is not None
+
+
+def test_sync_empty_gallery_without_changes(app):
+    gallery = FaceGallery()
+    gallery.load()
+    with db.engine.begin() as connection:
+        GalleryState.bump_generation(connection)
+
+    gallery.sync()
+
+    assert len(gallery) == 0
+    assert gallery.generation == GalleryState.get_generation()
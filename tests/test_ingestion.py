@@ -0,0 +1,50 @@
+import pytest
+from flask import Flask
+from pydantic import ValidationError
+
+from app.camera import ingestion
+from app.camera.ingestion import IngestionManager, acquire_autostart_lock
+from app.camera.models import Camera
+from app.camera.schemas import CameraSchema, CameraUpdateSchema
+
+
+@pytest.mark.parametrize('url', ['/etc/passwd', 'file:///dev/video0', 'ftp://camera/stream'])
+def test_start_refuses_a_url_that_is_not_a_network_stream(url):
+    manager = IngestionManager(Flask(__name__))
+    with pytest.raises(ValueError):
+        manager.start(Camera(id=1, stream_url='rtsp://camera/stream'), url=url)
+    assert manager.status() == []
+
+
+@pytest.mark.parametrize('url', ['/etc/passwd', '/dev/video0'])
+def test_start_refuses_a_stored_url_that_is_not_a_network_stream(url):
+    manager = IngestionManager(Flask(__name__))
+    with pytest.raises(ValueError):
+        manager.start(Camera(id=1, stream_url=url))
+
+
+@pytest.mark.parametrize('schema', [CameraUpdateSchema, CameraSchema])
+def test_schemas_refuse_a_stream_url_that_is_not_a_network_stream(schema):
+    camera = {'id': 1, 'name': 'c', 'ip_address': '10.0.0.1', 'location': None}
+    assert schema(**camera, stream_url='rtsp://10.0.0.1/stream').stream_url == 'rtsp://10.0.0.1/stream'
+    with pytest.raises(ValidationError):
+        schema(**camera, stream_url='/etc/passwd')
+
+
+def test_local_files_are_only_accepted_when_allowed(tmp_path):
+    video = tmp_path / 'video.avi'
+    video.write_bytes(b'')
+    assert ingestion.validate_stream_url(str(video)) is not None
+    assert ingestion.validate_stream_url(str(video), allow_files=True) is None
+    assert ingestion.validate_stream_url(str(tmp_path / 'missing.avi'), allow_files=True) is not None
+
+
+@pytest.mark.skipif(ingestion.fcntl is None, reason='no file locks')
+def test_only_one_process_takes_the_autostart_lock(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingestion, '_autostart_lock_file', None)
+    path = str(tmp_path / 'ingest.lock')
+    assert acquire_autostart_lock(path)
+    held = ingestion._autostart_lock_file
+    # A second open of the file stands for another worker process.
+    assert not acquire_autostart_lock(path)
+    held.close()
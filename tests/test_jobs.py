@@ -0,0 +1,30 @@
+import pytest
+
+from app.face_recognition.jobs import validate_callback_url
+
+
+@pytest.mark.parametrize('url', [
+    'http://127.0.0.1:5000/hook',
+    'http://localhost/hook',
+    'http://10.0.0.5/hook',
+    'http://192.168.1.10/hook',
+    'http://169.254.169.254/latest/meta-data',
+    'http://[::1]/hook',
+    'http://0.0.0.0/hook',
+    'file:///etc/passwd',
+    'ftp://8.8.8.8/hook',
+    'http:///hook',
+])
+def test_refuses_non_public_callbacks(url):
+    assert validate_callback_url(url) is not None
+
+
+def test_accepts_public_address():
+    assert validate_callback_url('https://8.8.8.8/hook') is None
+
+
+def test_allowlist_overrides_address_checks():
+    allowed = ['hooks.internal']
+    assert validate_callback_url('https://HOOKS.internal/job', allowed) is None
+    assert validate_callback_url('https://8.8.8.8/hook', allowed) is not None
+    assert validate_callback_url('ftp://hooks.internal/job', allowed) is not None
@@ -0,0 +1,71 @@
+from datetime import datetime
+
+import pytest
+from flask import Flask
+
+from app.camera.models import Camera  # noqa: F401  (referenced by RecognitionLog)
+from app.face_recognition.log_writer import BUFFERED, RecognitionLogWriter
+from app.face_recognition.models import RecognitionLog
+from app.instrumentation import add_stage_listener, remove_stage_listener
+from app.metrics import _observe_stage, db_commit_seconds
+from model_base import db
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'log.db'}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+def _row(row_id):
+    return {'id': row_id, 'user_id': None, 'snapshot_filename': f'{row_id}.jpg', 'camera_id': None,
+            'timestamp': datetime.utcnow()}
+
+
+def test_flush_drops_only_the_rows_the_database_rejects(app):
+    writer = RecognitionLogWriter(app, mode=BUFFERED)
+    # The second row with id 1 violates the primary key and fails the batch.
+    writer._buffer.extend([_row(1), _row(2), _row(1), _row(3)])
+
+    assert writer.flush() == 3
+    assert sorted(log.id for log in RecognitionLog.query.all()) == [1, 2, 3]
+    assert writer.stats()['rejected'] == 1
+    assert writer.stats()['buffered'] == 0
+
+
+def test_flush_keeps_rows_on_operational_error(app):
+    writer = RecognitionLogWriter(app, mode=BUFFERED)
+    writer._buffer.extend([_row(1), _row(2)])
+    RecognitionLog.__table__.drop(db.engine)
+
+    assert writer.flush() == 0
+    assert writer.stats()['buffered'] == 2
+    assert writer.stats()['rejected'] == 0
+
+    RecognitionLog.__table__.create(db.engine)
+    assert writer.flush() == 2
+
+
+def _commits_observed():
+    return sum(sum(series[:-1]) for series in db_commit_seconds._series.values())
+
+
+@pytest.fixture
+def stage_metrics():
+    add_stage_listener(_observe_stage)
+    yield
+    remove_stage_listener(_observe_stage)
+
+
+def test_flush_is_timed_as_a_commit(app, stage_metrics):
+    writer = RecognitionLogWriter(app, mode=BUFFERED)
+    writer._buffer.extend([_row(1), _row(2)])
+    observed = _commits_observed()
+
+    writer.flush()
+    assert _commits_observed() == observed + 1
@@ -0,0 +1,54 @@
+import logging
+
+import pytest
+
+from app import logging_setup
+from app.logging_setup import configure_logging
+
+
+def _stop_logging():
+    """
+    Write out the queued records and remove the handlers configure_logging added.
+    """
+    if logging_setup._listener is not None:
+        logging.getLogger().removeHandler(logging_setup._queue_handler)
+        logging_setup._listener.stop()
+        for handler in logging_setup._listener.handlers:
+            handler.close()
+        logging_setup._listener = logging_setup._queue_handler = None
+
+
+@pytest.fixture
+def restore_logging():
+    levels = {name: logging.getLogger(name).level for name in ('', 'app.camera', 'app.user')}
+    yield
+    _stop_logging()
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level)
+
+
+def _log_text(tmp_path):
+    _stop_logging()
+    return next(tmp_path.iterdir()).read_text()
+
+
+def test_invalid_settings_fall_back_and_are_logged(tmp_path, restore_logging):
+    configure_logging({
+        'LOG_DIR': str(tmp_path), 'LOG_FORMAT': 'yaml', 'LOG_LEVEL': 'LOUD',
+        'LOG_LEVELS': 'app.camera=QUIET,sqlalchemy',
+    })
+
+    assert logging.getLogger().level == logging.INFO
+    assert logging.getLogger('app.camera').level == logging.NOTSET
+    text = _log_text(tmp_path)
+    assert "ERROR app.logging_setup: Invalid logging setting: Unknown log format 'yaml'" in text
+    assert "Unknown log level 'LOUD'" in text
+    assert "ignoring LOG_LEVELS" in text
+
+
+def test_invalid_level_of_one_logger_keeps_the_others(tmp_path, restore_logging):
+    configure_logging({'LOG_DIR': str(tmp_path), 'LOG_LEVELS': 'app.camera=QUIET,app.user=DEBUG'})
+
+    assert logging.getLogger('app.user').level == logging.DEBUG
+    assert logging.getLogger('app.camera').level == logging.NOTSET
+    assert "Unknown log level 'QUIET' for app.camera" in _log_text(tmp_path)
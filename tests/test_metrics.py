@@ -0,0 +1,22 @@
+from app.instrumentation import NX_SEND
+from app.metrics import _observe_stage, nx_bookmark_send_seconds, stage_seconds
+
+
+def _count(histogram, label_values=()):
+    return sum(histogram._series.get(label_values, [0, 0])[:-1])
+
+
+def test_nx_send_has_its_own_histogram():
+    sent = _count(nx_bookmark_send_seconds)
+    _observe_stage(NX_SEND, 0.02, None)
+
+    assert _count(nx_bookmark_send_seconds) == sent + 1
+    assert not any(label_values[0] == NX_SEND for label_values in stage_seconds._series)
+
+
+def test_only_pipeline_stages_reach_the_stage_histogram():
+    _observe_stage('match', 0.001, 3)
+    _observe_stage('something_else', 0.001, 3)
+
+    assert _count(stage_seconds, ('match', '3')) >= 1
+    assert ('something_else', '3') not in stage_seconds._series
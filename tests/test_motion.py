@@ -0,0 +1,30 @@
+import numpy as np
+
+from app.camera.motion import MotionGate, MotionSettings
+from app.face_recognition.services import FaceRecognitionHandler
+
+
+def _frame(value):
+    return np.full((240, 320, 3), value, np.uint8)
+
+
+def test_unchanged_frame_is_skipped():
+    gate = MotionGate(MotionSettings(enabled=True))
+    assert gate.check(_frame(0)) is None
+    assert gate.check(_frame(0)) == MotionGate.SKIP
+    assert gate.check(_frame(200)) is None
+
+
+def test_skipped_frame_without_tracker_repeats_the_last_response():
+    handler = FaceRecognitionHandler()
+    gate = MotionGate(MotionSettings(enabled=True))
+    gate.check(_frame(0))
+
+    assert handler.handle_frame_recognition(_frame(0), motion_gate=gate) == (None, 204)
+
+    gate.last_response = {'message': 'Face recognized', 'user': None, 'faces': [{'name': 'A'}]}
+    response, status_code = handler.handle_frame_recognition(_frame(0), motion_gate=gate)
+    assert status_code == 200
+    assert response['faces'] == [{'name': 'A'}]
+    assert response['motion'] is False
+    assert 'motion' not in gate.last_response
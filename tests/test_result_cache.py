@@ -0,0 +1,96 @@
+import cv2
+import numpy as np
+import pytest
+
+from app.face_recognition import result_cache
+from app.face_recognition.detection import DetectionSettings
+from app.face_recognition.result_cache import ResultCache, dhash
+
+SETTINGS = DetectionSettings()
+TOKEN = (1, 1)
+FACES = [((0, 10, 10, 0), np.zeros(128))]
+
+
+def _jpeg(seed, quality=90):
+    rng = np.random.default_rng(seed)
+    # A smooth gradient with blobs, so re-encodings keep the same structure.
+    y, x = np.mgrid[0:240, 0:320]
+    frame = np.dstack([(x + 60 * seed) % 256, y % 256, (x * y // 300) % 256]).astype(np.uint8)
+    for _ in range(5):
+        cv2.circle(frame, tuple(int(v) for v in rng.integers(0, 240, 2)), 30, (255, 255, 255), -1)
+    return cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(result_cache.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_exact_hit_near_duplicate_hit_and_miss():
+    cache = ResultCache(perceptual=True)
+    frame = _jpeg(0)
+    cache.put(frame, SETTINGS, TOKEN, FACES, [7])
+
+    assert cache.get(frame, SETTINGS, TOKEN) == (FACES, [7])
+    assert cache.get(_jpeg(0, quality=60), SETTINGS, TOKEN) == (FACES, [7])
+    assert cache.get(_jpeg(1), SETTINGS, TOKEN) is None
+    stats = cache.stats()
+    assert (stats['hits'], stats['perceptual_hits'], stats['misses']) == (1, 1, 1)
+
+
+def test_near_duplicate_misses_without_perceptual_matching():
+    cache = ResultCache()
+    cache.put(_jpeg(0), SETTINGS, TOKEN, FACES, [7])
+
+    assert cache.get(_jpeg(0, quality=60), SETTINGS, TOKEN) is None
+
+
+def test_re_encoded_frame_is_within_a_few_bits():
+    assert bin(dhash(_jpeg(0)) ^ dhash(_jpeg(0, quality=60))).count('1') <= 4
+    assert bin(dhash(_jpeg(0)) ^ dhash(_jpeg(1))).count('1') > 4
+    assert dhash(b'not an image') is None
+
+
+def test_other_detection_settings_miss():
+    cache = ResultCache(perceptual=True)
+    frame = _jpeg(0)
+    cache.put(frame, SETTINGS, TOKEN, FACES, [7])
+
+    assert cache.get(frame, SETTINGS._replace(upsample=2), TOKEN) is None
+
+
+def test_gallery_change_drops_every_entry():
+    cache = ResultCache()
+    frame = _jpeg(0)
+    cache.put(frame, SETTINGS, TOKEN, FACES, [7])
+
+    assert cache.get(frame, SETTINGS, (1, 2)) is None
+    assert cache.stats()['invalidations'] == 1
+    assert cache.stats()['entries'] == 0
+
+
+def test_entries_expire(clock):
+    cache = ResultCache(ttl=30, perceptual=True)
+    frame = _jpeg(0)
+    cache.put(frame, SETTINGS, TOKEN, FACES, [7])
+
+    clock[0] += 29
+    assert cache.get(frame, SETTINGS, TOKEN) is not None
+    clock[0] += 1
+    assert cache.get(frame, SETTINGS, TOKEN) is None
+    assert cache.get(_jpeg(0, quality=60), SETTINGS, TOKEN) is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResultCache(max_entries=2)
+    frames = [_jpeg(seed) for seed in range(3)]
+    cache.put(frames[0], SETTINGS, TOKEN, FACES, [0])
+    cache.put(frames[1], SETTINGS, TOKEN, FACES, [1])
+    cache.get(frames[0], SETTINGS, TOKEN)
+    cache.put(frames[2], SETTINGS, TOKEN, FACES, [2])
+
+    assert cache.get(frames[1], SETTINGS, TOKEN) is None
+    assert cache.get(frames[0], SETTINGS, TOKEN) == (FACES, [0])
+    assert cache.stats()['evictions'] == 1
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+from flask import Flask
+
+from app.camera.models import Camera  # noqa: F401  (referenced by RecognitionLog)
+from app.face_recognition import services
+from app.face_recognition.gallery import ENCODING_DIMENSION, FaceGallery
+from app.face_recognition.services import FaceRecognitionHandler
+from app.instrumentation import add_stage_listener, remove_stage_listener
+from app.user.models import User
+from model_base import db
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'services.db'}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        user = User(first_name='A', last_name='B', email='a@example.com')
+        db.session.add(user)
+        db.session.commit()
+        gallery = FaceGallery()
+        gallery.build([(1, user.id, np.full(ENCODING_DIMENSION, 0.1).tobytes(), None, 'float64', None)])
+        monkeypatch.setattr(services, 'get_gallery', lambda config: gallery)
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def timed_stages():
+    stages = []
+
+    def listener(name, seconds, camera_id):
+        stages.append(name)
+
+    add_stage_listener(listener)
+    yield stages
+    remove_stage_listener(listener)
+
+
+def test_user_lookup_is_not_timed_as_the_gallery_match(app, timed_stages):
+    users = FaceRecognitionHandler._recognize_faces([np.full(ENCODING_DIMENSION, 0.1)])
+
+    assert users[0].email == 'a@example.com'
+    assert timed_stages == ['match', 'lookup']
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+from flask import Flask
+
+from app.camera.models import Camera  # noqa: F401  (referenced by RecognitionLog)
+from app.face_recognition.gallery import ENCODING_DIMENSION
+from app.face_recognition.models import FaceEncoding
+from app.face_recognition.templates import compact_user, select_templates
+from app.user.models import User
+from model_base import db
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'templates.db'}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+def _samples(rng, count, outliers=()):
+    base = rng.normal(0.0, 0.1, ENCODING_DIMENSION)
+    samples = base + rng.normal(0.0, 0.005, (count, ENCODING_DIMENSION))
+    for index, offset in outliers:
+        samples[index] = base + offset
+    return samples
+
+
+def _enroll(samples) -> int:
+    user = User(first_name='A', last_name='B', email='a@example.com')
+    db.session.add(user)
+    db.session.commit()
+    for sample in samples:
+        row = FaceEncoding(user_id=user.id, active=True)
+        row.set_face_encoding(sample, 'float64')
+        db.session.add(row)
+    db.session.commit()
+    return user.id
+
+
+def _rows(user_id):
+    rows = FaceEncoding.get_user_encodings(user_id)
+    return [row for row in rows if not row.template], [row for row in rows if row.template]
+
+
+def test_select_templates_keeps_only_the_outliers():
+    rng = np.random.default_rng(0)
+    samples = _samples(rng, 8, outliers=[(2, 0.05), (5, -0.05), (6, 0.06)])
+
+    centroid, kept = select_templates(samples, max_templates=3, outlier_distance=0.35)
+    np.testing.assert_allclose(centroid, samples.mean(axis=0))
+    assert len(kept) == 2 and set(kept) <= {2, 5, 6}
+
+    assert select_templates(_samples(rng, 8), max_templates=3, outlier_distance=0.35)[1] == []
+
+
+def test_compaction_keeps_the_centroid_and_the_outliers_active(app):
+    samples = _samples(np.random.default_rng(1), 6, outliers=[(4, 0.05)])
+    user_id = _enroll(samples)
+
+    assert compact_user(user_id, max_templates=3, encoding_format='float64') == 2
+    rows, templates = _rows(user_id)
+    assert [row.active for row in rows] == [False, False, False, False, True, False]
+    assert len(templates) == 1 and templates[0].active
+    np.testing.assert_allclose(templates[0].get_face_encoding(dtype=np.float64), samples.mean(axis=0))
+
+
+def test_compacting_again_replaces_the_template(app):
+    samples = _samples(np.random.default_rng(2), 6, outliers=[(4, 0.05)])
+    user_id = _enroll(samples)
+    compact_user(user_id, max_templates=3, encoding_format='float64')
+
+    assert compact_user(user_id, max_templates=3, encoding_format='float64') == 2
+    rows, templates = _rows(user_id)
+    assert len(rows) == 6 and len(templates) == 1
+    np.testing.assert_allclose(templates[0].get_face_encoding(dtype=np.float64), samples.mean(axis=0))
+
+
+def test_few_samples_are_all_kept_active(app):
+    user_id = _enroll(_samples(np.random.default_rng(3), 6))
+    compact_user(user_id, max_templates=3)
+
+    assert compact_user(user_id, max_templates=10) == 6
+    rows, templates = _rows(user_id)
+    assert all(row.active for row in rows)
+    assert templates == []
@@ -0,0 +1,50 @@
+import io
+import tarfile
+import zipfile
+
+import pytest
+
+from app.utils import ArchiveTooLarge, read_image_archive
+
+
+def _zip(members):
+    stream = io.BytesIO()
+    with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members:
+            archive.writestr(name, data)
+    return stream.getvalue()
+
+
+def _tar(members):
+    stream = io.BytesIO()
+    with tarfile.open(fileobj=stream, mode='w:gz') as archive:
+        for name, data in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return stream.getvalue()
+
+
+@pytest.mark.parametrize('build', [_zip, _tar])
+def test_reads_images_within_limits(build):
+    images = read_image_archive(build([('a.jpg', b'a'), ('notes.txt', b'x'), ('b.png', b'bb')]),
+                                max_images=2, max_image_bytes=10)
+    assert images == [('a.jpg', b'a'), ('b.png', b'bb')]
+
+
+@pytest.mark.parametrize('build', [_zip, _tar])
+def test_rejects_too_many_images(build):
+    with pytest.raises(ArchiveTooLarge):
+        read_image_archive(build([(f'{index}.jpg', b'a') for index in range(3)]), max_images=2)
+
+
+@pytest.mark.parametrize('build', [_zip, _tar])
+def test_rejects_oversized_image_before_reading(build):
+    # Highly compressible, as in an archive bomb.
+    with pytest.raises(ArchiveTooLarge):
+        read_image_archive(build([('bomb.jpg', bytes(1024 * 1024))]), max_image_bytes=1024)
+
+
+def test_rejects_non_archives():
+    with pytest.raises(ValueError):
+        read_image_archive(b'not an archive')